@@ -0,0 +1,89 @@
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+
+class _UserAgenda:
+    """Éléments datés d'une liste (agenda ou examens), triés par date."""
+
+    __slots__ = ("dates", "items", "undated")
+
+    def __init__(self):
+        self.dates = []    # dates ISO triées (clés de recherche)
+        self.items = []    # (date ISO, description), dans le même ordre que `dates`
+        self.undated = []  # saisies sans date valide, dans l'ordre d'ajout
+
+    def add(self, date, description):
+        if date is None:
+            self.undated.append(description)
+            return
+        # Après les éléments de même date : l'ordre d'ajout est conservé
+        i = bisect_right(self.dates, date)
+        self.dates.insert(i, date)
+        self.items.insert(i, (date, description))
+
+
+class AgendaIndex:
+    """
+    Index par date de l'agenda et des examens de chaque utilisateur.
+
+    ✔ Les saisies "DD-MM-YYYY : description" restent stockées telles quelles ;
+      l'index est reconstruit en mémoire à la première consultation d'un utilisateur
+    ✔ Éléments à venir trouvés par bisect : O(log n + k) pour k éléments affichés
+    ✔ Un ajout est inséré à sa place (pas de retri)
+    ✔ Au plus `max_users` utilisateurs indexés en mémoire : le moins récemment
+      consulté est oublié (reconstruit à sa prochaine consultation)
+    """
+
+    KINDS = ("agenda", "exams")
+
+    def __init__(self, parse, max_users=1024):
+        """
+        - parse : fonction texte -> (date ISO ou None, description)
+        - max_users : nombre maximal d'utilisateurs indexés en mémoire
+        """
+        self.parse = parse
+        self.max_users = max_users
+        # uid -> {kind: _UserAgenda}, du moins au plus récemment consulté
+        self._users = OrderedDict()
+
+    def has(self, uid):
+        return uid in self._users
+
+    def build(self, uid, user):
+        """(Re)construit l'index de `uid` depuis ses données (structure de get_user)."""
+        lists = {}
+        for kind in self.KINDS:
+            parsed = [self.parse(text) for text in user.get(kind, [])]
+            agenda = _UserAgenda()
+            dated = sorted((p for p in parsed if p[0] is not None), key=lambda p: p[0])
+            agenda.items = dated
+            agenda.dates = [date for date, _ in dated]
+            agenda.undated = [desc for date, desc in parsed if date is None]
+            lists[kind] = agenda
+        self._users[uid] = lists
+        self._users.move_to_end(uid)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def add(self, uid, kind, text):
+        """Ajoute une saisie à l'index de `uid` s'il est déjà construit."""
+        lists = self._users.get(uid)
+        if lists is not None:
+            lists[kind].add(*self.parse(text))
+
+    def drop(self, uid):
+        self._users.pop(uid, None)
+
+    def upcoming(self, uid, kind, start, limit=None):
+        """
+        Éléments datés à partir de `start` (date ISO incluse), du plus proche au plus lointain.
+        Retourne (liste de (date, description), nombre total d'éléments à venir).
+        """
+        self._users.move_to_end(uid)
+        agenda = self._users[uid][kind]
+        i = bisect_left(agenda.dates, start)
+        end = len(agenda.items) if limit is None else min(len(agenda.items), i + limit)
+        return agenda.items[i:end], len(agenda.items) - i
+
+    def undated(self, uid, kind):
+        return list(self._users[uid][kind].undated)
@@ -1,50 +1,172 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from telegram import Update
 from telegram.ext import (
-    ApplicationBuilder, CommandHandler, ConversationHandler,
-    MessageHandler, filters
+    ApplicationBuilder, CallbackQueryHandler, CommandHandler, ConversationHandler,
+    MessageHandler, TypeHandler, filters
 )
 
 from userdata import UserDataManager
+from userdata_log import LogUserDataManager
+from userdata_sqlite import SQLiteUserDataManager
+from userdata_lazy import LazyUserDataManager
+from userdata_writebehind import WriteBehindUserDataManager
 from oura_client import OuraClient
 from cohere_client import CohereClient
+from oura_store import OuraStoreRegistry
+from oura_prefetch import OuraPrefetcher
+from reminders import ReminderScheduler
 from bot_handlers import BotHandlers, AGENDA, EXAM, RESSENTI
+from update_processor import PerUserUpdateProcessor
+from metrics import PROFILER, start_metrics_server, timed_handler
 
-def main():
-    load_dotenv()
-
-    dm = UserDataManager()
-    oura = OuraClient()
-    coh = CohereClient()
-    handlers = BotHandlers(dm, oura, coh)
+def build_data_manager(data_dir=".", key_file="secret.key"):
+    """
+    Choisit le mode de stockage selon USERDATA_BACKEND :
+    - "file" (défaut) : fichier chiffré unique réécrit à chaque modification
+    - "log" : journal chiffré append-only avec compactage en arrière-plan
+    - "sqlite" : base SQLite, une ligne chiffrée par entrée (migre userdata.enc)
+    - "lazy" : un fichier chiffré par utilisateur, déchiffré à la demande (LRU borné)
+    - "writebehind" : fichier chiffré unique, écrit par lots en arrière-plan
 
-    app = ApplicationBuilder().token(os.getenv("TELEGRAM_TOKEN")).build()
+    Les fichiers de données sont placés dans `data_dir` (un répertoire par worker,
+    voir cluster.py) ; la clé `key_file` est commune à tous.
+    """
+    backend = os.getenv("USERDATA_BACKEND", "file")
+    filepath = os.path.join(data_dir, "userdata.enc")
+    if backend == "log":
+        return LogUserDataManager(filepath, key_file)
+    if backend == "sqlite":
+        return SQLiteUserDataManager(os.path.join(data_dir, "userdata.db"), key_file, filepath)
+    if backend == "lazy":
+        max_mb = float(os.getenv("USERDATA_CACHE_MB", 8))
+        return LazyUserDataManager(
+            filepath, key_file, os.path.join(data_dir, "userdata.d"), max_bytes=int(max_mb * 1024 * 1024)
+        )
+    if backend == "writebehind":
+        return WriteBehindUserDataManager(
+            filepath, key_file,
+            flush_interval=float(os.getenv("USERDATA_FLUSH_INTERVAL", 2.0)),
+            max_pending=int(os.getenv("USERDATA_FLUSH_MAX", 200)),
+        )
+    if backend == "file":
+        return UserDataManager(filepath, key_file)
+    raise ValueError(f"USERDATA_BACKEND inconnu : {backend}")
 
+def add_handlers(app, handlers):
+    """
+    Enregistre les commandes et conversations du bot sur `app`
+    (partagé par le bot et par le banc de mesure benchmark.py).
+    Chaque handler est chronométré (stresssentry_handler_seconds sur /metrics).
+    """
     # Commandes simples
-    app.add_handler(CommandHandler("start", handlers.start))
-    app.add_handler(CommandHandler("journal", handlers.journal))
-    app.add_handler(CommandHandler("oura_ring_4j", handlers.oura_ring_4j))
-    app.add_handler(CommandHandler("recherche", handlers.recherche))
-    app.add_handler(CommandHandler("organisation", handlers.organisation))
-    app.add_handler(CommandHandler("delete", handlers.delete))
+    app.add_handler(CommandHandler("start", timed_handler("start", handlers.start)))
+    app.add_handler(CommandHandler("journal", timed_handler("journal", handlers.journal)))
+    app.add_handler(CommandHandler("oura_token", timed_handler("oura_token", handlers.oura_token)))
+    app.add_handler(CommandHandler("oura_ring_4j", timed_handler("oura_ring_4j", handlers.oura_ring_4j)))
+    app.add_handler(CommandHandler("tendances", timed_handler("tendances", handlers.tendances)))
+    app.add_handler(CommandHandler("recherche", timed_handler("recherche", handlers.recherche)))
+    app.add_handler(CommandHandler("organisation", timed_handler("organisation", handlers.organisation)))
+    app.add_handler(CommandHandler("delete", timed_handler("delete", handlers.delete)))
+    app.add_handler(CommandHandler("cache_reco", timed_handler("cache_reco", handlers.cache_reco)))
+    # Navigation entre les pages de /journal et /recherche
+    app.add_handler(CallbackQueryHandler(timed_handler("page", handlers.page), pattern=r"^pg:(journal|recherche):\d+$"))
 
     # Conversations
     app.add_handler(ConversationHandler(
-        entry_points=[CommandHandler("agenda", handlers.agenda_start)],
-        states={AGENDA: [MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.agenda_save)]},
+        entry_points=[CommandHandler("agenda", timed_handler("agenda", handlers.agenda_start))],
+        states={AGENDA: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed_handler("agenda_save", handlers.agenda_save))]},
         fallbacks=[]
     ))
     app.add_handler(ConversationHandler(
-        entry_points=[CommandHandler("exam", handlers.exam_start)],
-        states={EXAM: [MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.exam_save)]},
+        entry_points=[CommandHandler("exam", timed_handler("exam", handlers.exam_start))],
+        states={EXAM: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed_handler("exam_save", handlers.exam_save))]},
         fallbacks=[]
     ))
     app.add_handler(ConversationHandler(
-        entry_points=[CommandHandler("ressenti", handlers.ressenti_start)],
-        states={RESSENTI: [MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.ressenti_save)]},
+        entry_points=[CommandHandler("ressenti", timed_handler("ressenti", handlers.ressenti_start))],
+        states={RESSENTI: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed_handler("ressenti_save", handlers.ressenti_save))]},
         fallbacks=[]
     ))
 
+def build_application(data_dir=".", polling=True):
+    """
+    Assemble le bot complet (stockage, clients, handlers, jobs) sur les données de `data_dir`.
+    - polling=False : pas d'Updater, les mises à jour sont déposées dans
+      `app.update_queue` par l'appelant (worker de cluster.py)
+    """
+    dm = build_data_manager(data_dir)
+    oura = OuraClient()
+    coh = CohereClient()
+    # Pool de threads dédié au travail bloquant (chiffrement, fichiers)
+    executor = ThreadPoolExecutor(
+        max_workers=int(os.getenv("BOT_IO_THREADS", 4)), thread_name_prefix="bot-io"
+    )
+    # Historique Oura local de chaque compte, chiffré avec la même clé que les données utilisateurs
+    oura_stores = OuraStoreRegistry(os.path.join(data_dir, "oura_store.d"), cipher=dm.cipher, executor=executor)
+    # Préchauffage des données Oura avant les heures habituelles des utilisateurs
+    prefetcher = OuraPrefetcher(
+        dm, oura, oura_stores, executor=executor,
+        lead_minutes=int(os.getenv("OURA_PREFETCH_LEAD", 10)),
+        spacing=float(os.getenv("OURA_PREFETCH_SPACING", 2.0)),
+        morning=os.getenv("OURA_PREFETCH_MORNING", "07:00"),
+    )
+    # Rappels d'examens et d'événements (un seul tas, un seul job JobQueue)
+    reminders = ReminderScheduler(
+        os.path.join(data_dir, "reminders.enc"), cipher=dm.cipher, executor=executor,
+        at=os.getenv("REMINDER_TIME", "08:00"),
+    )
+    handlers = BotHandlers(
+        dm, oura, coh, executor=executor, oura_stores=oura_stores, prefetcher=prefetcher,
+        reminders=reminders,
+        # Budgets de temps de /ressenti (secondes)
+        oura_budget=float(os.getenv("RESSENTI_OURA_BUDGET", 2.0)),
+        llm_budget=float(os.getenv("RESSENTI_LLM_BUDGET", 6.0)),
+    )
+
+    async def post_shutdown(application):
+        # Ferme proprement le pool de connexions HTTP partagé d'Oura
+        await oura.aclose()
+        print("Cache Oura :", oura.cache_stats())
+        print("Historiques Oura :", oura_stores.stats())
+        print("Préchauffage Oura :", prefetcher.stats())
+        print("Rappels :", reminders.stats())
+        print("Cache recommandations :", coh.cache_stats())
+        print("Stockage :", dm.stats())
+        executor.shutdown(wait=True)
+        dm.close()
+
+    builder = (
+        ApplicationBuilder()
+        .token(os.getenv("TELEGRAM_TOKEN"))
+        .post_shutdown(post_shutdown)
+        # Utilisateurs différents en parallèle, chaque utilisateur dans l'ordre
+        .concurrent_updates(PerUserUpdateProcessor(max_workers=int(os.getenv("BOT_MAX_WORKERS", 16))))
+    )
+    if not polling:
+        builder = builder.updater(None)
+    app = builder.build()
+
+    # Apprentissage des heures d'utilisation, avant tous les autres handlers
+    app.add_handler(TypeHandler(Update, prefetcher.observe), group=-1)
+    prefetcher.schedule(app.job_queue)
+    reminders.start(app.job_queue)
+
+    add_handlers(app, handlers)
+    return app
+
+def main():
+    load_dotenv()
+
+    # Métriques Prometheus et profileur sur l'interface locale (désactivés par défaut)
+    if os.getenv("METRICS_PORT"):
+        start_metrics_server(int(os.getenv("METRICS_PORT")))
+    if os.getenv("PROFILER") == "on":
+        PROFILER.start()
+
+    app = build_application()
+
     print("Bot démarré.")
     app.run_polling()
 
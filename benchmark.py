@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder
+
+from app import add_handlers, build_data_manager
+from bot_handlers import BotHandlers
+from cohere_client import CohereClient
+from fake_services import FakeCohereServer, FakeOuraServer, FakeTelegramServer, SyntheticUsers
+from oura_client import OURA_TOKEN_SETTING, OuraClient
+from oura_store import OuraStoreRegistry
+from reminders import ReminderScheduler
+from update_processor import PerUserUpdateProcessor
+from userdata import UserDataManager
+
+
+def percentile(sorted_values, p):
+    """Percentile `p` (0-100) par rang le plus proche, sur une liste triée."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class LoopStallMonitor:
+    """
+    Mesure les blocages de la boucle asyncio : une tâche se réveille toutes les
+    `interval` secondes ; tout retard au-delà de `threshold` est compté comme blocage
+    (travail synchrone qui empêche les autres utilisateurs d'avancer).
+    """
+
+    def __init__(self, interval=0.01, threshold=0.005):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls = 0
+        self.stalled_seconds = 0.0
+        self.max_stall = 0.0
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - started - self.interval
+            if lag > self.threshold:
+                self.stalls += 1
+                self.stalled_seconds += lag
+                self.max_stall = max(self.max_stall, lag)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def stats(self):
+        return {
+            "stalls": self.stalls,
+            "stalled_seconds": round(self.stalled_seconds, 4),
+            "max_stall_ms": round(self.max_stall * 1000, 2),
+        }
+
+
+# ---------------------- Charge de bout en bout ----------------------
+async def run_load(args):
+    """
+    Lance BotHandlers (mêmes handlers et même processeur de mises à jour que le bot)
+    contre des serveurs Oura / Cohere / Telegram locaux, avec `args.users` utilisateurs
+    simulés qui enchaînent chacun `args.rounds` scénarios.
+    """
+    oura_srv = await FakeOuraServer(
+        latency=args.oura_latency, jitter=args.oura_latency / 2,
+        error_rate=args.oura_errors, rate_limit_rate=args.oura_429, seed=args.seed,
+    ).start()
+    cohere_srv = await FakeCohereServer(
+        first_token_latency=args.cohere_latency, token_interval=args.cohere_token_interval,
+        error_rate=args.cohere_errors, rate_limit_rate=args.cohere_429, seed=args.seed,
+    ).start()
+    telegram_srv = await FakeTelegramServer(latency=args.telegram_latency, seed=args.seed).start()
+
+    # Données dans un répertoire temporaire (build_data_manager utilise des chemins relatifs)
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    executor = ThreadPoolExecutor(max_workers=args.io_threads, thread_name_prefix="bench-io")
+    try:
+        dm = build_data_manager()
+        users = SyntheticUsers(args.users, seed=args.seed)
+        for uid in users.uids():
+            for i in range(args.journal_size):
+                dm.add_journal_entry(str(uid), users.random.choice(users.RESSENTIS), "2026-01-01", "08:00")
+            if args.oura_tokens:
+                dm.set_setting(str(uid), OURA_TOKEN_SETTING, f"bench-{uid}")
+
+        oura = OuraClient(personal_access_token="bench", base_url=f"{oura_srv.url}/v2/usercollection")
+        coh = CohereClient(api_key="bench", base_url=cohere_srv.url)
+        handlers = BotHandlers(
+            dm, oura, coh, executor=executor,
+            oura_stores=OuraStoreRegistry(cipher=dm.cipher, executor=executor),
+            reminders=ReminderScheduler(cipher=dm.cipher, executor=executor),
+            oura_budget=args.oura_budget, llm_budget=args.llm_budget,
+        )
+        app = (
+            ApplicationBuilder()
+            .token("123456:bench")
+            .base_url(f"{telegram_srv.url}/bot")
+            .updater(None)
+            .concurrent_updates(PerUserUpdateProcessor(max_workers=args.workers))
+            .build()
+        )
+        add_handlers(app, handlers)
+        await app.initialize()
+        await app.start()
+
+        latencies = {}
+        processed = 0
+
+        async def user_loop(uid):
+            nonlocal processed
+            for _ in range(args.rounds):
+                name, texts = users.scenario()
+                started = time.perf_counter()
+                for text in texts:
+                    update = Update.de_json(users.message(uid, text), app.bot)
+                    await app.update_processor.process_update(update, app.process_update(update))
+                    processed += 1
+                latencies.setdefault(name, []).append(time.perf_counter() - started)
+                if args.think_time:
+                    await asyncio.sleep(users.random.expovariate(1 / args.think_time))
+
+        monitor = LoopStallMonitor()
+        monitor.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(user_loop(uid) for uid in users.uids()))
+        elapsed = time.perf_counter() - started
+        await monitor.stop()
+
+        # stop() attend les réponses Cohere envoyées en différé (/ressenti)
+        await app.stop()
+        await app.shutdown()
+        await oura.aclose()
+
+        report = {
+            "config": vars(args),
+            "elapsed_seconds": round(elapsed, 3),
+            "updates": processed,
+            "updates_per_second": round(processed / elapsed, 1),
+            "commands": {},
+            "event_loop": monitor.stats(),
+            "upstream": {
+                "oura": {"requests": oura_srv.requests, "errors": oura_srv.errors, "guard": oura.guard.stats()},
+                "cohere": {"requests": cohere_srv.requests, "errors": cohere_srv.errors, "guard": coh.guard.stats()},
+                "telegram": telegram_srv.calls,
+            },
+            "caches": {"oura": oura.cache_stats(), "cohere": coh.cache_stats()},
+            "userdata": dm.stats(),
+        }
+        for name, values in sorted(latencies.items()):
+            values.sort()
+            report["commands"][name] = {
+                "count": len(values),
+                **{f"p{p}_ms": round(percentile(values, p) * 1000, 1) for p in (50, 95, 99)},
+                "max_ms": round(values[-1] * 1000, 1),
+            }
+        dm.close()
+        return report
+    finally:
+        executor.shutdown(wait=True)
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+        for srv in (oura_srv, cohere_srv, telegram_srv):
+            await srv.stop()
+
+
+# ---------------------- Stockage : _save / _load ----------------------
+def run_storage(args):
+    """
+    Mesure UserDataManager._save et _load (chiffrement + JSON + fichier) pour
+    des volumes croissants d'entrées de journal, réparties sur `args.users` utilisateurs.
+    """
+    results = []
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp(prefix="bench-store-")
+        try:
+            dm = UserDataManager(os.path.join(workdir, "userdata.enc"), os.path.join(workdir, "secret.key"))
+            dm.data = {
+                str(uid): {"journal": [], "agenda": [], "exams": []} for uid in range(args.users)
+            }
+            for i in range(size):
+                dm.data[str(i % args.users)]["journal"].append({
+                    "text": f"Ressenti numéro {i} : stressé par les examens, nuit courte", "date": "2026-01-01",
+                    "time": "08:00",
+                })
+            save = min(_timed(dm._save) for _ in range(args.repeat))
+            load = min(_timed(dm._load) for _ in range(args.repeat))
+            results.append({
+                "entries": size,
+                "file_bytes": os.path.getsize(dm.filepath),
+                "save_ms": round(save * 1000, 2),
+                "load_ms": round(load * 1000, 2),
+                "save_us_per_entry": round(save / size * 1e6, 2),
+                "load_us_per_entry": round(load / size * 1e6, 2),
+            })
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {"config": vars(args), "storage": results}
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def _print_report(report):
+    if "storage" in report:
+        print(f"{'entrées':>10} {'octets':>12} {'_save ms':>10} {'_load ms':>10} {'µs/entrée (save/load)':>24}")
+        for r in report["storage"]:
+            print(f"{r['entries']:>10} {r['file_bytes']:>12} {r['save_ms']:>10} {r['load_ms']:>10} "
+                  f"{r['save_us_per_entry']:>11} / {r['load_us_per_entry']}")
+        return
+    print(f"{report['updates']} mises à jour en {report['elapsed_seconds']} s "
+          f"({report['updates_per_second']} / s)")
+    print(f"{'commande':<14} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, c in report["commands"].items():
+        print(f"{name:<14} {c['count']:>6} {c['p50_ms']:>9} {c['p95_ms']:>9} {c['p99_ms']:>9} {c['max_ms']:>9}")
+    print("Boucle d'événements :", report["event_loop"])
+    for name, stats in report["upstream"].items():
+        print(f"{name} :", stats)
+    print("Stockage :", report["userdata"])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Banc de mesure hors ligne de StressSentry (aucun accès réseau)."
+    )
+    parser.add_argument("--json", action="store_true", help="affiche le rapport en JSON")
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    load = sub.add_parser("load", help="charge de bout en bout contre des services simulés")
+    load.add_argument("--users", type=int, default=50)
+    load.add_argument("--rounds", type=int, default=10, help="scénarios par utilisateur")
+    load.add_argument("--think-time", type=float, default=0.0, help="pause moyenne (s) entre deux scénarios")
+    load.add_argument("--journal-size", type=int, default=20, help="ressentis existants par utilisateur")
+    load.add_argument("--workers", type=int, default=16, help="handlers simultanés (BOT_MAX_WORKERS)")
+    load.add_argument("--io-threads", type=int, default=4)
+    load.add_argument("--oura-tokens", action="store_true",
+                      help="un jeton Oura par utilisateur (sinon un compte partagé)")
+    load.add_argument("--oura-latency", type=float, default=0.2)
+    load.add_argument("--oura-errors", type=float, default=0.0, help="part de réponses 500")
+    load.add_argument("--oura-429", type=float, default=0.0, help="part de réponses 429")
+    load.add_argument("--cohere-latency", type=float, default=1.0, help="délai avant le premier morceau")
+    load.add_argument("--cohere-token-interval", type=float, default=0.02)
+    load.add_argument("--cohere-errors", type=float, default=0.0)
+    load.add_argument("--cohere-429", type=float, default=0.0)
+    load.add_argument("--telegram-latency", type=float, default=0.02)
+    load.add_argument("--oura-budget", type=float, default=2.0)
+    load.add_argument("--llm-budget", type=float, default=6.0)
+    load.add_argument("--seed", type=int, default=1)
+
+    storage = sub.add_parser("storage", help="micro-mesure de UserDataManager._save / _load")
+    storage.add_argument("--sizes", type=lambda v: [int(x) for x in v.split(",")],
+                         default=[100, 1000, 10000, 50000])
+    storage.add_argument("--users", type=int, default=20)
+    storage.add_argument("--repeat", type=int, default=3)
+
+    args = parser.parse_args()
+    report = asyncio.run(run_load(args)) if args.mode == "load" else run_storage(args)
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,21 @@
 # Import des outils nécessaires
+import asyncio  # Pour exécuter les écritures disque hors de la boucle d'événements
+from functools import partial
 from datetime import datetime  # Pour dater les ressentis enregistrés
+from telegram.error import BadRequest, TelegramError
 from telegram.ext import ContextTypes, ConversationHandler
+from message_stream import ThrottledMessageEditor  # Éditions progressives limitées en fréquence
+from resilience import CircuitOpenError  # Service externe considéré indisponible
+from oura_client import OURA_TOKEN_SETTING, OuraAPIError  # Jeton Oura personnel de chaque utilisateur
+from local_reco import fallback_recommendations  # Conseils de secours calculés localement
+from userdata import parse_dated_text  # Lecture des saisies "DD-MM-YYYY : description"
+from search_index import EmptyQueryError  # /recherche sans mot ni date
+from metrics import (  # Durées exposées sur /metrics
+    RESSENTI_OUTCOMES, RESSENTI_STAGE_SECONDS, conversation_finished, conversation_started
+)
+from pagination import (  # Affichage page par page de /journal et /recherche
+    PER_PAGE, clamp_page, newest_first, page_keyboard, render_page
+)
 # ContextTypes : type de contexte pour les méthodes async des handlers Telegram
 # ConversationHandler : gère les commandes multi-étapes avec des états
 
@@ -16,16 +31,42 @@ class BotHandlers:
     pour les utiliser dans les commandes.
     """
 
-    def __init__(self, dm, oura, cohere_client):
+    def __init__(self, dm, oura, cohere_client, executor=None,
+                 oura_budget=2.0, llm_budget=6.0, followup_deadline=60.0, oura_stores=None,
+                 prefetcher=None, reminders=None):
         """
         Constructeur.
         - dm : instance de UserDataManager (gestion des données locale chiffrées)
-        - oura : instance de OuraClient (requêtes à l'API Oura)
+        - oura : instance de OuraClient (requêtes à l'API Oura, un compte par utilisateur)
         - cohere_client : instance de CohereClient (génération de texte AI)
+        - executor : pool de threads dédié aux appels bloquants (chiffrement, disque) ;
+          None = pool par défaut de la boucle asyncio
+        - oura_budget : délai (s) accordé à Oura dans /ressenti
+        - llm_budget : délai (s) pour que Cohere commence à répondre avant le conseil local
+        - followup_deadline : délai (s) au-delà duquel une réponse Cohere est abandonnée
+        - oura_stores : OuraStoreRegistry (historique local de chaque compte Oura) ;
+          None = lecture directe de l'API
+        - prefetcher : OuraPrefetcher, dont le profil horaire est oublié par /delete
+        - reminders : ReminderScheduler (rappels d'examens et d'événements) ; None = pas de rappel
         """
         self.dm = dm
         self.oura = oura
         self.cohere = cohere_client
+        self.executor = executor
+        self.oura_budget = oura_budget
+        self.llm_budget = llm_budget
+        self.followup_deadline = followup_deadline
+        self.oura_stores = oura_stores
+        self.prefetcher = prefetcher
+        self.reminders = reminders
+
+    async def _blocking(self, fn, *args):
+        """
+        Exécute un appel bloquant (UserDataManager : chiffrement, fichiers) sur le
+        pool de threads, pour ne pas figer la boucle d'événements des autres utilisateurs.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args))
 
     # ---------------------- COMMANDE /start ----------------------
     async def start(self, update, context: ContextTypes.DEFAULT_TYPE):
@@ -34,7 +75,7 @@ class BotHandlers:
         """
         texte = (
             "/journal\n"
-            "Affiche la liste de tous vos ressentis enregistrés dans le journal, avec la date et le texte.\n\n"
+            "Affiche vos ressentis enregistrés, les plus récents d'abord, page par page.\n\n"
 
             "/agenda\n"
             "Ajoute un événement (DD-MM-YYYY : description).\n\n"
@@ -45,14 +86,24 @@ class BotHandlers:
             "/ressenti\n"
             "Saisis ton ressenti actuel, tu recevras une recommandation\n\n"
 
+            "/oura_token <jeton>\n"
+            "Associe votre compte Oura (jeton d'accès personnel) ; /oura_token off pour le retirer.\n\n"
+
             "/oura_ring_4j\n"
             "Affiche les données de sommeil des 4 derniers jours issues de votre compte Oura.\n\n"
 
-            "/recherche <mot>\n"
-            "Recherche un mot dans tous vos ressentis et affiche les entrées correspondantes.\n\n"
+            "/tendances [30|90|365]\n"
+            "Affiche moyennes et tendances de HRV, sommeil et readiness sur la période.\n\n"
+
+            "/recherche <mots>\n"
+            "Recherche des mots dans tous vos ressentis (accents ignorés, mot* pour un préfixe, "
+            "du:YYYY-MM-DD / au:YYYY-MM-DD pour filtrer par date).\n\n"
 
             "/organisation\n"
-            "Affiche un résumé de votre agenda et de vos examens enregistrés.\n\n"
+            "Affiche votre agenda et vos examens à venir, triés par date (rappel la veille et le jour même).\n\n"
+
+            "/cache_reco on|off\n"
+            "Active ou désactive la réutilisation de recommandations pour des ressentis similaires.\n\n"
 
             "/delete\n"
             "Supprime toutes vos données personnelles enregistrées dans le bot."
@@ -62,22 +113,65 @@ class BotHandlers:
     # ---------------------- COMMANDE /journal ----------------------
     async def journal(self, update, context):
         """
-        Liste tous les ressentis de l'utilisateur, s'ils existent.
+        Liste les ressentis de l'utilisateur, page par page (les plus récents d'abord).
         """
         uid = str(update.message.from_user.id)  # ID Telegram de l'utilisateur
-        entries = self.dm.get_user(uid)['journal']  # Récupère la liste "journal"
-        if not entries:
+        text, markup = await self._journal_page(uid, 0)
+        if text is None:
             await update.message.reply_text("Aucun ressenti.")
             return
-        # Construction du message : chaque ligne = date : texte
-        msg = "\n".join(f"{e['date']}: {e['text']}" for e in entries)
-        await update.message.reply_text(msg)
+        await update.message.reply_text(text, reply_markup=markup)
+
+    async def _journal_page(self, uid, page):
+        """Texte et boutons d'une page du journal ; seule cette page est lue et mise en forme."""
+        entries, total = await self._blocking(self.dm.journal_page, uid, page * PER_PAGE, PER_PAGE)
+        if not total:
+            return None, None
+        if not entries:
+            # Le journal a raccourci depuis l'affichage des boutons
+            page = clamp_page(page, total)
+            entries, total = await self._blocking(self.dm.journal_page, uid, page * PER_PAGE, PER_PAGE)
+        return render_page("📔 Journal", entries, page, total), page_keyboard("journal", page, total)
+
+    @staticmethod
+    def _recherche_page(results, page):
+        """Texte et boutons d'une page de résultats de /recherche."""
+        page = clamp_page(page, len(results))
+        text = render_page("🔎 Résultats", newest_first(results, page), page, len(results))
+        return text, page_keyboard("recherche", page, len(results))
+
+    async def page(self, update, context):
+        """
+        Boutons « Plus récents » / « Plus anciens » de /journal et /recherche :
+        remplace le message par la page demandée.
+        """
+        query = update.callback_query
+        _, kind, page = query.data.split(":")
+        if kind == "journal":
+            text, markup = await self._journal_page(str(query.from_user.id), int(page))
+            if text is None:
+                await query.answer("Aucun ressenti.")
+                return
+        else:
+            # Résultats de la dernière recherche, gardés pour la navigation
+            results = context.user_data.get("recherche")
+            if not results:
+                await query.answer("Recherche expirée : relancez /recherche.")
+                return
+            text, markup = self._recherche_page(results, int(page))
+        await query.answer()
+        try:
+            await query.edit_message_text(text, reply_markup=markup)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
 
     # ---------------------- COMMANDE /agenda ----------------------
     async def agenda_start(self, update, context):
         """
         Première étape /agenda : demande la saisie d'un événement.
         """
+        conversation_started(context, "agenda")
         await update.message.reply_text("Entrez événement: DD-MM-YYYY : description")
         return AGENDA  # Passe l'état de conversation à AGENDA
 
@@ -85,27 +179,42 @@ class BotHandlers:
         """
         Deuxième étape /agenda : enregistre l'événement saisi.
         """
-        self.dm.add_agenda_event(str(update.message.from_user.id), update.message.text)
-        await update.message.reply_text("Événement ajouté.")
+        conversation_finished(context, "agenda")
+        uid = str(update.message.from_user.id)
+        await self._blocking(self.dm.add_agenda_event, uid, update.message.text)
+        await update.message.reply_text(await self._schedule_reminder(uid, "agenda", update.message.text, "Événement ajouté."))
         return ConversationHandler.END  # Termine la conversation
 
     # ---------------------- COMMANDE /exam ----------------------
     async def exam_start(self, update, context):
         """Démarre la conversation /exam."""
+        conversation_started(context, "exam")
         await update.message.reply_text("Entrez examen: DD-MM-YYYY : examen")
         return EXAM
 
     async def exam_save(self, update, context):
         """Enregistre le texte saisi comme examen."""
-        self.dm.add_exam(str(update.message.from_user.id), update.message.text)
-        await update.message.reply_text("Examen ajouté.")
+        conversation_finished(context, "exam")
+        uid = str(update.message.from_user.id)
+        await self._blocking(self.dm.add_exam, uid, update.message.text)
+        await update.message.reply_text(await self._schedule_reminder(uid, "exams", update.message.text, "Examen ajouté."))
         return ConversationHandler.END
 
+    async def _schedule_reminder(self, uid, kind, text, confirmation):
+        """Programme les rappels d'une saisie et retourne le message de confirmation."""
+        day, description = parse_dated_text(text)
+        if day is None:
+            return confirmation + " (date non reconnue : pas de rappel, format DD-MM-YYYY : description)"
+        if self.reminders is not None:
+            await self.reminders.add(uid, kind, [(day, description)])
+        return confirmation
+
     # ---------------------- COMMANDE /ressenti ----------------------
     async def ressenti_start(self, update, context):
         """
         Première étape /ressenti : demande à l’utilisateur d’exprimer son ressenti texte.
         """
+        conversation_started(context, "ressenti")
         await update.message.reply_text("Exprimez votre ressenti :")
         return RESSENTI
 
@@ -113,29 +222,202 @@ class BotHandlers:
         """
         Enregistre le ressenti, récupère données Oura récentes,
         envoie le tout à Cohere pour générer une recommandation.
+
+        Chaque étape a un budget de temps, pour que la réponse arrive toujours vite :
+        - l'enregistrement est confirmé immédiatement ;
+        - Oura a `oura_budget` secondes, sinon on utilise les dernières données connues ;
+        - si Cohere n'a rien produit après `llm_budget` secondes, une recommandation
+          locale est affichée et la réponse complète est envoyée plus tard si elle arrive.
         """
+        conversation_finished(context, "ressenti")
         uid = str(update.message.from_user.id)
         texte = update.message.text
-        # Sauvegarde du ressenti (avec date du jour)
-        self.dm.add_journal_entry(uid, texte, datetime.today().strftime("%Y-%m-%d"))
+        # Durée de chaque étape, exposée sur /metrics (stresssentry_ressenti_stage_seconds)
+        stage = RESSENTI_STAGE_SECONDS.timer
+        # Sauvegarde du ressenti (avec date et heure : elles servent au préchauffage Oura)
+        now = datetime.now()
+        with stage(stage="save"):
+            await self._blocking(
+                self.dm.add_journal_entry, uid, texte, now.strftime("%Y-%m-%d"), now.strftime("%H:%M")
+            )
+
+        # Réponse immédiate, complétée au fil de la génération
+        prefix = "Ressenti enregistré.\n\n"
+        with stage(stage="ack"):
+            placeholder = await update.message.reply_text(prefix + "⏳ Préparation de la recommandation...")
+        editor = ThrottledMessageEditor(placeholder, prefix=prefix)
 
         # Récupération des données Oura du dernier jour (ou dictionnaire vide si pas dispo)
-        sleep = self.oura.fetch_sleep_data_last_days(1)[0] if self.oura.fetch_sleep_data_last_days(1) else {}
-        readiness = self.oura.fetch_readiness_data_last_days(1)[0] if self.oura.fetch_readiness_data_last_days(1) else {}
-        activity = self.oura.fetch_activity_data_last_days(1)[0] if self.oura.fetch_activity_data_last_days(1) else {}
+        # Les trois endpoints sont interrogés en parallèle, une seule fois chacun
+        with stage(stage="oura"):
+            account = await self.oura.afor_user(self.dm, uid, self.executor)
+            if account is not None:
+                sleep, readiness, activity = await account.afetch_latest(1, timeout=self.oura_budget)
+            else:
+                sleep, readiness, activity = {}, {}, {}
+
+        # Appel Cohere en streaming, affiché en direct tant que le budget n'est pas dépassé
+        use_cache = await self._blocking(self.dm.get_setting, uid, "reco_cache", True)
+        first_text = asyncio.Event()
+        live = True
 
-        # Appel Cohere pour générer recommandations
-        reco = self.cohere.generate_recommendations(texte, sleep, readiness, activity)
+        async def generate():
+            reco = ""
+            async for morceau in self.cohere.astream_recommendations(
+                    texte, sleep, readiness, activity, use_cache=use_cache):
+                reco += morceau
+                first_text.set()
+                if live:
+                    await editor.update(reco + " ▌")
+            return reco.strip()
+
+        generation = asyncio.ensure_future(generate())
+        first_wait = asyncio.ensure_future(first_text.wait())
+        with stage(stage="first_text"):
+            await asyncio.wait({generation, first_wait}, timeout=self.llm_budget,
+                               return_when=asyncio.FIRST_COMPLETED)
+        first_wait.cancel()
+
+        if first_text.is_set():
+            # Le texte arrive : on continue l'affichage en direct, dans la limite du délai de suivi
+            try:
+                with stage(stage="stream"):
+                    reco = await asyncio.wait_for(generation, self.followup_deadline)
+            except Exception as e:
+                print("Erreur Cohere :", e)
+                reco = None
+            if reco:
+                await editor.finish(reco)
+                RESSENTI_OUTCOMES.inc(outcome="cohere")
+                return ConversationHandler.END
+        elif not generation.done():
+            # Budget dépassé : conseil local maintenant, réponse complète plus tard
+            live = False
+            context.application.create_task(
+                self._deliver_followup(update.message, generation), update=update
+            )
+            await editor.finish(
+                fallback_recommendations(texte, sleep, readiness, activity)
+                + "\n\n⏳ Une recommandation plus détaillée suivra."
+            )
+            RESSENTI_OUTCOMES.inc(outcome="local_then_followup")
+            return ConversationHandler.END
+        elif generation.exception() is not None:
+            # Échec rapide (disjoncteur ouvert, erreur API) : on passe au conseil local
+            if not isinstance(generation.exception(), CircuitOpenError):
+                print("Erreur Cohere :", generation.exception())
 
-        await update.message.reply_text(f"Ressenti enregistré.\n\n{reco}")
+        await editor.finish(fallback_recommendations(texte, sleep, readiness, activity))
+        RESSENTI_OUTCOMES.inc(outcome="local")
         return ConversationHandler.END
 
+    async def _deliver_followup(self, message, generation):
+        """
+        Envoie la recommandation Cohere arrivée après le budget, si elle arrive
+        avant `followup_deadline` ; sinon la génération est abandonnée.
+        """
+        try:
+            reco = await asyncio.wait_for(generation, self.followup_deadline)
+        except Exception as e:
+            print("Recommandation abandonnée :", repr(e))
+            return
+        if reco:
+            await message.reply_text(f"Recommandation détaillée :\n\n{reco}")
+
+    # ---------------------- COMMANDE /cache_reco ----------------------
+    async def cache_reco(self, update, context):
+        """
+        Active ou désactive la réutilisation de recommandations déjà générées
+        pour des ressentis et données Oura similaires.
+        """
+        uid = str(update.message.from_user.id)
+        choix = context.args[0].lower() if context.args else ""
+        if choix not in ("on", "off"):
+            etat = "activé" if await self._blocking(self.dm.get_setting, uid, "reco_cache", True) else "désactivé"
+            await update.message.reply_text(f"Cache des recommandations : {etat}.\nUsage: /cache_reco on|off")
+            return
+        await self._blocking(self.dm.set_setting, uid, "reco_cache", choix == "on")
+        await update.message.reply_text(
+            "Recommandations similaires réutilisées." if choix == "on"
+            else "Chaque recommandation sera générée spécialement pour vous."
+        )
+
+    # ---------------------- COMMANDE /oura_token ----------------------
+    async def oura_token(self, update, context):
+        """
+        Associe un compte Oura à l'utilisateur (jeton d'accès personnel, enregistré
+        chiffré avec ses autres données).
+        - /oura_token <jeton> : vérifie le jeton auprès d'Oura puis l'enregistre
+        - /oura_token off : retire le jeton (retour au compte global, s'il existe)
+        - sans argument : indique le compte utilisé
+        """
+        uid = str(update.message.from_user.id)
+        choix = context.args[0] if context.args else ""
+        current = await self._blocking(self.dm.get_setting, uid, OURA_TOKEN_SETTING)
+        if not choix:
+            compte = "personnel" if current else ("partagé du bot" if self.oura.token else "aucun")
+            await update.message.reply_text(
+                f"Compte Oura utilisé : {compte}.\n"
+                "Usage: /oura_token <jeton d'accès personnel> | /oura_token off\n"
+                "Jeton à créer sur https://cloud.ouraring.com/personal-access-tokens"
+            )
+            return
+        if choix.lower() == "off":
+            if current:
+                await self._blocking(self.dm.set_setting, uid, OURA_TOKEN_SETTING, None)
+                await self._drop_oura_history(current)
+            await update.message.reply_text("Jeton Oura retiré.")
+            return
+
+        # Le jeton ne doit pas rester visible dans la conversation
+        chat = update.effective_chat
+        try:
+            await update.message.delete()
+        except TelegramError:
+            pass
+        try:
+            valide = await self.oura.avalidate(choix)
+        except OuraAPIError as e:
+            print("Vérification du jeton Oura impossible :", e)
+            await chat.send_message("Oura ne répond pas, réessayez plus tard.")
+            return
+        if not valide:
+            await chat.send_message("Jeton refusé par Oura : vérifiez-le puis réessayez.")
+            return
+        await self._blocking(self.dm.set_setting, uid, OURA_TOKEN_SETTING, choix)
+        if current and current != choix:
+            await self._drop_oura_history(current)
+        await chat.send_message("Compte Oura enregistré (message contenant le jeton supprimé).")
+
+    async def _drop_oura_history(self, token):
+        """Supprime l'historique local d'un jeton personnel (jamais celui du jeton global)."""
+        if self.oura_stores is not None and token != self.oura.token:
+            account = self.oura.for_token(token)
+            await self.oura_stores.adrop(account.key)
+
+    async def _sync_oura_history(self, store, account, days=None):
+        """Synchronise l'historique local ; si Oura ne répond pas, l'historique déjà stocké est servi."""
+        try:
+            await store.sync(account, days=days)
+        except OuraAPIError as e:
+            print("Synchronisation Oura impossible, historique local servi :", e)
+
     # ---------------------- COMMANDE /oura_ring_4j ----------------------
     async def oura_ring_4j(self, update, context):
         """
         Affiche les données de sommeil détaillées des 4 derniers jours depuis Oura.
+        Servi depuis l'historique local (synchronisé de façon incrémentale) s'il existe.
         """
-        data = self.oura.fetch_sleep_data_last_days(4)
+        account = await self.oura.afor_user(self.dm, str(update.message.from_user.id), self.executor)
+        if account is None:
+            await update.message.reply_text("Aucun compte Oura : /oura_token <jeton> pour associer le vôtre.")
+            return
+        if self.oura_stores is not None:
+            store = await self.oura_stores.aget(account.key)
+            await self._sync_oura_history(store, account)
+            data = store.last_days(4)
+        else:
+            data = await account.afetch_sleep_data_last_days(4)
         if not data:
             await update.message.reply_text("Pas de données Oura.")
             return
@@ -158,34 +440,108 @@ class BotHandlers:
         # chaque bloc avec deux sauts de ligne pour l'affichage
         await update.message.reply_text("\n\n".join(lignes))
 
+    # ---------------------- COMMANDE /tendances ----------------------
+    async def tendances(self, update, context):
+        """
+        Affiche moyennes, moyennes glissantes sur 7 jours et tendances (HRV, durée
+        de sommeil, readiness) sur 30, 90 ou 365 jours, depuis l'historique local.
+        """
+        if self.oura_stores is None:
+            await update.message.reply_text("Historique Oura non disponible.")
+            return
+        try:
+            jours = int(context.args[0]) if context.args else 30
+        except ValueError:
+            jours = 0
+        if not 7 <= jours <= 365:
+            await update.message.reply_text("Usage: /tendances [30|90|365]")
+            return
+
+        account = await self.oura.afor_user(self.dm, str(update.message.from_user.id), self.executor)
+        if account is None:
+            await update.message.reply_text("Aucun compte Oura : /oura_token <jeton> pour associer le vôtre.")
+            return
+        store = await self.oura_stores.aget(account.key)
+        await self._sync_oura_history(store, account, jours)
+        metriques = [
+            ("❤️ HRV", "average_hrv", 1, "ms"),
+            ("⏱ Sommeil", "total_sleep_duration", 1 / 3600, "h"),
+            ("🔋 Readiness", "readiness_score", 1, ""),
+        ]
+        lignes = [f"📈 Tendances - {jours} derniers jours :"]
+        for label, colonne, echelle, unite in metriques:
+            st = store.summary(colonne, jours)
+            if st["mean"] is None:
+                lignes.append(f"{label} : pas de données")
+                continue
+            ligne = f"{label} : moy. {st['mean'] * echelle:.1f}{unite}"
+            if st["rolling"] is not None:
+                ligne += f" | 7 j : {st['rolling'] * echelle:.1f}{unite}"
+            if st["trend_per_week"] is not None:
+                ligne += f" | tendance : {st['trend_per_week'] * echelle:+.2f}{unite}/sem."
+            lignes.append(f"{ligne} ({st['days']} j mesurés)")
+        await update.message.reply_text("\n".join(lignes))
+
     # ---------------------- COMMANDE /recherche ----------------------
     async def recherche(self, update, context):
         """
-        Recherche un mot clé dans tous les ressentis de l'utilisateur.
+        Recherche des mots dans tous les ressentis de l'utilisateur (index inversé).
+        - plusieurs mots : tous doivent apparaître ; accents et majuscules ignorés
+        - mot* : recherche par préfixe
+        - du:YYYY-MM-DD / au:YYYY-MM-DD : limite à une plage de dates
         """
         uid = str(update.message.from_user.id)
-        if not context.args:
-            await update.message.reply_text("Usage: /recherche mot")
+        try:
+            res = await self._blocking(self.dm.search_journal, uid, context.args or [])
+        except EmptyQueryError:
+            # Aucun argument, ou seulement de la ponctuation ("/recherche !!!")
+            await update.message.reply_text("Usage: /recherche mot [mot2 ...] [préfixe*] [du:YYYY-MM-DD] [au:YYYY-MM-DD]")
             return
-        mot = context.args[0].lower()
-        res = [e for e in self.dm.get_user(uid)['journal'] if mot in e['text'].lower()]
-        await update.message.reply_text(
-            "\n".join(f"{e['date']}: {e['text']}" for e in res) or "Aucun résultat."
-        )
+        except ValueError:
+            await update.message.reply_text("Date invalide, format attendu : du:YYYY-MM-DD au:YYYY-MM-DD")
+            return
+        if not res:
+            await update.message.reply_text("Aucun résultat.")
+            return
+        # Résultats gardés pour les boutons de navigation (remplacés à chaque recherche)
+        context.user_data["recherche"] = res
+        text, markup = self._recherche_page(res, 0)
+        await update.message.reply_text(text, reply_markup=markup)
 
     # ---------------------- COMMANDE /organisation ----------------------
     async def organisation(self, update, context):
         """
-        Affiche l'agenda et les examens enregistrés pour l'utilisateur.
+        Affiche l'agenda et les examens à venir (à partir d'aujourd'hui), triés par date.
         """
-        u = self.dm.get_user(str(update.message.from_user.id))
-        msg = "Agenda:\n" + "\n".join(u['agenda']) + "\nExamens:\n" + "\n".join(u['exams'])
-        await update.message.reply_text(msg or "Vide.")
+        uid = str(update.message.from_user.id)
+        upcoming = await self._blocking(self.dm.upcoming, uid, datetime.today().strftime("%Y-%m-%d"))
+        sections = []
+        for kind, titre in (("agenda", "Agenda"), ("exams", "Examens")):
+            items, total, undated = upcoming[kind]
+            lignes = [f"{datetime.strptime(d, '%Y-%m-%d').strftime('%d-%m-%Y')} : {desc}" for d, desc in items]
+            if total > len(items):
+                lignes.append(f"… et {total - len(items)} autre(s)")
+            lignes += [f"(sans date) {desc}" for desc in undated]
+            sections.append(f"{titre}:\n" + ("\n".join(lignes) if lignes else "Rien à venir."))
+            # Rappels des éléments enregistrés avant la mise en place des rappels
+            if self.reminders is not None:
+                await self.reminders.add(uid, kind, items)
+        await update.message.reply_text("\n".join(sections))
 
     # ---------------------- COMMANDE /delete ----------------------
     async def delete(self, update, context):
         """
         Efface toutes les données personnelles enregistrées pour cet utilisateur.
         """
-        self.dm.clear_user(str(update.message.from_user.id))
+        uid = str(update.message.from_user.id)
+        token = await self._blocking(self.dm.get_setting, uid, OURA_TOKEN_SETTING)
+        await self._blocking(self.dm.clear_user, uid)
+        if token:
+            await self._drop_oura_history(token)
+        if self.prefetcher is not None:
+            self.prefetcher.forget(uid)
+        if self.reminders is not None:
+            await self.reminders.forget(uid)
+        # Force l'écriture immédiate de la suppression (mode write-behind), hors boucle
+        await self._blocking(self.dm.flush)
         await update.message.reply_text("Toutes vos données ont été supprimées.")
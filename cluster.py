@@ -0,0 +1,253 @@
+import asyncio
+import hmac
+import json
+import multiprocessing
+import os
+import queue
+import secrets
+import signal
+import ssl
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+from dotenv import load_dotenv
+from telegram import Update
+
+from app import build_application, build_data_manager
+from metrics import CLUSTER_UPDATES, PROFILER, start_metrics_server
+from reminders import ReminderScheduler
+from sharding import rebalance, shard_dir, shard_for, update_owner
+
+
+# ---------------------- Worker ----------------------
+def run_worker(shard, inbox, data_dir, metrics_port=None):
+    """
+    Processus worker : le bot complet (app.build_application) sur les seules données
+    de son fragment `data_dir`, alimenté par la file `inbox` du front.
+    """
+    # Ctrl-C est reçu par tout le groupe de processus : c'est le front qui arrête les workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    load_dotenv()
+    if metrics_port:
+        start_metrics_server(metrics_port)
+    if os.getenv("PROFILER") == "on":
+        PROFILER.start()
+    asyncio.run(_serve(shard, data_dir, inbox))
+
+
+async def _serve(shard, data_dir, inbox):
+    # Application construite dans la boucle qui la fait tourner : ses primitives asyncio
+    # (sémaphores, verrous) y sont liées, y compris en Python 3.8 / 3.9
+    app = build_application(data_dir, polling=False)
+    print(f"Worker {shard} démarré ({data_dir}).")
+    loop = asyncio.get_running_loop()
+    await app.initialize()
+    await app.start()
+    try:
+        while True:
+            # Lecture bloquante dans un thread : la boucle reste libre pour les handlers
+            raw = await loop.run_in_executor(None, inbox.get)
+            if raw is None:
+                break
+            await app.update_queue.put(Update.de_json(json.loads(raw), app.bot))
+    finally:
+        # stop() attend la fin des mises à jour déjà reçues
+        await app.stop()
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+
+
+def open_shard(data_dir):
+    """Stockage et rappels d'un fragment (pour sharding.rebalance)."""
+    dm = build_data_manager(data_dir)
+    return dm, ReminderScheduler(os.path.join(data_dir, "reminders.enc"), cipher=dm.cipher)
+
+
+# ---------------------- Front ----------------------
+class _WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # connexions keep-alive réutilisées par Telegram
+
+    def do_POST(self):
+        front = self.server.front
+        if urlsplit(self.path).path != front.path:
+            self.send_error(404)
+            return
+        token = self.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(token, front.secret):
+            self.send_error(403)
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(front.route(body))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass  # pas de journal d'accès pour chaque mise à jour
+
+
+class WebhookFront:
+    """
+    Processus front du mode cluster : reçoit les webhooks Telegram et répartit
+    les mises à jour entre `workers` processus.
+
+    ✔ Chaque mise à jour va au worker propriétaire de son utilisateur (sharding.shard_for) :
+      un utilisateur est toujours servi par le même processus, qui garde l'ordre de ses
+      messages (PerUserUpdateProcessor) et seul écrit ses données
+    ✔ Le front ne décode que l'identifiant de l'utilisateur ; tout le reste
+      (handlers, chiffrement, Oura, Cohere) tourne dans les workers, sur plusieurs cœurs
+    ✔ Worker arrêté ou file pleine : réponse 503, Telegram renvoie la mise à jour plus tard
+    ✔ Un worker qui s'arrête est relancé ; les mises à jour encore dans sa file sont perdues
+    """
+
+    def __init__(self, workers, root="shards", path="/", secret=None,
+                 metrics_port=None, max_pending=1000):
+        """
+        - root : répertoire des fragments (un sous-répertoire par worker)
+        - path : chemin HTTP du webhook (celui de WEBHOOK_URL)
+        - secret : jeton vérifié dans X-Telegram-Bot-Api-Secret-Token (aléatoire par défaut)
+        - metrics_port : si défini, le worker i expose ses métriques sur metrics_port + 1 + i
+        - max_pending : mises à jour en attente par worker avant de répondre 503
+        """
+        self.workers = workers
+        self.root = root
+        self.path = path
+        self.secret = secret or secrets.token_urlsafe(32)
+        self.metrics_port = metrics_port
+        self.max_pending = max_pending
+        # "spawn" : workers démarrés sans hériter des threads HTTP du front
+        self._mp = multiprocessing.get_context("spawn")
+        self.inboxes = [None] * workers
+        self.processes = [None] * workers
+        self.restarts = 0
+        self._server = None
+        self._stopping = threading.Event()
+
+    def _spawn(self, shard):
+        # Nouvelle file à chaque (re)démarrage : celle d'un worker tué peut être corrompue
+        self.inboxes[shard] = self._mp.Queue(self.max_pending)
+        port = self.metrics_port + 1 + shard if self.metrics_port else None
+        process = self._mp.Process(
+            target=run_worker, name=f"worker-{shard}",
+            args=(shard, self.inboxes[shard], shard_dir(self.root, shard), port),
+        )
+        process.start()
+        self.processes[shard] = process
+
+    def route(self, body):
+        """Dépose la mise à jour (JSON brut) dans la file de son worker ; retourne le statut HTTP."""
+        try:
+            owner = update_owner(json.loads(body))
+        except (ValueError, AttributeError, KeyError, TypeError):
+            CLUSTER_UPDATES.inc(shard="", status="invalid")
+            return 400
+        # Sans utilisateur ni chat (rare) : le premier worker s'en charge
+        shard = 0 if owner is None else shard_for(owner, self.workers)
+        process = self.processes[shard]
+        if process is None or not process.is_alive():
+            CLUSTER_UPDATES.inc(shard=shard, status="worker_down")
+            return 503
+        try:
+            self.inboxes[shard].put(body, timeout=1.0)
+        except queue.Full:
+            CLUSTER_UPDATES.inc(shard=shard, status="queue_full")
+            return 503
+        CLUSTER_UPDATES.inc(shard=shard, status="forwarded")
+        return 200
+
+    def start(self, host="0.0.0.0", port=8443, certfile=None, keyfile=None):
+        """Démarre les workers puis le serveur HTTP (HTTPS si un certificat est fourni)."""
+        for shard in range(self.workers):
+            self._spawn(shard)
+        self._server = ThreadingHTTPServer((host, port), _WebhookHandler)
+        self._server.front = self
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+        threading.Thread(target=self._server.serve_forever, name="webhook-http", daemon=True).start()
+        print(f"Front à l'écoute sur {host}:{port}{self.path}, {self.workers} workers")
+
+    def set_webhook(self, token, url):
+        """Indique à Telegram l'URL publique du front et le jeton secret attendu."""
+        response = requests.post(
+            f"https://api.telegram.org/bot{token}/setWebhook",
+            data={"url": url, "secret_token": self.secret}, timeout=10,
+        )
+        result = response.json()
+        if not result.get("ok"):
+            raise RuntimeError(f"setWebhook refusé : {result.get('description')}")
+
+    def serve_forever(self):
+        """Surveille les workers (relance en cas d'arrêt) jusqu'à SIGTERM ou Ctrl-C."""
+        signal.signal(signal.SIGTERM, lambda *_: self._stopping.set())
+        try:
+            while not self._stopping.wait(1.0):
+                for shard, process in enumerate(self.processes):
+                    if not process.is_alive():
+                        print(f"Worker {shard} arrêté (code {process.exitcode}) : relance")
+                        self.restarts += 1
+                        self._spawn(shard)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self, timeout=30.0):
+        """N'accepte plus de webhooks, puis laisse chaque worker finir sa file."""
+        self._stopping.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for inbox, process in zip(self.inboxes, self.processes):
+            if process is not None and process.is_alive():
+                try:
+                    inbox.put(None, timeout=timeout)
+                except queue.Full:
+                    pass  # worker bloqué : arrêté de force ci-dessous
+        for process in self.processes:
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        print("Front arrêté :", self.stats())
+
+    def stats(self):
+        return {"workers": self.workers, "restarts": self.restarts}
+
+
+def main():
+    load_dotenv()
+    url = os.getenv("WEBHOOK_URL")
+    if not url:
+        raise SystemExit("WEBHOOK_URL est requis en mode cluster (URL publique HTTPS du front)")
+    workers = int(os.getenv("BOT_WORKERS", os.cpu_count() or 1))
+    root = os.getenv("SHARD_DIR", "shards")
+
+    # Données redistribuées avant le démarrage des workers si leur nombre a changé
+    rebalance(root, workers, open_shard)
+
+    metrics_port = int(os.getenv("METRICS_PORT")) if os.getenv("METRICS_PORT") else None
+    if metrics_port:
+        start_metrics_server(metrics_port)
+    front = WebhookFront(
+        workers, root=root, path=urlsplit(url).path or "/", secret=os.getenv("WEBHOOK_SECRET"),
+        metrics_port=metrics_port, max_pending=int(os.getenv("WEBHOOK_MAX_PENDING", 1000)),
+    )
+    front.start(
+        host=os.getenv("WEBHOOK_LISTEN", "0.0.0.0"), port=int(os.getenv("WEBHOOK_PORT", 8443)),
+        certfile=os.getenv("WEBHOOK_CERT"), keyfile=os.getenv("WEBHOOK_KEY"),
+    )
+    try:
+        front.set_webhook(os.getenv("TELEGRAM_TOKEN"), url)
+    except Exception:
+        front.stop()
+        raise
+    front.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
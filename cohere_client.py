@@ -1,44 +1,137 @@
 # Import des modules nécessaires
 import os  # Gestion des variables d'environnement
-from cohere import ClientV2  # Client officiel Cohere API v2 pour chat
+import httpx  # Erreurs réseau remontées par le SDK Cohere
+from cohere import AsyncClientV2  # Client officiel Cohere API v2 (asynchrone)
+from cohere.core.api_error import ApiError  # Erreur HTTP de l'API (porte le status_code)
+import time  # Mesure de la durée des générations (gain estimé du cache)
 from dotenv import load_dotenv  # Pour charger les variables dans un fichier .env
 
+from search_index import tokenize  # Découpage en mots sans accents ni majuscules
+from ttl_cache import TTLCache  # Cache borné à durée de vie
+from resilience import RateLimitedError, RetryableError, get_guard, parse_retry_after
+from metrics import UPSTREAM_SECONDS  # Latence des appels Cohere, exposée sur /metrics
+
 # Charge les variables d'environnement depuis le fichier .env (ex: COHERE_API_KEY)
 load_dotenv()
 
+# Mots sans influence sur la recommandation, ignorés dans la clé de cache
+_STOPWORDS = {
+    "je", "j", "suis", "me", "m", "moi", "ai", "a", "de", "du", "des", "d", "le", "la",
+    "les", "l", "un", "une", "et", "en", "trop", "tres", "vraiment", "peu",
+    "beaucoup", "assez", "super", "grave", "c", "est", "ca", "cela", "mon", "ma", "mes",
+    "au", "aux", "pour", "par", "sur", "avec", "que", "qui",
+}
+# La négation change le sens du ressenti : gardée dans la clé, sous une seule forme
+# ("je ne suis pas stressé", "je suis pas stressé" -> "pas stress") ; "plus", "jamais",
+# "rien"... ne sont pas des mots vides et restent tels quels
+_NEGATIONS = {"ne": "pas", "n": "pas", "pas": "pas"}
+# Terminaisons retirées pour rapprocher "stressé", "stressée", "stressés" de "stress"
+_SUFFIXES = ("ees", "ee", "es", "e", "s")
+
+
+def normalize_ressenti(text):
+    """
+    Forme canonique d'un ressenti pour le cache : mots sans accents, sans mots
+    vides, terminaisons simplifiées, dédupliqués et triés.
+    "Je suis stressé" et "trop de stress" donnent tous deux "stress" ;
+    "je ne suis pas stressé" donne "pas stress".
+    """
+    words = set()
+    for word in tokenize(text):
+        if word in _NEGATIONS:
+            words.add(_NEGATIONS[word])
+            continue
+        if word in _STOPWORDS:
+            continue
+        for suffix in _SUFFIXES:
+            if suffix == "s" and word.endswith("ss"):
+                continue  # "stress" reste "stress"
+            if len(word) > len(suffix) + 3 and word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+        words.add(word)
+    return " ".join(sorted(words))
+
+
+def _classify_error(e):
+    """
+    Convertit une erreur du SDK Cohere : 429 -> RateLimitedError, réseau et 5xx
+    -> RetryableError (nouvelle tentative possible), autres erreurs inchangées.
+    """
+    status = getattr(e, "status_code", None)
+    if isinstance(e, ApiError) and status == 429:
+        headers = getattr(e, "headers", None) or {}
+        return RateLimitedError("429 Too Many Requests",
+                                retry_after=parse_retry_after(headers.get("retry-after")))
+    if isinstance(e, httpx.HTTPError) or (isinstance(e, ApiError) and (status or 0) >= 500):
+        return RetryableError(repr(e))
+    return e
+
+
+def _status(e):
+    """Étiquette « status » des métriques pour une erreur du SDK."""
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return status
+    return "network_error" if isinstance(e, httpx.HTTPError) else type(e).__name__
+
+
+def _bucket(value, width):
+    """Arrondit une mesure Oura à sa tranche (ex : 73 -> 70 pour une largeur de 10)."""
+    if not isinstance(value, (int, float)):
+        return None
+    return int(value // width * width)
+
 class CohereClient:
     """
     Client Cohere Chat V2 pour générer des recommandations basées sur le ressenti
     et les données collectées depuis Oura Ring.
     """
 
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, cache_ttl=None, cache_size=None, bucket_width=10, deadline=30.0,
+                 base_url=None):
         """
         Initialise le client Cohere avec la clé API.
         - api_key: optionnel, si non fourni, sera pris depuis la variable d'environnement COHERE_API_KEY.
+        - cache_ttl / cache_size : durée de vie (s) et taille du cache de recommandations
+          (défauts : COHERE_CACHE_TTL, COHERE_CACHE_SIZE)
+        - bucket_width : largeur des tranches de scores Oura dans la clé de cache
+        - deadline : délai maximal (s) pour obtenir le début de la réponse en streaming,
+          nouvelles tentatives comprises
+        - base_url : URL de l'API (défaut : COHERE_BASE_URL, sinon l'API officielle),
+          pour viser un serveur de test local
         """
         self.api_key = api_key or os.getenv("COHERE_API_KEY")  # Récupère la clé API
         if not self.api_key:
             # Si la clé n'est pas trouvée, on lève une erreur explicite
             raise ValueError("COHERE_API_KEY manquant")
-        # Instancie le client Cohere v2 avec la clé API
-        self.co = ClientV2(api_key=self.api_key)
+        base_url = base_url or os.getenv("COHERE_BASE_URL")
+        # Client Cohere v2 asynchrone, en streaming (ne bloque pas la boucle du bot)
+        self.aco = AsyncClientV2(api_key=self.api_key, base_url=base_url)
 
-    def generate_recommendations(self, ressenti, sleep, readiness, activity):
-        """
-        Prépare un prompt enrichi avec le ressenti utilisateur + données Oura,
-        puis envoie ce prompt à l'API Cohere Chat pour générer une recommandation.
+        # Cache des recommandations pour des ressentis et scores Oura similaires
+        self.reco_cache = TTLCache(
+            ttl=cache_ttl if cache_ttl is not None else float(os.getenv("COHERE_CACHE_TTL", 6 * 3600)),
+            maxsize=cache_size if cache_size is not None else int(os.getenv("COHERE_CACHE_SIZE", 500)),
+        )
+        self.bucket_width = bucket_width
+        # Durée cumulée des générations et nombre de générations (pour estimer le gain du cache)
+        self._generation_seconds = 0.0
+        self._generations = 0
 
-        Params:
-        - ressenti : chaîne de caractères, le texte saisi par l'utilisateur exprimant son ressenti
-        - sleep : dict, données sommeil récentes extraites d'Oura (score, durée, etc.)
-        - readiness : dict, données readiness (HRV, repos, score readiness)
-        - activity : dict, données activité physique (score, pas, calories)
+        # Limite de débit, tentatives et disjoncteur partagés par tous les appels Cohere
+        self.guard = get_guard("cohere", rate=2.0, burst=5, max_concurrency=4, target_latency=10.0)
+        self.deadline = deadline
 
-        Retour:
-        - une chaîne avec la recommandation générée, ou "Erreur" en cas de problème.
-        """
+    # Paramètres de génération
+    MODEL = "command-r-plus-08-2024"  # modèle de coaching
+    MAX_TOKENS = 160                  # Limite la taille de la réponse générée
+    TEMPERATURE = 0.7                 # Contrôle la créativité / aléatoire du texte généré
 
+    def _build_messages(self, ressenti, sleep, readiness, activity):
+        """
+        Prépare la liste de messages (system + user) avec le ressenti et les données Oura.
+        """
         # Construction du prompt textuel à envoyer en message user
         prompt = (
             f"Un étudiant exprime ce ressenti : \"{ressenti}\"\n\n"
@@ -52,28 +145,97 @@ class CohereClient:
             "Techniques de relaxation, Qualité du sommeil, Aménagement environnement, "
             "Pauses et micro-siestes."
         )
+        return [
+            # Message système pour fixer le contexte du bot
+            {"role": "system", "content": "Tu es un coach pour étudiants stressés."},
+            # Message utilisateur avec le prompt détaillé
+            {"role": "user", "content": prompt}
+        ]
+
+    def cache_key(self, ressenti, sleep, readiness, activity):
+        """
+        Clé de cache : ressenti normalisé + scores Oura arrondis à leur tranche.
+        """
+        w = self.bucket_width
+        return (
+            normalize_ressenti(ressenti),
+            _bucket(sleep.get('score'), w),
+            _bucket(readiness.get('hrv'), w),
+            _bucket(readiness.get('score'), w),
+            _bucket(activity.get('score'), w),
+        )
+
+    def _remember(self, key, text, started):
+        self._generation_seconds += time.monotonic() - started
+        self._generations += 1
+        if key is not None and text:
+            self.reco_cache.set(key, text)
+
+    def cache_stats(self):
+        """
+        Compteurs du cache de recommandations, avec le temps de génération
+        estimé économisé (hits × durée moyenne d'une génération).
+        """
+        stats = self.reco_cache.stats()
+        avg = self._generation_seconds / self._generations if self._generations else 0.0
+        stats["avg_generation_seconds"] = avg
+        stats["saved_seconds"] = stats["hits"] * avg
+        return stats
+
+    async def astream_recommendations(self, ressenti, sleep, readiness, activity, use_cache=True):
+        """
+        Prépare un prompt enrichi avec le ressenti utilisateur + données Oura, puis
+        l'envoie à l'API Cohere Chat en streaming : générateur asynchrone qui produit
+        les morceaux de texte au fur et à mesure de leur génération.
+        - use_cache : False pour ignorer le cache (préférence de l'utilisateur)
+        En cas de hit dans le cache, la recommandation est produite d'un seul bloc.
+        Les erreurs d'API sont propagées à l'appelant (rien n'est alors mis en cache).
+        """
+        key = self.cache_key(ressenti, sleep, readiness, activity) if use_cache else None
+        if key is not None:
+            cached = self.reco_cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        started = time.monotonic()
+        messages = self._build_messages(ressenti, sleep, readiness, activity)
+
+        async def open_stream():
+            # Ouvre le flux et attend son premier événement : tant que rien n'a été
+            # affiché, un échec peut être retenté sans risque de doublon
+            attempt_started = time.monotonic()
+            try:
+                stream = self.aco.chat_stream(
+                    model=self.MODEL,
+                    messages=messages,
+                    max_tokens=self.MAX_TOKENS,
+                    temperature=self.TEMPERATURE,
+                    # Les tentatives sont gérées par self.guard, pas par le SDK
+                    request_options={"max_retries": 0},
+                ).__aiter__()
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                stream = first = None
+            except Exception as e:
+                UPSTREAM_SECONDS.observe(time.monotonic() - attempt_started, service="cohere",
+                                         endpoint="chat_stream_first_event", status=_status(e))
+                raise _classify_error(e) from e
+            UPSTREAM_SECONDS.observe(time.monotonic() - attempt_started, service="cohere",
+                                     endpoint="chat_stream_first_event", status=200)
+            return stream, first
 
-        try:
-            # Appel à la méthode chat() du client Cohere v2
-            # modèle utilisé : "command-r-plus-08-2024" (modèle de coaching)
-            # messages : une liste de dictionnaires avec les rôles system et user
-            response = self.co.chat(
-                model="command-r-plus-08-2024",
-                messages=[
-                    # Message système pour fixer le contexte du bot
-                    {"role": "system", "content": "Tu es un coach pour étudiants stressés."},
-                    # Message utilisateur avec le prompt détaillé
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=160,      # Limite la taille de la réponse générée
-                temperature=0.7,    # Contrôle la créativité / aléatoire du texte généré
-            )
-            # La réponse texte est contenue dans response.message.content, qui est une liste
-            # On accède au premier élément puis à son texte, puis on strip pour enlever espaces inutiles
-            return response.message.content[0].text.strip()
-
-        except Exception as e:
-            # En cas d'erreur d'appel API, on affiche l'erreur en console
-            print("Erreur Cohere :", e)
-            # Et on renvoie un message simple d'erreur au bot
-            return "Erreur"
+        stream, event = await self.guard.call(open_stream, deadline=self.deadline)
+        morceaux = []
+        while event is not None:
+            # Seuls les événements "content-delta" portent du texte
+            if event.type == "content-delta":
+                morceaux.append(event.delta.message.content.text)
+                yield morceaux[-1]
+            try:
+                event = await stream.__anext__()
+            except StopAsyncIteration:
+                event = None
+        UPSTREAM_SECONDS.observe(time.monotonic() - started, service="cohere",
+                                 endpoint="chat_stream", status=200)
+        self._remember(key, "".join(morceaux).strip(), started)
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import random
+import time
+from datetime import date, timedelta
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeHTTPServer:
+    """
+    Petit serveur HTTP/1.1 local (asyncio, keep-alive) pour remplacer un service
+    externe pendant les mesures, sans aucun accès réseau.
+
+    ✔ Latence simulée : `latency` secondes ± `jitter` (tirage uniforme)
+    ✔ Erreurs simulées : `error_rate` des requêtes reçoivent une 500,
+      `rate_limit_rate` une 429 avec Retry-After
+    ✔ Les sous-classes implémentent `handle(method, path, query, body)`
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.url = None
+        self._server = None
+        self._connections = {}  # writer -> tâche qui sert la connexion
+        self.requests = 0
+        self.errors = 0
+
+    async def start(self, host="127.0.0.1"):
+        self._server = await asyncio.start_server(self._serve, host, 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Ferme aussi les connexions keep-alive encore ouvertes
+            for writer in list(self._connections):
+                writer.close()
+            await asyncio.gather(*self._connections.values(), return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def delay(self, base=None):
+        base = self.latency if base is None else base
+        wait = max(0.0, base + self.random.uniform(-self.jitter, self.jitter))
+        if wait:
+            await asyncio.sleep(wait)
+
+    # ---------------------- Protocole HTTP ----------------------
+    async def _serve(self, reader, writer):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                url = urlsplit(target)
+                self.requests += 1
+                await self._dispatch(writer, method, url.path, parse_qs(url.query), headers, body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def _dispatch(self, writer, method, path, query, headers, body):
+        await self.delay()
+        draw = self.random.random()
+        if draw < self.rate_limit_rate:
+            self.errors += 1
+            await self.send(writer, 429, {"message": "too many requests"}, {"Retry-After": "1"})
+            return
+        if draw < self.rate_limit_rate + self.error_rate:
+            self.errors += 1
+            await self.send(writer, 500, {"message": "simulated failure"})
+            return
+        if headers.get("content-type", "").startswith("application/json"):
+            body = json.loads(body or b"{}")
+        else:
+            body = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        await self.handle(writer, method, path, query, body)
+
+    async def send(self, writer, status, payload, extra_headers=None):
+        data = json.dumps(payload).encode()
+        head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", "Content-Type: application/json",
+                f"Content-Length: {len(data)}"]
+        head += [f"{k}: {v}" for k, v in (extra_headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + data)
+        await writer.drain()
+
+    async def send_chunks(self, writer, chunks, content_type="text/event-stream"):
+        """Réponse en flux (Transfer-Encoding: chunked) ; `chunks` est un itérable asynchrone."""
+        writer.write((f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\n"
+                      "Transfer-Encoding: chunked\r\n\r\n").encode())
+        async for chunk in chunks:
+            data = chunk.encode()
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def handle(self, writer, method, path, query, body):
+        await self.send(writer, 404, {"message": "not found"})
+
+
+class FakeOuraServer(FakeHTTPServer):
+    """Endpoints `usercollection` d'Oura : un document par jour demandé, scores aléatoires."""
+
+    async def handle(self, writer, method, path, query, body):
+        endpoint = path.rstrip("/").rsplit("/", 1)[-1]
+        start = date.fromisoformat(query.get("start_date", [date.today().isoformat()])[0])
+        end = date.fromisoformat(query.get("end_date", [date.today().isoformat()])[0])
+        data = []
+        day = start
+        while day < end:
+            data.append(self._document(endpoint, day))
+            day += timedelta(days=1)
+        await self.send(writer, 200, {"data": data, "next_token": None})
+
+    def _document(self, endpoint, day):
+        r = self.random
+        doc = {"id": f"{endpoint}-{day}", "day": day.isoformat(), "score": r.randint(50, 95)}
+        if endpoint == "sleep":
+            doc.update({
+                "total_sleep_duration": r.randint(18000, 32000),
+                "deep_sleep_duration": r.randint(3000, 7000),
+                "rem_sleep_duration": r.randint(4000, 8000),
+                "light_sleep_duration": r.randint(9000, 16000),
+                "average_heart_rate": r.randint(48, 70),
+                "average_hrv": r.randint(20, 90),
+                "readiness": {"temperature_deviation": round(r.uniform(-0.5, 0.5), 2)},
+            })
+        elif endpoint == "daily_activity":
+            doc["steps"] = r.randint(2000, 15000)
+        return doc
+
+
+class FakeCohereServer(FakeHTTPServer):
+    """
+    Endpoint /v2/chat de Cohere, en flux SSE (`content-delta`) ou en réponse complète.
+    - first_token_latency : attente avant le premier morceau (en plus de `latency`)
+    - token_interval / tokens : rythme et nombre de morceaux générés
+    """
+
+    def __init__(self, first_token_latency=0.5, token_interval=0.02, tokens=60, **kwargs):
+        super().__init__(**kwargs)
+        self.first_token_latency = first_token_latency
+        self.token_interval = token_interval
+        self.tokens = tokens
+
+    def _words(self):
+        return [f"conseil{i} " for i in range(self.tokens)]
+
+    async def handle(self, writer, method, path, query, body):
+        if not body.get("stream"):
+            await asyncio.sleep(self.first_token_latency + self.token_interval * self.tokens)
+            await self.send(writer, 200, {
+                "id": "bench", "finish_reason": "COMPLETE",
+                "message": {"role": "assistant", "content": [{"type": "text", "text": "".join(self._words())}]},
+            })
+            return
+        await self.send_chunks(writer, self._events())
+
+    async def _events(self):
+        yield self._sse({"type": "message-start", "id": "bench", "delta": {"message": {"role": "assistant"}}})
+        await asyncio.sleep(self.first_token_latency)
+        for word in self._words():
+            yield self._sse({"type": "content-delta", "index": 0,
+                             "delta": {"message": {"content": {"text": word}}}})
+            await asyncio.sleep(self.token_interval)
+        yield self._sse({"type": "message-end", "delta": {"finish_reason": "COMPLETE"}})
+
+    @staticmethod
+    def _sse(event):
+        return f"data: {json.dumps(event)}\n\n"
+
+
+class FakeTelegramServer(FakeHTTPServer):
+    """
+    API Bot Telegram minimale (getMe, sendMessage, editMessageText, answerCallbackQuery) :
+    chaque méthode répond avec un objet valide et est comptée.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = {}
+        self._message_id = 0
+
+    async def handle(self, writer, method, path, query, body):
+        name = path.rsplit("/", 1)[-1]
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if name == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif name in ("sendMessage", "editMessageText"):
+            if name == "sendMessage":
+                self._message_id += 1
+            result = {
+                "message_id": int(body.get("message_id", self._message_id)),
+                "date": int(time.time()),
+                "chat": {"id": int(body.get("chat_id", 0)), "type": "private"},
+                "text": body.get("text", ""),
+            }
+        else:
+            result = True
+        await self.send(writer, 200, {"ok": True, "result": result})
+
+
+class SyntheticUsers:
+    """
+    Générateur de mises à jour Telegram (dicts au format de l'API Bot) pour N utilisateurs.
+    Chaque utilisateur suit des scénarios tirés selon `weights` ; un scénario est une
+    suite de messages (ex : "/ressenti" puis le texte du ressenti).
+    """
+
+    RESSENTIS = [
+        "Je suis stressé par les examens et je dors mal",
+        "Fatigué aujourd'hui, beaucoup de révisions",
+        "Plutôt serein, bonne nuit de sommeil",
+        "Angoisse avant le partiel de demain",
+    ]
+
+    def __init__(self, users, seed=None, weights=None, first_uid=100000):
+        self.users = users
+        self.first_uid = first_uid
+        self.random = random.Random(seed)
+        self.weights = weights or {
+            "journal": 3, "ressenti": 3, "recherche": 2, "organisation": 2,
+            "agenda": 1, "oura_ring_4j": 1, "tendances": 1,
+        }
+        self._update_id = 0
+        self._message_id = 0
+
+    def uids(self):
+        return range(self.first_uid, self.first_uid + self.users)
+
+    def scenario(self):
+        """Retourne (nom de commande, liste de textes à envoyer)."""
+        names, weights = zip(*self.weights.items())
+        name = self.random.choices(names, weights)[0]
+        if name == "ressenti":
+            return name, ["/ressenti", self.random.choice(self.RESSENTIS)]
+        if name == "agenda":
+            day = date.today() + timedelta(days=self.random.randint(1, 60))
+            return name, ["/agenda", f"{day.strftime('%d-%m-%Y')} : rendu de projet"]
+        if name == "recherche":
+            return name, [f"/recherche {self.random.choice(['stress', 'examen*', 'nuit', 'fatigue'])}"]
+        if name == "tendances":
+            return name, ["/tendances 30"]
+        return name, [f"/{name}"]
+
+    def message(self, uid, text):
+        """Mise à jour "message" (avec l'entité bot_command pour les commandes)."""
+        self._update_id += 1
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": uid, "type": "private"},
+            "from": {"id": uid, "is_bot": False, "first_name": f"user{uid}"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": self._update_id, "message": message}
@@ -0,0 +1,52 @@
+from search_index import tokenize
+
+# Conseils par thème, choisis selon le ressenti et les scores Oura
+_CONSEILS = {
+    "sommeil": "😴 Sommeil : couche-toi à heure fixe ce soir, sans écran 30 min avant.",
+    "recuperation": "🔋 Récupération : ton corps est fatigué, privilégie une journée légère et des pauses régulières.",
+    "activite": "🚶 Activité : une marche de 20 minutes aide à faire baisser le stress.",
+    "examens": "📚 Organisation : découpe tes révisions en blocs de 25 min (Pomodoro) avec 5 min de pause.",
+    "respiration": "🌬 Relaxation : respiration 4-7-8 (inspire 4 s, bloque 7 s, expire 8 s), 4 cycles.",
+    "pause": "☕ Pause : accorde-toi une micro-sieste de 15-20 min en début d'après-midi.",
+}
+# Mots (sans accents) du ressenti associés à chaque thème
+_MOTS_CLES = {
+    "sommeil": {"dormir", "dors", "dormi", "sommeil", "insomnie", "nuit", "reveil"},
+    "recuperation": {"fatigue", "fatiguee", "epuise", "epuisee", "creve", "vide"},
+    "examens": {"examen", "examens", "partiel", "partiels", "revision", "revisions", "reviser", "deadline", "rendu"},
+    "respiration": {"stress", "stresse", "stressee", "angoisse", "anxieux", "anxieuse", "panique", "peur"},
+}
+
+
+def _score(data, key="score"):
+    value = data.get(key)
+    return value if isinstance(value, (int, float)) else None
+
+
+def fallback_recommendations(ressenti, sleep, readiness, activity, max_conseils=3):
+    """
+    Recommandation de secours calculée localement, sans appel réseau :
+    quelques conseils choisis d'après les mots du ressenti et les scores Oura.
+    Utilisée quand Cohere ne répond pas dans le délai imparti.
+    """
+    mots = set(tokenize(ressenti))
+    themes = []
+
+    sleep_score = _score(sleep)
+    readiness_score = _score(readiness)
+    activity_score = _score(activity)
+    if sleep_score is not None and sleep_score < 70:
+        themes.append("sommeil")
+    if readiness_score is not None and readiness_score < 70:
+        themes.append("recuperation")
+    if activity_score is not None and activity_score < 60:
+        themes.append("activite")
+    for theme, cles in _MOTS_CLES.items():
+        if mots & cles and theme not in themes:
+            themes.append(theme)
+    # Toujours au moins une technique de relaxation et une pause
+    for theme in ("respiration", "pause"):
+        if theme not in themes:
+            themes.append(theme)
+
+    return "\n".join(_CONSEILS[t] for t in themes[:max_conseils])
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+from telegram.constants import MessageLimit
+from telegram.error import BadRequest, RetryAfter
+
+
+class ThrottledMessageEditor:
+    """
+    Met à jour progressivement un message Telegram déjà envoyé, en limitant
+    la fréquence des éditions (Telegram refuse les éditions trop rapprochées).
+
+    ✔ update() n'édite que si `min_interval` secondes se sont écoulées et que le texte a changé
+    ✔ finish() force l'affichage du texte final
+    ✔ Un RetryAfter de Telegram repousse les éditions suivantes au lieu d'échouer
+    """
+
+    def __init__(self, message, prefix="", min_interval=1.5):
+        """
+        - message : telegram.Message à éditer (le placeholder)
+        - prefix : texte fixe affiché avant le contenu
+        - min_interval : délai minimal (s) entre deux éditions
+        """
+        self.message = message
+        self.prefix = prefix
+        self.min_interval = min_interval
+        self._shown = None
+        self._next_edit = 0.0
+
+    def _render(self, text):
+        return (self.prefix + text)[:MessageLimit.MAX_TEXT_LENGTH]
+
+    async def _edit(self, text):
+        text = self._render(text)
+        if text == self._shown:
+            return
+        try:
+            await self.message.edit_text(text)
+        except RetryAfter as e:
+            # Trop d'éditions : on attend la durée demandée par Telegram
+            self._next_edit = time.monotonic() + e.retry_after
+            return
+        except BadRequest as e:
+            # "Message is not modified" : le texte est déjà affiché
+            if "not modified" not in str(e).lower():
+                raise
+        self._shown = text
+        self._next_edit = time.monotonic() + self.min_interval
+
+    async def update(self, text):
+        """Affiche `text` si le délai entre éditions est écoulé, sinon ne fait rien."""
+        if time.monotonic() >= self._next_edit:
+            await self._edit(text)
+
+    async def finish(self, text):
+        """Affiche le texte final, quel que soit le délai depuis la dernière édition."""
+        await self._edit(text)
+        if self._shown != self._render(text):
+            # Édition refusée (RetryAfter) : on attend le délai imposé puis on réessaie
+            await asyncio.sleep(max(0.0, self._next_edit - time.monotonic()))
+            await self._edit(text)
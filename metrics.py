@@ -0,0 +1,289 @@
+import collections
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Bornes (s) des histogrammes de latence : de 5 ms à 30 s
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Métrique avec étiquettes ; utilisable depuis la boucle asyncio et les threads d'E/S."""
+
+    TYPE = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # tuple des valeurs d'étiquettes -> état
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines += self._render_items(items)
+        return lines
+
+
+class Counter(_Metric):
+    """Compteur croissant (suffixe `_total` par convention Prometheus)."""
+
+    TYPE = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _render_items(self, items):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """
+    Histogramme à bornes fixes : une observation incrémente un seul compteur
+    (recherche par bisect), les cumuls ne sont calculés qu'à l'export.
+    """
+
+    TYPE = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def timer(self, **labels):
+        """Mesure la durée du bloc `with` (même en cas d'exception)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def _render_items(self, items):
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                le = bound if isinstance(bound, str) else repr(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        """Toutes les métriques au format texte d'exposition Prometheus."""
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ---------------------- Métriques du bot ----------------------
+HANDLER_SECONDS = Histogram(
+    "stresssentry_handler_seconds", "Durée des handlers Telegram.", ["command"])
+HANDLER_ERRORS = Counter(
+    "stresssentry_handler_errors_total", "Exceptions levées par les handlers Telegram.", ["command"])
+UPSTREAM_SECONDS = Histogram(
+    "stresssentry_upstream_seconds",
+    "Durée des requêtes vers les services externes (une observation par tentative).",
+    ["service", "endpoint", "status"])
+STORAGE_SECONDS = Histogram(
+    "stresssentry_storage_seconds", "Durée de sérialisation et de chiffrement des données.",
+    ["operation"], buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+STORAGE_BYTES = Counter(
+    "stresssentry_storage_bytes_total", "Octets sérialisés, chiffrés et déchiffrés.", ["operation"])
+CONVERSATION_SECONDS = Histogram(
+    "stresssentry_conversation_seconds",
+    "Temps passé dans un état de conversation, de la commande à la réponse de l'utilisateur.",
+    ["conversation"], buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600))
+RESSENTI_STAGE_SECONDS = Histogram(
+    "stresssentry_ressenti_stage_seconds", "Durée de chaque étape de /ressenti.", ["stage"])
+RESSENTI_OUTCOMES = Counter(
+    "stresssentry_ressenti_outcomes_total",
+    "Issue de /ressenti : streaming Cohere, conseil local avec suivi, ou conseil local seul.",
+    ["outcome"])
+CLUSTER_UPDATES = Counter(
+    "stresssentry_cluster_updates_total",
+    "Mises à jour reçues par le front (cluster.py), par worker et par résultat.",
+    ["shard", "status"])
+
+
+def timed_handler(command, callback):
+    """Enveloppe un handler Telegram : durée et exceptions comptées sous `command`."""
+
+    @wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(command=command)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, command=command)
+
+    return wrapper
+
+
+def conversation_started(context, conversation):
+    """Note l'entrée dans un état de conversation (voir conversation_finished)."""
+    context.user_data.setdefault("_conversations", {})[conversation] = time.monotonic()
+
+
+def conversation_finished(context, conversation):
+    started = context.user_data.get("_conversations", {}).pop(conversation, None)
+    if started is not None:
+        CONVERSATION_SECONDS.observe(time.monotonic() - started, conversation=conversation)
+
+
+# ---------------------- Profilage par échantillonnage ----------------------
+class SamplingProfiler:
+    """
+    Profileur par échantillonnage, activable et désactivable à chaud.
+
+    ✔ Un thread relève la pile du thread surveillé (la boucle asyncio) toutes
+      les `interval` secondes ; aucun coût quand il est arrêté
+    ✔ Piles agrégées au format « replié » (une ligne `f1;f2;f3 n`),
+      directement utilisable par les outils de flame graph
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = collections.Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self._target = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, thread_id=None):
+        """Démarre l'échantillonnage de `thread_id` (défaut : thread principal)."""
+        if self.running:
+            return
+        self._target = thread_id or threading.main_thread().ident
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self, reset=False):
+        """Piles repliées, les plus fréquentes d'abord."""
+        lines = [f"{stack} {n}" for stack, n in self.samples.most_common()]
+        if reset:
+            self.samples.clear()
+        return "\n".join(lines) + "\n"
+
+
+PROFILER = SamplingProfiler()
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/metrics":
+            body, content_type = REGISTRY.render(), "text/plain; version=0.0.4"
+        elif url.path == "/profiler":
+            # ?action=start|stop|reset ; sans action : piles relevées jusqu'ici
+            action = query.get("action", [""])[0]
+            if action == "start":
+                PROFILER.start()
+            elif action == "stop":
+                PROFILER.stop()
+            body = PROFILER.collapsed(reset=action == "reset")
+            body = f"# profiler {'actif' if PROFILER.running else 'arrêté'}\n" + body
+            content_type = "text/plain"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # pas de journal d'accès pour chaque collecte
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """
+    Sert /metrics (format Prometheus) et /profiler dans un thread dédié,
+    sur l'interface locale uniquement par défaut.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"Métriques disponibles sur http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -1,57 +1,391 @@
 import os
+import asyncio
+import hashlib
+import time
 import requests
+import httpx
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+from ttl_cache import TTLCache
+from resilience import (
+    RateLimitedError, RetryableError, TokenBucket, UpstreamError, get_guard, parse_retry_after
+)
+from metrics import UPSTREAM_SECONDS
+
 load_dotenv()
 
+
+# Clé de préférence (UserDataManager.set_setting) du jeton Oura personnel d'un utilisateur
+OURA_TOKEN_SETTING = "oura_token"
+
+
+class OuraAPIError(Exception):
+    """Erreur de transport ou réponse non-200 de l'API Oura."""
+
+
+class OuraAuthError(OuraAPIError):
+    """Jeton refusé par Oura (401 / 403) : invalide, expiré ou révoqué."""
+
+
+def tenant_key(token):
+    """Identifiant court d'un compte Oura, dérivé du jeton (le jeton n'apparaît ni en clé ni sur disque)."""
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+
 class OuraClient:
     """
     Client API Oura Cloud v2 (endpoints usercollection/*).
     Permet de récupérer sommeil, readiness et activité.
+
+    Deux modes coexistent :
+    - synchrone (`fetch_*`) via `requests`, historique ;
+    - asynchrone (`afetch_*`) via un `httpx.AsyncClient` partagé (pool keep-alive),
+      à utiliser depuis les handlers Telegram pour ne pas bloquer la boucle d'événements.
+
+    Les réponses sont mises en cache (clé : endpoint + plage de dates) avec TTL et
+    éviction LRU ; les requêtes asynchrones identiques en cours sont fusionnées.
+
+    Les requêtes asynchrones passent par la protection partagée "oura"
+    (resilience.UpstreamGuard) : limite de débit, nouvelles tentatives sur 429/5xx
+    dans un délai global `deadline`, disjoncteur si l'API est indisponible.
+
+    Multi-comptes : chaque utilisateur peut avoir son propre jeton Oura (for_token).
+    ✔ Un seul pool de connexions et un seul cache pour tous les comptes (clés
+      préfixées par tenant_key) : aucune connexion ni session de plus par utilisateur
+    ✔ Un budget de débit par jeton (`token_rate` req/s, rafales `token_burst`),
+      en plus de la limite globale : un compte très actif ne ralentit pas les autres
+    ✔ Jeton global OURA_TOKEN facultatif : compte par défaut des utilisateurs
+      qui n'ont pas enregistré le leur
     """
     API_BASE_URL = "https://api.ouraring.com/v2/usercollection"
 
-    def __init__(self, personal_access_token=None):
-        self.token = personal_access_token or os.getenv("OURA_TOKEN")
-        if not self.token:
-            raise ValueError("Token OURA_TOKEN manquant dans .env")
-        self.headers = {"Authorization": f"Bearer {self.token}"}
+    def __init__(self, personal_access_token=None, timeout=10.0, max_connections=10,
+                 cache=None, empty_ttl=60, deadline=8.0, base_url=None,
+                 token_rate=5.0, token_burst=10, max_tenants=4096):
+        """
+        - personal_access_token : jeton par défaut (OURA_TOKEN) ; None = aucun compte par défaut
+        - token_rate / token_burst : budget de requêtes par jeton (OURA_TOKEN_RATE / OURA_TOKEN_BURST)
+        - max_tenants : budgets et dernières valeurs connues gardés en mémoire (LRU) ;
+          un budget oublié repart plein, comme celui d'un compte inactif
+        """
+        self.token = personal_access_token or os.getenv("OURA_TOKEN") or None
+        # URL de l'API, remplaçable (OURA_API_BASE_URL) pour viser un serveur de test local
+        self.base_url = base_url or os.getenv("OURA_API_BASE_URL", self.API_BASE_URL)
+        self.timeout = timeout
+        self.max_connections = max_connections
+        # Client HTTP asynchrone créé à la première requête (il doit vivre dans la boucle du bot)
+        self._async_client = None
+        # Cache des réponses : les données quotidiennes Oura changent peu dans la journée
+        self.cache = cache or TTLCache(
+            ttl=float(os.getenv("OURA_CACHE_TTL", 900)),
+            maxsize=int(os.getenv("OURA_CACHE_SIZE", 1024)),
+        )
+        # Une réponse vide (nuit pas encore synchronisée) est gardée moins longtemps
+        self.empty_ttl = empty_ttl
+        # Limite de débit globale, tentatives et disjoncteur partagés par tous les comptes
+        self.guard = get_guard("oura", rate=50.0, burst=100, max_concurrency=8)
+        self.deadline = deadline
+        self.token_rate = float(os.getenv("OURA_TOKEN_RATE", token_rate))
+        self.token_burst = int(os.getenv("OURA_TOKEN_BURST", token_burst))
+        self.max_tenants = max_tenants
+        # tenant_key -> TokenBucket, du moins au plus récemment utilisé
+        self._budgets = OrderedDict()
+        # (tenant_key, endpoint) -> dernière valeur non vide de afetch_latest,
+        # servie si l'API est trop lente
+        self._last_known = OrderedDict()
+
+    def for_token(self, token=None):
+        """
+        Vue du client pour le compte `token` (défaut : jeton global), ou None si
+        aucun jeton n'est disponible. La vue ne garde que le jeton : en créer une
+        par commande ne coûte rien.
+        """
+        token = token or self.token
+        return OuraTenant(self, token) if token else None
+
+    async def afor_user(self, dm, uid, executor=None):
+        """
+        Vue du compte Oura de l'utilisateur `uid` : son jeton (lu dans `dm` sur
+        `executor`, le déchiffrement bloque), sinon le jeton global ; None si aucun.
+        """
+        loop = asyncio.get_running_loop()
+        token = await loop.run_in_executor(executor, dm.get_setting, uid, OURA_TOKEN_SETTING)
+        return self.for_token(token)
+
+    def _budget(self, key):
+        bucket = self._budgets.get(key)
+        if bucket is None:
+            bucket = self._budgets[key] = TokenBucket(self.token_rate, self.token_burst)
+            if len(self._budgets) > self.max_tenants:
+                self._budgets.popitem(last=False)
+        else:
+            self._budgets.move_to_end(key)
+        return bucket
+
+    def _remember(self, key, endpoint, value):
+        self._last_known[(key, endpoint)] = value
+        self._last_known.move_to_end((key, endpoint))
+        while len(self._last_known) > self.max_tenants * len(self.LATEST_ENDPOINTS):
+            self._last_known.popitem(last=False)
+
+    def _auth(self, token):
+        token = token or self.token
+        if not token:
+            raise OuraAPIError("aucun jeton Oura (OURA_TOKEN ou /oura_token)")
+        return token, {"Authorization": f"Bearer {token}"}
 
     def _format_date(self, date_obj):
         return date_obj.strftime("%Y-%m-%d")
 
-    def _request(self, endpoint, params=None):
-        url = f"{self.API_BASE_URL}/{endpoint}"
-        resp = requests.get(url, headers=self.headers, params=params)
-        if resp.status_code == 200:
-            return resp.json().get("data", [])
-        print(f"Erreur Oura API {endpoint} : {resp.status_code} {resp.text}")
-        return []
-
-    def fetch_sleep_data_last_days(self, days=4):
+    def _last_days_params(self, days):
         today = datetime.today()
         start_date = today - timedelta(days=days)
-        params = {
+        return {
             "start_date": self._format_date(start_date),
             "end_date": self._format_date(today)
         }
-        return self._request("sleep", params=params)
+
+    def _cache_key(self, endpoint, params, token=None):
+        params = params or {}
+        return (tenant_key(token or self.token or ""), endpoint,
+                params.get("start_date"), params.get("end_date"))
+
+    def _cache_ttl(self, data):
+        return self.cache.ttl if data else self.empty_ttl
+
+    def _request(self, endpoint, params=None):
+        def load():
+            # Même format que _afetch (liste de documents, pages concaténées) :
+            # les deux modes partagent les entrées du cache
+            _, headers = self._auth(None)
+            url = f"{self.base_url}/{endpoint}"
+            data = []
+            page_params = dict(params or {})
+            while True:
+                started = time.perf_counter()
+                try:
+                    resp = requests.get(url, headers=headers, params=page_params, timeout=self.timeout)
+                except requests.RequestException:
+                    UPSTREAM_SECONDS.observe(time.perf_counter() - started, service="oura",
+                                             endpoint=endpoint, status="network_error")
+                    raise
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, service="oura",
+                                         endpoint=endpoint, status=resp.status_code)
+                if resp.status_code != 200:
+                    raise OuraAPIError(f"{resp.status_code} {resp.text}")
+                page = resp.json()
+                data.extend(page.get("data", []))
+                if not page.get("next_token"):
+                    return data
+                page_params["next_token"] = page["next_token"]
+
+        try:
+            return self.cache.get_or_load(self._cache_key(endpoint, params), load, ttl=self._cache_ttl)
+        except (OuraAPIError, requests.RequestException) as e:
+            print(f"Erreur Oura API {endpoint} : {e}")
+            return []
+
+    def fetch_sleep_data_last_days(self, days=4):
+        return self._request("sleep", params=self._last_days_params(days))
 
     def fetch_readiness_data_last_days(self, days=4):
-        today = datetime.today()
-        start_date = today - timedelta(days=days)
-        params = {
-            "start_date": self._format_date(start_date),
-            "end_date": self._format_date(today)
-        }
-        return self._request("readiness", params=params)
+        return self._request("readiness", params=self._last_days_params(days))
 
     def fetch_activity_data_last_days(self, days=4):
-        today = datetime.today()
-        start_date = today - timedelta(days=days)
+        return self._request("daily_activity", params=self._last_days_params(days))
+
+    # ---------------------- Mode asynchrone ----------------------
+    def _get_async_client(self):
+        """
+        Retourne le client httpx partagé, en le créant au besoin.
+        Toutes les requêtes, de tous les comptes, réutilisent les mêmes connexions keep-alive.
+        """
+        if self._async_client is None or self._async_client.is_closed:
+            # Sans en-tête d'authentification : le jeton est ajouté à chaque requête
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._async_client
+
+    async def _afetch(self, endpoint, params=None, token=None):
+        """
+        Requête HTTP (sans cache) protégée ; lève OuraAPIError en cas d'échec.
+        Les pages suivantes (next_token) sont récupérées et concaténées.
+        """
+        data = []
+        page_params = dict(params or {})
+        while True:
+            page = await self._afetch_page(endpoint, page_params, token)
+            data.extend(page.get("data", []))
+            if not page.get("next_token"):
+                return data
+            page_params["next_token"] = page["next_token"]
+
+    async def _afetch_page(self, endpoint, params, token=None):
+        token, headers = self._auth(token)
+        client = self._get_async_client()
+
+        async def attempt():
+            started = time.perf_counter()
+            try:
+                resp = await client.get(f"/{endpoint}", params=params, headers=headers)
+            except httpx.HTTPError as e:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, service="oura",
+                                         endpoint=endpoint, status="network_error")
+                raise RetryableError(repr(e)) from e
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, service="oura",
+                                     endpoint=endpoint, status=resp.status_code)
+            if resp.status_code == 429:
+                raise RateLimitedError(
+                    "429 Too Many Requests",
+                    retry_after=parse_retry_after(resp.headers.get("Retry-After")),
+                )
+            if resp.status_code >= 500:
+                raise RetryableError(f"{resp.status_code} {resp.text}")
+            if resp.status_code in (401, 403):
+                raise OuraAuthError(f"{resp.status_code} {resp.text}")
+            if resp.status_code != 200:
+                raise OuraAPIError(f"{resp.status_code} {resp.text}")
+            return resp.json()
+
+        # Budget du compte consommé avant la protection partagée : un compte qui
+        # dépasse le sien attend seul, sans compter comme une panne d'Oura
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._budget(tenant_key(token)).acquire(), self.deadline)
+        except asyncio.TimeoutError:
+            raise OuraAPIError("budget de requêtes du compte Oura épuisé") from None
+        try:
+            return await self.guard.call(attempt, deadline=self.deadline - (time.monotonic() - started))
+        except UpstreamError as e:
+            raise OuraAPIError(str(e)) from e
+
+    async def _acached(self, endpoint, params=None, token=None):
+        """Comme _afetch, à travers le cache ; lève OuraAPIError en cas d'échec."""
+        return await self.cache.aget_or_load(
+            self._cache_key(endpoint, params, token),
+            lambda: self._afetch(endpoint, params, token),
+            ttl=self._cache_ttl,
+        )
+
+    async def _arequest(self, endpoint, params=None, token=None):
+        try:
+            return await self._acached(endpoint, params, token)
+        except OuraAPIError as e:
+            print(f"Erreur Oura API {endpoint} : {e}")
+            return []
+
+    async def avalidate(self, token):
+        """
+        Vérifie un jeton auprès d'Oura (endpoint personal_info).
+        Retourne False si Oura le refuse ; lève OuraAPIError si l'API ne répond pas.
+        """
+        try:
+            await self._afetch_page("personal_info", {}, token)
+        except OuraAuthError:
+            return False
+        return True
+
+    async def afetch_sleep_data_last_days(self, days=4, token=None):
+        return await self._arequest("sleep", params=self._last_days_params(days), token=token)
+
+    async def afetch_readiness_data_last_days(self, days=4, token=None):
+        return await self._arequest("readiness", params=self._last_days_params(days), token=token)
+
+    async def afetch_activity_data_last_days(self, days=4, token=None):
+        return await self._arequest("daily_activity", params=self._last_days_params(days), token=token)
+
+    async def afetch_range(self, endpoint, start_date, end_date, token=None):
+        """
+        Récupère les documents d'un endpoint entre deux dates (objets date).
+        Lève OuraAPIError en cas d'échec : une réponse vide n'est pas une erreur
+        (ex : historique local, voir OuraTimeSeriesStore.sync).
+        """
         params = {
             "start_date": self._format_date(start_date),
-            "end_date": self._format_date(today)
+            "end_date": self._format_date(end_date)
         }
-        return self._request("daily_activity", params=params) 
+        return await self._acached(endpoint, params=params, token=token)
+
+    LATEST_ENDPOINTS = ("sleep", "readiness", "daily_activity")
+
+    async def afetch_latest(self, days=1, timeout=None, token=None):
+        """
+        Récupère sommeil, readiness et activité en parallèle (une requête chacun)
+        et retourne le premier élément de chaque série, ou {} si vide.
+
+        - timeout : délai maximal (s). Passé ce délai, une série non reçue est
+          remplacée par sa dernière valeur connue (cache, même expiré) ou {} ;
+          la requête continue en arrière-plan et réchauffe le cache.
+        """
+        params = self._last_days_params(days)
+        key = tenant_key(token or self.token or "")
+        tasks = [
+            asyncio.ensure_future(self._arequest(endpoint, params=params, token=token))
+            for endpoint in self.LATEST_ENDPOINTS
+        ]
+        if timeout is None:
+            await asyncio.gather(*tasks)
+        else:
+            await asyncio.wait(tasks, timeout=timeout)
+
+        latest = []
+        for endpoint, task in zip(self.LATEST_ENDPOINTS, tasks):
+            data = task.result() if task.done() else None
+            if data:
+                self._remember(key, endpoint, data[0])
+                latest.append(data[0])
+                continue
+            stale = self.cache.get_stale(self._cache_key(endpoint, params, token))
+            latest.append(stale[0] if stale else self._last_known.get((key, endpoint), {}))
+        return tuple(latest)
+
+    async def aclose(self):
+        """Ferme le pool de connexions asynchrone (à appeler à l'arrêt du bot)."""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def cache_stats(self):
+        """Compteurs du cache Oura (hits, misses, requêtes fusionnées...)."""
+        return dict(self.cache.stats(), tenants=len(self._budgets))
+
+
+class OuraTenant:
+    """
+    Vue d'OuraClient pour un compte : mêmes méthodes asynchrones, avec le jeton
+    du compte. Pool de connexions, cache et protections restent ceux du client.
+    """
+
+    __slots__ = ("client", "token", "key")
+
+    def __init__(self, client, token):
+        self.client = client
+        self.token = token
+        self.key = tenant_key(token)
+
+    @property
+    def cache(self):
+        return self.client.cache
+
+    async def afetch_sleep_data_last_days(self, days=4):
+        return await self.client.afetch_sleep_data_last_days(days, token=self.token)
+
+    async def afetch_readiness_data_last_days(self, days=4):
+        return await self.client.afetch_readiness_data_last_days(days, token=self.token)
+
+    async def afetch_activity_data_last_days(self, days=4):
+        return await self.client.afetch_activity_data_last_days(days, token=self.token)
+
+    async def afetch_range(self, endpoint, start_date, end_date):
+        return await self.client.afetch_range(endpoint, start_date, end_date, token=self.token)
+
+    async def afetch_latest(self, days=1, timeout=None):
+        return await self.client.afetch_latest(days, timeout, token=self.token)
@@ -0,0 +1,215 @@
+import asyncio
+import time
+from collections import Counter
+from datetime import datetime
+
+
+class OuraPrefetcher:
+    """
+    Préchauffe les données Oura avant que les utilisateurs en aient besoin.
+
+    ✔ Apprend les heures habituelles de chaque utilisateur à partir des heures
+      de son journal (et de ses commandes suivantes), par créneaux de `slot_minutes`
+    ✔ Un seul job JobQueue, qui tourne chaque minute : le plan « minute -> utilisateurs »
+      est indexé par minute, un tick ne regarde que les minutes écoulées
+    ✔ Les préchauffages d'un même tick sont étalés de `spacing` secondes et
+      dédupliqués par compte Oura (des utilisateurs du jeton global partagent
+      les mêmes données) pour respecter les limites de débit
+    ✔ Synchronisation du matin : les données de la nuit sont définitives, l'historique
+      local de chaque compte actif est mis à jour avant les premières commandes
+    """
+
+    def __init__(self, dm, oura, oura_stores=None, executor=None, slot_minutes=30,
+                 lead_minutes=10, min_count=3, min_share=0.15, max_slots=3,
+                 history=60, spacing=2.0, morning="07:00"):
+        """
+        - dm : UserDataManager (lecture des heures du journal et du jeton Oura)
+        - oura / oura_stores : client Oura et historiques locaux (OuraStoreRegistry) à préchauffer
+        - slot_minutes : largeur des créneaux horaires appris
+        - lead_minutes : avance du préchauffage sur le début du créneau
+        - min_count / min_share : un créneau est retenu s'il regroupe au moins
+          `min_count` entrées et `min_share` de l'activité de l'utilisateur
+        - max_slots : nombre maximal de créneaux retenus par utilisateur
+        - history : nombre d'entrées de journal récentes prises en compte
+        - spacing : écart (s) entre deux préchauffages déclenchés au même moment
+        - morning : heure ("HH:MM") de la synchronisation quotidienne de l'historique
+        """
+        self.dm = dm
+        self.oura = oura
+        self.oura_stores = oura_stores
+        self.executor = executor
+        self.slot_minutes = slot_minutes
+        self.lead_minutes = lead_minutes
+        self.min_count = min_count
+        self.min_share = min_share
+        self.max_slots = max_slots
+        self.history = history
+        self.spacing = spacing
+        self.morning = datetime.strptime(morning, "%H:%M").time()
+        # uid -> Counter(créneau -> nombre d'entrées)
+        self._profiles = {}
+        # uid -> minutes de préchauffage retenues ; minute du jour -> uids
+        self._slots = {}
+        self._plan = {}
+        self._learning = set()
+        self._last_tick = None
+        # compte Oura (tenant_key) -> date du dernier préchauffage
+        self._warmed_at = {}
+        self.warmups = 0
+        self.skipped = 0
+
+    # ---------------------- Apprentissage ----------------------
+    def _slot(self, moment):
+        return (moment.hour * 60 + moment.minute) // self.slot_minutes
+
+    def learn(self, uid, journal):
+        """(Re)calcule le profil horaire de `uid` depuis les heures de son journal."""
+        profile = Counter()
+        for entry in journal[-self.history:]:
+            try:
+                moment = datetime.strptime(entry["time"], "%H:%M")
+            except (KeyError, TypeError, ValueError):
+                continue  # entrée ancienne, sans heure
+            profile[self._slot(moment)] += 1
+        self._profiles[uid] = profile
+        self._replan(uid)
+
+    def record(self, uid, moment=None):
+        """Ajoute une commande de `uid` (à `moment`, défaut : maintenant) à son profil."""
+        profile = self._profiles.get(uid)
+        if profile is None:
+            return
+        profile[self._slot(moment or datetime.now())] += 1
+        self._replan(uid)
+
+    def _replan(self, uid):
+        profile = self._profiles[uid]
+        total = sum(profile.values())
+        threshold = max(self.min_count, self.min_share * total)
+        minutes = {
+            (slot * self.slot_minutes - self.lead_minutes) % 1440
+            for slot, count in profile.most_common(self.max_slots) if count >= threshold
+        }
+        for minute in self._slots.pop(uid, ()):
+            users = self._plan.get(minute)
+            if users is not None:
+                users.discard(uid)
+                if not users:
+                    del self._plan[minute]
+        if minutes:
+            self._slots[uid] = minutes
+            for minute in minutes:
+                self._plan.setdefault(minute, set()).add(uid)
+
+    async def observe(self, update, context):
+        """
+        Handler placé avant tous les autres (groupe -1) : apprend le profil d'un
+        utilisateur à sa première commande, puis ajoute chaque commande au profil
+        (les messages de conversation ne sont pas comptés).
+        """
+        user = update.effective_user
+        message = update.message
+        if user is None or message is None or not (message.text or "").startswith("/"):
+            return
+        uid = str(user.id)
+        if uid in self._profiles:
+            self.record(uid)
+            return
+        if uid in self._learning:
+            return
+        self._learning.add(uid)
+        try:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(self.executor, self.dm.get_user, uid)
+            self.learn(uid, data["journal"])
+        finally:
+            self._learning.discard(uid)
+
+    def forget(self, uid):
+        """Oublie le profil de `uid` (ex : après /delete)."""
+        if uid in self._profiles:
+            self._profiles[uid] = Counter()
+            self._replan(uid)
+
+    def due(self, since, until):
+        """Utilisateurs dont un préchauffage tombe dans les minutes ]since, until]."""
+        users = set()
+        minute = since
+        while minute != until:
+            minute = (minute + 1) % 1440
+            users |= self._plan.get(minute, set())
+        return users
+
+    # ---------------------- Préchauffage ----------------------
+    async def warm(self, uid):
+        """
+        Charge dans le cache les données utilisées par /ressenti et /oura_ring_4j.
+        Un préchauffage récent du même compte Oura suffit pour tous ses utilisateurs.
+        """
+        account = await self.oura.afor_user(self.dm, uid, self.executor)
+        if account is None:
+            return
+        if time.monotonic() - self._warmed_at.get(account.key, float("-inf")) < self.oura.cache.ttl / 2:
+            self.skipped += 1
+            return
+        self._warmed_at[account.key] = time.monotonic()
+        self.warmups += 1
+        await account.afetch_latest(1)
+        if self.oura_stores is not None:
+            store = await self.oura_stores.aget(account.key)
+            await store.sync(account)
+
+    async def _tick(self, context):
+        now = datetime.now()
+        minute = now.hour * 60 + now.minute
+        since = self._last_tick if self._last_tick is not None else (minute - 1) % 1440
+        self._last_tick = minute
+        # Les préchauffages trop anciens pour dédupliquer quoi que ce soit sont oubliés
+        horizon = time.monotonic() - self.oura.cache.ttl / 2
+        self._warmed_at = {key: at for key, at in self._warmed_at.items() if at >= horizon}
+        for i, uid in enumerate(sorted(self.due(since, minute))):
+            # Étalement : un préchauffage toutes les `spacing` secondes
+            context.job_queue.run_once(self._warm_job, i * self.spacing, data=uid)
+
+    async def _warm_job(self, context):
+        try:
+            await self.warm(context.job.data)
+        except Exception as e:
+            print(f"Préchauffage Oura échoué : {e}")
+
+    async def _morning_sync(self, context):
+        """Programme une synchronisation par compte Oura des utilisateurs connus, étalées."""
+        if self.oura_stores is None:
+            return
+        # Le compte global d'abord, même si aucun utilisateur n'a encore de profil
+        default = self.oura.for_token()
+        accounts = {default.key: default} if default is not None else {}
+        for uid in list(self._profiles):
+            account = await self.oura.afor_user(self.dm, uid, self.executor)
+            if account is not None:
+                accounts.setdefault(account.key, account)
+        for i, account in enumerate(accounts.values()):
+            context.job_queue.run_once(self._sync_job, i * self.spacing, data=account)
+
+    async def _sync_job(self, context):
+        account = context.job.data
+        try:
+            store = await self.oura_stores.aget(account.key)
+            await store.sync(account, force=True)
+        except Exception as e:
+            print(f"Synchronisation Oura du matin échouée : {e}")
+
+    def schedule(self, job_queue):
+        """Enregistre le tick minute et la synchronisation du matin dans la JobQueue."""
+        job_queue.run_repeating(self._tick, interval=60, first=60 - datetime.now().second)
+        # Heure locale du serveur, comme les heures du journal
+        local_tz = datetime.now().astimezone().tzinfo
+        job_queue.run_daily(self._morning_sync, self.morning.replace(tzinfo=local_tz))
+
+    def stats(self):
+        return {
+            "users": len(self._profiles),
+            "planned_minutes": len(self._plan),
+            "warmups": self.warmups,
+            "skipped": self.skipped,
+        }
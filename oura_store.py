@@ -0,0 +1,385 @@
+import asyncio
+import base64
+import json
+import math
+import os
+import time
+from array import array
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from userdata import _atomic_write
+
+NAN = float("nan")
+
+
+class OuraTimeSeriesStore:
+    """
+    Stockage local des métriques quotidiennes Oura, en colonnes.
+
+    ✔ Une colonne `array('d')` par métrique, une ligne par jour consécutif
+      (jour manquant = NaN) : accès à un jour en O(1), fenêtre = simple tranche
+    ✔ Synchronisation incrémentale : seuls les jours depuis le dernier jour
+      stocké sont redemandés à l'API (le dernier jour est relu, il peut encore changer)
+    ✔ Fenêtres arbitraires (30/90/365 jours), moyennes glissantes et tendances
+      calculées localement, sans appel API
+    ✔ Sauvegardé chiffré (Fernet) dans un seul fichier compact
+    """
+
+    # colonne -> (endpoint Oura, fonction d'extraction depuis un document)
+    COLUMNS = {
+        "total_sleep_duration": ("sleep", lambda d: d.get("total_sleep_duration")),
+        "deep_sleep_duration": ("sleep", lambda d: d.get("deep_sleep_duration")),
+        "rem_sleep_duration": ("sleep", lambda d: d.get("rem_sleep_duration")),
+        "light_sleep_duration": ("sleep", lambda d: d.get("light_sleep_duration")),
+        "average_heart_rate": ("sleep", lambda d: d.get("average_heart_rate")),
+        "average_hrv": ("sleep", lambda d: d.get("average_hrv")),
+        "temperature_deviation": ("sleep", lambda d: (d.get("readiness") or {}).get("temperature_deviation")),
+        "readiness_score": ("readiness", lambda d: d.get("score")),
+        "activity_score": ("daily_activity", lambda d: d.get("score")),
+        "steps": ("daily_activity", lambda d: d.get("steps")),
+    }
+    ENDPOINTS = ("sleep", "readiness", "daily_activity")
+
+    def __init__(self, path='oura_store.enc', cipher=None, backfill_days=90, min_sync_interval=900,
+                 executor=None):
+        """
+        - path : fichier chiffré de sauvegarde
+        - cipher : objet Fernet (ex : UserDataManager.cipher) ; None = pas de sauvegarde
+        - backfill_days : historique récupéré lors de la première synchronisation
+          (complété à la demande, voir sync)
+        - min_sync_interval : délai minimal (s) entre deux synchronisations
+        - executor : pool de threads des sauvegardes (None = pool par défaut d'asyncio)
+        """
+        self.path = path
+        self.cipher = cipher
+        self.executor = executor
+        self.backfill_days = backfill_days
+        self.min_sync_interval = min_sync_interval
+        self.first_day = None  # ordinal du premier jour stocké
+        self.columns = {name: array('d') for name in self.COLUMNS}
+        self.synced_at = 0.0
+        self._sync_lock = asyncio.Lock()
+        self._load()
+
+    # ---------------------- Persistance ----------------------
+    def _load(self):
+        if self.cipher is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                raw = json.loads(self.cipher.decrypt(f.read()))
+        except Exception:
+            print("Stockage Oura illisible : il sera resynchronisé")
+            return
+        self.first_day = raw["first_day"]
+        for name in self.COLUMNS:
+            col = array('d')
+            col.frombytes(base64.b64decode(raw["columns"].get(name, "")))
+            self.columns[name] = col
+        # Colonnes ajoutées depuis la sauvegarde : remplies de NaN
+        n = len(self)
+        for col in self.columns.values():
+            col.extend([NAN] * (n - len(col)))
+
+    def save(self):
+        """Chiffre et écrit le stockage de façon atomique."""
+        if self.cipher is None:
+            return
+        payload = {
+            "first_day": self.first_day,
+            "columns": {name: base64.b64encode(col.tobytes()).decode() for name, col in self.columns.items()},
+        }
+        _atomic_write(self.path, self.cipher.encrypt(json.dumps(payload).encode()))
+
+    def __len__(self):
+        return max((len(col) for col in self.columns.values()), default=0)
+
+    @property
+    def last_day(self):
+        """Ordinal du dernier jour stocké (None si vide)."""
+        return self.first_day + len(self) - 1 if self.first_day is not None and len(self) else None
+
+    # ---------------------- Synchronisation ----------------------
+    def _ensure_day(self, ordinal):
+        """Agrandit les colonnes (NaN) pour couvrir le jour `ordinal`, retourne son indice."""
+        if self.first_day is None:
+            self.first_day = ordinal
+        if ordinal < self.first_day:
+            pad = [NAN] * (self.first_day - ordinal)
+            for name, col in self.columns.items():
+                self.columns[name] = array('d', pad) + col
+            self.first_day = ordinal
+        missing = ordinal - self.first_day + 1 - len(self)
+        if missing > 0:
+            for col in self.columns.values():
+                col.extend([NAN] * missing)
+        return ordinal - self.first_day
+
+    def ingest(self, endpoint, documents):
+        """
+        Range des documents Oura dans les colonnes. Pour le sommeil, la période la
+        plus longue de la journée est retenue (la nuit plutôt qu'une sieste).
+        """
+        best = {}
+        for doc in documents:
+            day = doc.get("day")
+            if not day:
+                continue
+            if endpoint == "sleep" and day in best:
+                if (doc.get("total_sleep_duration") or 0) <= (best[day].get("total_sleep_duration") or 0):
+                    continue
+            best[day] = doc
+        for day, doc in best.items():
+            i = self._ensure_day(date.fromisoformat(day).toordinal())
+            for name, (source, extract) in self.COLUMNS.items():
+                if source == endpoint:
+                    value = extract(doc)
+                    self.columns[name][i] = float(value) if isinstance(value, (int, float)) else NAN
+
+    async def sync(self, oura, force=False, days=None):
+        """
+        Récupère auprès d'Oura les jours manquants (depuis le dernier jour stocké),
+        puis sauvegarde. Ne fait rien si la dernière synchronisation est récente.
+        - days : historique voulu (ex : fenêtre de /tendances) ; s'il commence avant
+          le premier jour stocké, les jours manquants sont récupérés une fois,
+          même si la dernière synchronisation est récente
+        Retourne le nombre d'endpoints mis à jour. Si une requête échoue, l'erreur
+        (OuraAPIError) est propagée et rien n'est enregistré : la synchronisation
+        suivante redemande les mêmes jours.
+        """
+        async with self._sync_lock:
+            today = date.today()
+            due = force or time.monotonic() - self.synced_at >= self.min_sync_interval
+            ranges = []  # (premier jour, dernier jour) à demander
+            if self.last_day is None:
+                if due:
+                    ranges.append((today - timedelta(days=max(self.backfill_days, days or 0)), today))
+            else:
+                oldest = today - timedelta(days=(days or 1) - 1)
+                if oldest.toordinal() < self.first_day:
+                    ranges.append((oldest, date.fromordinal(self.first_day - 1)))
+                if due:
+                    ranges.append((min(today, date.fromordinal(self.last_day) - timedelta(days=1)), today))
+            if not ranges:
+                return 0
+            requests = [(endpoint, start, end) for start, end in ranges for endpoint in self.ENDPOINTS]
+            results = await asyncio.gather(*(
+                oura.afetch_range(endpoint, start, end + timedelta(days=1))
+                for endpoint, start, end in requests
+            ))
+            first_day = self.first_day
+            updated = set()
+            for (endpoint, _, _), documents in zip(requests, results):
+                if documents:
+                    self.ingest(endpoint, documents)
+                    updated.add(endpoint)
+            # Jours demandés sans données : couverts quand même (NaN), pour ne pas les redemander
+            self._ensure_day(min(start for start, _ in ranges).toordinal())
+            if updated or self.first_day != first_day:
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.save)
+            if due:
+                self.synced_at = time.monotonic()
+            return len(updated)
+
+    # ---------------------- Lecture ----------------------
+    def _window(self, days, end=None):
+        """Indices [lo, hi) des `days` derniers jours jusqu'à `end` (défaut : dernier jour stocké)."""
+        if self.last_day is None:
+            return 0, 0
+        end = self.last_day if end is None else min(end, self.last_day)
+        hi = end - self.first_day + 1
+        return max(0, hi - days), max(0, hi)
+
+    def last_days(self, days=4):
+        """
+        Retourne les `days` derniers jours au format des documents "sleep" d'Oura
+        (clés absentes quand la valeur manque), du plus ancien au plus récent.
+        """
+        lo, hi = self._window(days)
+        rows = []
+        for i in range(lo, hi):
+            row = {"day": date.fromordinal(self.first_day + i).isoformat()}
+            for name, col in self.columns.items():
+                value = col[i]
+                if math.isnan(value):
+                    continue
+                if name == "temperature_deviation":
+                    row["readiness"] = {"temperature_deviation": value}
+                elif name in ("average_heart_rate", "steps") or name.endswith("_score"):
+                    row[name] = round(value)
+                else:
+                    row[name] = value
+            rows.append(row)
+        return rows
+
+    def series(self, name, days):
+        """Tranche (array) de la colonne `name` sur les `days` derniers jours."""
+        lo, hi = self._window(days)
+        return self.columns[name][lo:hi]
+
+    @staticmethod
+    def rolling_mean(values, window):
+        """
+        Moyenne glissante sur `window` jours, en ignorant les NaN, calculée en
+        une passe grâce à des sommes cumulées. Retourne un array de même longueur.
+        """
+        sums = array('d', [0.0])
+        counts = array('l', [0])
+        for v in values:
+            ok = not math.isnan(v)
+            sums.append(sums[-1] + (v if ok else 0.0))
+            counts.append(counts[-1] + ok)
+        out = array('d')
+        for i in range(1, len(values) + 1):
+            j = max(0, i - window)
+            n = counts[i] - counts[j]
+            out.append((sums[i] - sums[j]) / n if n else NAN)
+        return out
+
+    @staticmethod
+    def trend(values):
+        """
+        Pente de la droite des moindres carrés (unité par jour), NaN ignorés.
+        Retourne None s'il y a moins de deux points.
+        """
+        n = sx = sy = sxx = sxy = 0.0
+        for x, y in enumerate(values):
+            if math.isnan(y):
+                continue
+            n += 1
+            sx += x
+            sy += y
+            sxx += x * x
+            sxy += x * y
+        denom = n * sxx - sx * sx
+        if n < 2 or denom == 0:
+            return None
+        return (n * sxy - sx * sy) / denom
+
+    def summary(self, name, days, rolling=7):
+        """
+        Statistiques d'une métrique sur `days` jours : moyenne, dernière moyenne
+        glissante sur `rolling` jours, tendance (par semaine), nombre de jours mesurés.
+        """
+        values = self.series(name, days)
+        measured = [v for v in values if not math.isnan(v)]
+        roll = self.rolling_mean(values, rolling)
+        slope = self.trend(values)
+        return {
+            "days": len(measured),
+            "mean": sum(measured) / len(measured) if measured else None,
+            "rolling": roll[-1] if roll and not math.isnan(roll[-1]) else None,
+            "trend_per_week": slope * 7 if slope is not None else None,
+        }
+
+
+class OuraStoreRegistry:
+    """
+    Historiques Oura de tous les comptes : un OuraTimeSeriesStore par compte
+    (oura_client.tenant_key), chacun dans son fichier chiffré `directory/<compte>.enc`.
+
+    ✔ Chargés à la demande ; au plus `max_resident` gardés en mémoire (LRU) :
+      la mémoire ne grandit pas avec le nombre de comptes enregistrés
+    ✔ Un historique évincé a déjà été sauvegardé à sa dernière synchronisation
+    ✔ Depuis la boucle asyncio (aget / adrop) : lecture, déchiffrement et suppression
+      des fichiers sur `executor`, le registre n'est modifié que dans la boucle
+    """
+
+    def __init__(self, directory='oura_store.d', cipher=None, max_resident=128, executor=None,
+                 **store_options):
+        """
+        - directory : répertoire des fichiers chiffrés, un par compte
+        - max_resident : nombre maximal d'historiques gardés en mémoire
+        - executor : pool de threads des lectures et suppressions de fichiers (aget / adrop)
+        - store_options : transmis à OuraTimeSeriesStore (backfill_days, min_sync_interval)
+        """
+        self.directory = directory
+        self.cipher = cipher
+        self.max_resident = max_resident
+        self.executor = executor
+        self.store_options = store_options
+        # compte -> OuraTimeSeriesStore, du moins au plus récemment utilisé
+        self._stores = OrderedDict()
+        # compte -> chargement en cours (aget), partagé par les appels simultanés
+        self._loading = {}
+        self.loads = 0
+        self.evictions = 0
+        if cipher is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.enc")
+
+    def _open(self, key):
+        return OuraTimeSeriesStore(self._path(key), self.cipher, executor=self.executor, **self.store_options)
+
+    def _resident(self, key):
+        store = self._stores.get(key)
+        if store is not None:
+            self._stores.move_to_end(key)
+        return store
+
+    def _insert(self, key, store):
+        self.loads += 1
+        self._stores[key] = store
+        if len(self._stores) > self.max_resident:
+            self._stores.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key):
+        """Historique du compte `key`, chargé depuis son fichier au premier accès (hors boucle asyncio)."""
+        store = self._resident(key)
+        if store is None:
+            store = self._open(key)
+            self._insert(key, store)
+        return store
+
+    async def aget(self, key):
+        """Comme get, depuis la boucle asyncio : un seul chargement par compte, sur `executor`."""
+        store = self._resident(key)
+        if store is not None:
+            return store
+        loading = self._loading.get(key)
+        if loading is None:
+            loading = self._loading[key] = asyncio.ensure_future(self._aload(key))
+        # shield : un appelant annulé n'interrompt pas le chargement des autres
+        return await asyncio.shield(loading)
+
+    async def _aload(self, key):
+        task = asyncio.current_task()
+        try:
+            store = await asyncio.get_running_loop().run_in_executor(self.executor, self._open, key)
+        finally:
+            # Chargement toujours en cours à sa fin, sauf si adrop l'a abandonné entre-temps
+            current = self._loading.get(key) is task
+            if current:
+                del self._loading[key]
+        if current:
+            self._insert(key, store)
+        else:
+            store.cipher = None  # compte supprimé : cet historique ne doit plus être écrit
+        return store
+
+    def _forget(self, key):
+        self._loading.pop(key, None)
+        store = self._stores.pop(key, None)
+        if store is not None:
+            store.cipher = None  # une synchronisation en cours ne recrée pas le fichier
+
+    def _remove_file(self, key):
+        if os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+    def drop(self, key):
+        """Oublie l'historique du compte `key`, en mémoire et sur disque (hors boucle asyncio)."""
+        self._forget(key)
+        self._remove_file(key)
+
+    async def adrop(self, key):
+        """Comme drop, depuis la boucle asyncio : fichier supprimé sur `executor`."""
+        self._forget(key)
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._remove_file, key)
+
+    def stats(self):
+        return {"resident": len(self._stores), "loads": self.loads, "evictions": self.evictions}
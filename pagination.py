@@ -0,0 +1,50 @@
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import MessageLimit
+
+# Entrées par page et longueur maximale affichée par entrée :
+# 10 x 350 caractères restent sous la limite de 4096 caractères d'un message
+PER_PAGE = 10
+MAX_ENTRY_CHARS = 350
+
+
+def page_count(total, per_page=PER_PAGE):
+    return max(1, -(-total // per_page))
+
+
+def clamp_page(page, total, per_page=PER_PAGE):
+    """Ramène `page` dans les pages existantes (le journal a pu changer entre-temps)."""
+    return min(max(0, page), page_count(total, per_page) - 1)
+
+
+def newest_first(entries, page, per_page=PER_PAGE):
+    """
+    Entrées de la page `page` (0 = les plus récentes), de la plus récente à la plus
+    ancienne, lues directement par position dans `entries` (ordre chronologique).
+    """
+    hi = len(entries) - page * per_page
+    lo = max(0, hi - per_page)
+    return entries[lo:hi][::-1] if hi > 0 else []
+
+
+def render_page(title, entries, page, total, per_page=PER_PAGE):
+    """Texte d'une page : seules les entrées de cette page sont mises en forme."""
+    lines = [f"{title} - page {page + 1}/{page_count(total, per_page)} ({total} au total)"]
+    for e in entries:
+        text = e['text']
+        if len(text) > MAX_ENTRY_CHARS:
+            text = text[:MAX_ENTRY_CHARS - 1] + "…"
+        lines.append(f"{e['date']}: {text}")
+    return "\n".join(lines)[:MessageLimit.MAX_TEXT_LENGTH]
+
+
+def page_keyboard(kind, page, total, per_page=PER_PAGE):
+    """
+    Boutons de navigation ; le callback "pg:<kind>:<page>" ne transporte que
+    le numéro de page (pas de contenu).
+    """
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("« Plus récents", callback_data=f"pg:{kind}:{page - 1}"))
+    if page < page_count(total, per_page) - 1:
+        buttons.append(InlineKeyboardButton("Plus anciens »", callback_data=f"pg:{kind}:{page + 1}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
@@ -0,0 +1,162 @@
+import asyncio
+import heapq
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+
+from userdata import _atomic_write
+
+
+class ReminderScheduler:
+    """
+    Rappels d'examens et d'événements, envoyés via la JobQueue.
+
+    ✔ Un seul tas (heapq) de rappels triés par échéance, tous utilisateurs confondus
+    ✔ Un seul job JobQueue, programmé pour le prochain rappel : aucun parcours
+      périodique des utilisateurs
+    ✔ Rappels sauvegardés chiffrés : ils survivent à un redémarrage du bot
+    """
+
+    LABELS = {"agenda": "📅 Événement", "exams": "📚 Examen"}
+
+    def __init__(self, path='reminders.enc', cipher=None, executor=None,
+                 days_before=(1, 0), at="08:00"):
+        """
+        - path : fichier chiffré des rappels en attente
+        - cipher : objet Fernet (ex : UserDataManager.cipher) ; None = pas de sauvegarde
+        - days_before : rappels envoyés N jours avant la date (0 = le jour même)
+        - at : heure ("HH:MM", heure locale du serveur) d'envoi des rappels
+        """
+        self.path = path
+        self.cipher = cipher
+        self.executor = executor
+        self.days_before = days_before
+        self.at = datetime.strptime(at, "%H:%M").time()
+        # (échéance timestamp, uid, type, date ISO, description, jours avant)
+        self._heap = []
+        self._keys = set()
+        self._job_queue = None
+        self._job = None
+        self._job_at = None
+        self.sent = 0
+        self._load()
+
+    # ---------------------- Persistance ----------------------
+    def _load(self):
+        if self.cipher is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                entries = json.loads(self.cipher.decrypt(f.read()))
+        except Exception:
+            print("Rappels illisibles : ils seront recréés à la prochaine consultation")
+            return
+        self._heap = [tuple(e) for e in entries]
+        heapq.heapify(self._heap)
+        self._keys = {e[1:] for e in self._heap}
+
+    def save(self):
+        """Chiffre et écrit les rappels en attente de façon atomique."""
+        if self.cipher is None:
+            return
+        _atomic_write(self.path, self.cipher.encrypt(json.dumps(self._heap).encode()))
+
+    async def _asave(self):
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.save)
+
+    # ---------------------- Programmation ----------------------
+    async def add(self, uid, kind, items):
+        """
+        Programme les rappels des éléments `items` ((date ISO, description)) de `uid`.
+        Les rappels déjà connus ou dont l'échéance est passée sont ignorés.
+        """
+        now = time.time()
+        added = False
+        for day, description in items:
+            if day is None:
+                continue
+            for before in self.days_before:
+                due = datetime.combine(date.fromisoformat(day) - timedelta(days=before), self.at)
+                key = (uid, kind, day, description, before)
+                if due.timestamp() <= now or key in self._keys:
+                    continue
+                heapq.heappush(self._heap, (due.timestamp(),) + key)
+                self._keys.add(key)
+                added = True
+        if added:
+            await self._asave()
+            self._arm()
+
+    async def forget(self, uid):
+        """Supprime tous les rappels de `uid` (ex : après /delete)."""
+        kept = [e for e in self._heap if e[1] != uid]
+        if len(kept) == len(self._heap):
+            return
+        heapq.heapify(kept)
+        self._heap = kept
+        self._keys = {e[1:] for e in kept}
+        await self._asave()
+        self._arm()
+
+    def take(self, moved):
+        """
+        Retire et retourne les rappels des utilisateurs pour lesquels `moved(uid)` est vrai
+        (rééquilibrage entre workers, avant le démarrage : rien n'est sauvegardé ici).
+        """
+        taken = [e for e in self._heap if moved(e[1])]
+        if taken:
+            self._heap = [e for e in self._heap if not moved(e[1])]
+            heapq.heapify(self._heap)
+            self._keys = {e[1:] for e in self._heap}
+        return taken
+
+    def put(self, entries):
+        """Ajoute des rappels retirés d'un autre planificateur par take() (doublons ignorés)."""
+        for entry in entries:
+            entry = tuple(entry)
+            if entry[1:] not in self._keys:
+                heapq.heappush(self._heap, entry)
+                self._keys.add(entry[1:])
+
+    def _arm(self):
+        """(Re)programme l'unique job sur l'échéance la plus proche."""
+        if self._job_queue is None:
+            return
+        next_at = self._heap[0][0] if self._heap else None
+        if next_at == self._job_at:
+            return
+        if self._job is not None:
+            self._job.schedule_removal()
+            self._job = None
+        self._job_at = next_at
+        if next_at is not None:
+            self._job = self._job_queue.run_once(self._fire, max(0.0, next_at - time.time()))
+
+    async def _fire(self, context):
+        self._job = self._job_at = None
+        now = time.time()
+        today = date.today().isoformat()
+        while self._heap and self._heap[0][0] <= now:
+            _, uid, kind, day, description, before = heapq.heappop(self._heap)
+            self._keys.discard((uid, kind, day, description, before))
+            if day < today:
+                continue  # bot arrêté au moment prévu : l'échéance est passée
+            when = {0: "aujourd'hui", 1: "demain"}.get(before, f"dans {before} jours")
+            text = (f"⏰ Rappel - {self.LABELS[kind]} {when} "
+                    f"({date.fromisoformat(day).strftime('%d-%m-%Y')}) : {description}")
+            try:
+                await context.bot.send_message(chat_id=int(uid), text=text)
+                self.sent += 1
+            except Exception as e:
+                print(f"Rappel non envoyé à {uid} : {e}")
+        await self._asave()
+        self._arm()
+
+    def start(self, job_queue):
+        """Branche le planificateur sur la JobQueue et programme le prochain rappel."""
+        self._job_queue = job_queue
+        self._arm()
+
+    def stats(self):
+        return {"pending": len(self._heap), "sent": self.sent}
@@ -0,0 +1,314 @@
+import asyncio
+import os
+import random
+import time
+
+
+class UpstreamError(Exception):
+    """Échec d'un appel à un service externe (Oura, Cohere) après protections."""
+
+
+class RetryableError(UpstreamError):
+    """
+    Erreur transitoire (réseau, 5xx, 429) : l'appel peut être retenté.
+    - retry_after : délai (s) demandé par le serveur, s'il est connu
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitedError(RetryableError):
+    """Le service a répondu 429 (trop de requêtes)."""
+
+
+class CircuitOpenError(UpstreamError):
+    """Le disjoncteur est ouvert : le service est considéré indisponible."""
+
+
+class DeadlineExceeded(UpstreamError):
+    """Le délai global de l'appel (attente + tentatives) est écoulé."""
+
+
+def parse_retry_after(value):
+    """Lit un en-tête Retry-After exprimé en secondes (None si absent ou illisible)."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Seau à jetons : au plus `rate` requêtes par seconde en régime établi,
+    avec des rafales jusqu'à `burst` requêtes.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Attend qu'un jeton soit disponible puis le consomme."""
+        # Le verrou sert les appelants dans l'ordre d'arrivée
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class AdaptiveLimiter:
+    """
+    Limite de concurrence adaptative (AIMD) :
+    - succès rapide : la limite augmente doucement (+1 par « fenêtre » de requêtes)
+    - 429 ou latence au-delà de `target_latency` : la limite est réduite de moitié / de 10 %
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=32, target_latency=2.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.release()
+
+    def on_success(self, latency):
+        if latency > self.target_latency:
+            self.limit = max(self.minimum, self.limit * 0.9)
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_overload(self):
+        self.limit = max(self.minimum, self.limit / 2)
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur : après `failure_threshold` échecs consécutifs, les appels
+    échouent immédiatement pendant `reset_timeout` secondes ; ensuite un seul
+    appel d'essai est autorisé (demi-ouvert) pour tester le rétablissement.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def check(self):
+        """Lève CircuitOpenError si l'appel doit être refusé."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError("service indisponible (disjoncteur ouvert)")
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                raise CircuitOpenError("service en cours de test (disjoncteur demi-ouvert)")
+            self._probe_in_flight = True
+
+    def release(self):
+        """Appel autorisé par check() mais jamais envoyé au service (attente locale, annulation)."""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+
+class UpstreamGuard:
+    """
+    Protection d'un service externe, partagée par tous ses appelants :
+    seau à jetons + concurrence adaptative + tentatives avec backoff aléatoire
+    (full jitter) dans un délai global + disjoncteur.
+    """
+
+    def __init__(self, name, rate=5.0, burst=10, max_concurrency=8,
+                 target_latency=2.0, failure_threshold=5, reset_timeout=30.0,
+                 base_backoff=0.5, max_backoff=8.0):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = AdaptiveLimiter(
+            initial=max(1, max_concurrency // 2), maximum=max_concurrency,
+            target_latency=target_latency,
+        )
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.calls = 0
+        self.successes = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.rejected = 0
+        self.failures = 0
+
+    async def _acquire(self, remaining):
+        """
+        Attentes locales avant une tentative (seau à jetons, place dans la limite
+        de concurrence) ; retourne le temps restant pour la requête elle-même.
+        Lève DeadlineExceeded si le délai est écoulé avant l'envoi.
+        """
+        try:
+            await asyncio.wait_for(self.bucket.acquire(), remaining())
+            await asyncio.wait_for(self.limiter.acquire(), remaining())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"{self.name} : délai dépassé en file d'attente") from None
+        try:
+            return remaining()
+        except DeadlineExceeded:
+            await self.limiter.release()
+            raise
+
+    async def _attempt(self, fn, timeout):
+        try:
+            started = time.monotonic()
+            result = await asyncio.wait_for(fn(), timeout)
+            self.limiter.on_success(time.monotonic() - started)
+            return result
+        finally:
+            await self.limiter.release()
+
+    async def call(self, fn, deadline=10.0):
+        """
+        Appelle `fn()` (fonction retournant une coroutine) avec les protections.
+        - deadline : délai maximal (s) pour l'ensemble des attentes et tentatives
+        `fn` doit lever RetryableError / RateLimitedError pour les erreurs transitoires ;
+        toute autre exception est propagée immédiatement sans nouvelle tentative.
+
+        ✔ Seules les erreurs de `fn()` comptent pour le disjoncteur : un délai écoulé
+          dans les files d'attente locales (charge du bot) ou une annulation ne
+          rendent pas le service indisponible pour les autres appelants
+        """
+        self.calls += 1
+        deadline_at = time.monotonic() + deadline
+
+        def remaining():
+            left = deadline_at - time.monotonic()
+            if left <= 0:
+                raise DeadlineExceeded(f"{self.name} : délai de {deadline:.1f}s dépassé")
+            return left
+
+        attempt = 0
+        while True:
+            try:
+                self.breaker.check()
+            except CircuitOpenError:
+                self.rejected += 1
+                raise
+            try:
+                timeout = await self._acquire(remaining)
+            except BaseException as e:
+                # Rien n'a été envoyé : le service n'est pas en cause
+                self.breaker.release()
+                if isinstance(e, DeadlineExceeded):
+                    self.failures += 1
+                raise
+            try:
+                result = await self._attempt(fn, timeout)
+            except RateLimitedError as e:
+                self.rate_limited += 1
+                self.limiter.on_overload()
+                self.breaker.record_success()  # 429 : le service répond, il est juste saturé
+                error = e
+            except (RetryableError, asyncio.TimeoutError) as e:
+                self.breaker.record_failure()
+                error = e
+            except asyncio.CancelledError:
+                # Appel abandonné par l'appelant : aucune conclusion sur le service
+                self.breaker.release()
+                raise
+            except BaseException:
+                # Erreur non transitoire (ex : 401) : le service a répondu
+                self.breaker.record_success()
+                raise
+            else:
+                self.breaker.record_success()
+                self.successes += 1
+                return result
+
+            # Backoff exponentiel avec tirage aléatoire (full jitter)
+            backoff = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+            retry_after = getattr(error, "retry_after", None)
+            if retry_after is not None:
+                backoff = max(backoff, retry_after)
+            if time.monotonic() + backoff >= deadline_at:
+                self.failures += 1
+                if isinstance(error, UpstreamError):
+                    raise error
+                raise DeadlineExceeded(f"{self.name} : délai dépassé") from error
+            self.retries += 1
+            attempt += 1
+            await asyncio.sleep(backoff)
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "rejected": self.rejected,
+            "circuit": self.breaker.state,
+            "concurrency_limit": self.limiter.limit,
+        }
+
+
+# Une protection par service, partagée par tous les clients du processus
+_GUARDS = {}
+
+
+def get_guard(name, **defaults):
+    """
+    Retourne la protection partagée du service `name`, créée au premier appel.
+    Les réglages peuvent être surchargés par variables d'environnement :
+    <NAME>_RATE (requêtes/s), <NAME>_BURST, <NAME>_MAX_CONCURRENCY.
+    """
+    guard = _GUARDS.get(name)
+    if guard is None:
+        prefix = name.upper()
+        for key, cast in (("rate", float), ("burst", int), ("max_concurrency", int)):
+            value = os.getenv(f"{prefix}_{key.upper()}")
+            if value is not None:
+                defaults[key] = cast(value)
+        guard = _GUARDS[name] = UpstreamGuard(name, **defaults)
+    return guard
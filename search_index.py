@@ -0,0 +1,192 @@
+import hashlib
+import re
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Ligatures fréquentes en français, non décomposées par NFKD
+_LIGATURES = str.maketrans({"œ": "oe", "æ": "ae", "Œ": "oe", "Æ": "ae"})
+
+
+def fold(text):
+    """
+    Minuscules + suppression des accents : "Stressé" -> "stresse", "cœur" -> "coeur".
+    """
+    text = unicodedata.normalize("NFKD", text.translate(_LIGATURES).lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    """Découpe un texte en mots normalisés (lettres et chiffres sans accents)."""
+    return _TOKEN_RE.findall(fold(text))
+
+
+def fingerprint(entry):
+    """Empreinte courte d'une entrée du journal, pour vérifier qu'un index est à jour."""
+    return hashlib.sha1(f"{entry['date']}\x00{entry['text']}".encode()).hexdigest()[:16]
+
+
+class EmptyQueryError(ValueError):
+    """Requête sans aucun mot ni date (ex : "/recherche !!!") : elle renverrait tout le journal."""
+
+
+def parse_query(args):
+    """
+    Analyse les arguments de /recherche.
+    - mots : tous doivent être présents (ET) ; "stress*" recherche un préfixe
+    - du:YYYY-MM-DD / au:YYYY-MM-DD : bornes de dates incluses
+    Retourne (liste de (mot, préfixe?), date_min, date_max).
+    Lève ValueError si une date est invalide, EmptyQueryError s'il n'y a ni mot ni date.
+    """
+    terms, date_min, date_max = [], None, None
+    for arg in args:
+        low = arg.lower()
+        if low.startswith(("du:", "au:")):
+            value = datetime.strptime(arg[3:], "%Y-%m-%d").strftime("%Y-%m-%d")
+            if low.startswith("du:"):
+                date_min = value
+            else:
+                date_max = value
+            continue
+        prefix = arg.endswith("*")
+        tokens = tokenize(arg)
+        for i, token in enumerate(tokens):
+            # Seul le dernier mot d'un argument "l'exam*" est un préfixe
+            terms.append((token, prefix and i == len(tokens) - 1))
+    if not terms and date_min is None and date_max is None:
+        raise EmptyQueryError("ni mot ni date dans la requête")
+    return terms, date_min, date_max
+
+
+class _UserIndex:
+    """Index inversé du journal d'un utilisateur (identifiant d'entrée = position)."""
+
+    def __init__(self):
+        self.postings = {}     # mot -> liste triée des positions
+        self.vocab = []        # mots triés, pour la recherche par préfixe
+        self.dates = []        # position -> date de l'entrée
+        self.dates_sorted = True
+        self.fp = None         # empreinte de la dernière entrée indexée
+
+    def add(self, entry):
+        doc_id = len(self.dates)
+        date = entry["date"]
+        if self.dates and date < self.dates[-1]:
+            self.dates_sorted = False
+        self.dates.append(date)
+        for token in set(tokenize(entry["text"])):
+            ids = self.postings.get(token)
+            if ids is None:
+                self.postings[token] = [doc_id]
+                insort(self.vocab, token)
+            else:
+                ids.append(doc_id)
+        self.fp = fingerprint(entry)
+
+    def _ids_for(self, token, prefix):
+        if not prefix:
+            return set(self.postings.get(token, ()))
+        lo = bisect_left(self.vocab, token)
+        hi = bisect_left(self.vocab, token + "￿")
+        ids = set()
+        for word in self.vocab[lo:hi]:
+            ids.update(self.postings[word])
+        return ids
+
+    def _ids_in_range(self, date_min, date_max):
+        if self.dates_sorted:
+            lo = bisect_left(self.dates, date_min) if date_min else 0
+            hi = bisect_right(self.dates, date_max) if date_max else len(self.dates)
+            return range(lo, hi)
+        return [i for i, d in enumerate(self.dates)
+                if (not date_min or d >= date_min) and (not date_max or d <= date_max)]
+
+    def search(self, terms, date_min=None, date_max=None):
+        if not terms:
+            return list(self._ids_in_range(date_min, date_max))
+        # Intersection en partant de la liste la plus courte
+        candidates = sorted((self._ids_for(t, p) for t, p in terms), key=len)
+        result = candidates[0]
+        for ids in candidates[1:]:
+            if not result:
+                break
+            result &= ids
+        if date_min or date_max:
+            result = {i for i in result
+                      if (not date_min or self.dates[i] >= date_min)
+                      and (not date_max or self.dates[i] <= date_max)}
+        return sorted(result)
+
+    def to_dict(self):
+        return {"postings": self.postings, "dates": self.dates, "fp": self.fp}
+
+    @classmethod
+    def from_dict(cls, d):
+        idx = cls()
+        idx.postings = d["postings"]
+        idx.vocab = sorted(idx.postings)
+        idx.dates = d["dates"]
+        idx.dates_sorted = all(a <= b for a, b in zip(idx.dates, idx.dates[1:]))
+        idx.fp = d["fp"]
+        return idx
+
+
+class JournalIndex:
+    """
+    Index inversé des journaux, un sous-index par utilisateur.
+
+    ✔ Mise à jour incrémentale à chaque ressenti (pas de re-scan du journal)
+    ✔ Recherche insensible aux accents et à la casse, multi-mots (ET), par préfixe
+    ✔ Filtre par plage de dates (bisect quand les dates sont croissantes)
+    ✔ Sérialisable utilisateur par utilisateur (dump / load) : chaque sous-index
+      est sauvegardé chiffré séparément, seul celui d'un utilisateur modifié est réécrit
+    """
+
+    def __init__(self):
+        self._users = {}
+
+    def count(self, uid):
+        idx = self._users.get(uid)
+        return len(idx.dates) if idx else 0
+
+    def has(self, uid):
+        return uid in self._users
+
+    def add(self, uid, entry):
+        self._users.setdefault(uid, _UserIndex()).add(entry)
+
+    def drop(self, uid):
+        self._users.pop(uid, None)
+
+    def sync(self, uid, journal):
+        """
+        Met l'index de `uid` à jour par rapport à son journal : n'indexe que
+        les entrées manquantes, ou reconstruit tout si l'index ne correspond plus.
+        Retourne True si l'index a changé.
+        """
+        idx = self._users.get(uid)
+        n = len(idx.dates) if idx else 0
+        changed = False
+        if idx and (n > len(journal) or (n and idx.fp != fingerprint(journal[n - 1]))):
+            self.drop(uid)
+            n = 0
+            changed = True
+        for entry in journal[n:]:
+            self.add(uid, entry)
+            changed = True
+        return changed
+
+    def search(self, uid, terms, date_min=None, date_max=None):
+        """Retourne les positions (dans le journal) des entrées correspondantes."""
+        idx = self._users.get(uid)
+        return idx.search(terms, date_min, date_max) if idx else []
+
+    def dump(self, uid):
+        """Sous-index de `uid` sous forme sérialisable (None s'il n'est pas en mémoire)."""
+        idx = self._users.get(uid)
+        return idx.to_dict() if idx else None
+
+    def load(self, uid, d):
+        """Remplace le sous-index de `uid` par celui produit par dump()."""
+        self._users[uid] = _UserIndex.from_dict(d)
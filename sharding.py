@@ -0,0 +1,148 @@
+import glob
+import hashlib
+import json
+import os
+
+from userdata import _atomic_write
+
+LAYOUT_FILE = "layout.json"
+# Fichiers du mode mono-processus (app.py) : migrés vers les fragments au premier démarrage
+LEGACY_FILES = ("userdata.enc", "userdata.enc.log", "userdata.db", "userdata.d", "reminders.enc")
+
+
+def shard_for(uid, workers):
+    """
+    Numéro du worker (0 .. workers-1) propriétaire de `uid`, par hachage de rendez-vous :
+    chaque worker reçoit un score haché à partir de (uid, numéro) et le meilleur score gagne.
+
+    ✔ Stable d'un processus et d'un redémarrage à l'autre (pas de hash() Python)
+    ✔ Quand le nombre de workers passe de n à n + 1, seul ~1/(n + 1) des utilisateurs
+      change de worker (ceux que le nouveau worker emporte) ; les autres ne bougent pas
+    """
+    key = str(uid).encode()
+    return max(range(workers), key=lambda i: hashlib.blake2b(b"%s:%d" % (key, i), digest_size=8).digest())
+
+
+def update_owner(update):
+    """
+    Identifiant (utilisateur, sinon chat) d'une mise à jour Telegram encore au format JSON,
+    sans construire d'objet Update : même clé que PerUserUpdateProcessor._user_key.
+    Retourne None si la mise à jour n'a ni utilisateur ni chat (ex : sondage anonyme).
+    """
+    for key, payload in update.items():
+        if key == "update_id" or not isinstance(payload, dict):
+            continue
+        user = payload.get("from") or payload.get("user")
+        if user is None and isinstance(payload.get("message"), dict):
+            user = payload["message"].get("from")  # callback_query sans "from" (rare)
+        if user is not None:
+            return user["id"]
+        chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+        if chat is not None:
+            return chat["id"]
+    return None
+
+
+def shard_dir(root, shard):
+    return os.path.join(root, f"shard-{shard}")
+
+
+def _retire(path):
+    """Met de côté le répertoire d'un worker supprimé : `shard-<i>.retired`, puis `.retired-2`, `.retired-3`..."""
+    retired = f"{path}.retired"
+    n = 1
+    while os.path.exists(retired):
+        n += 1
+        retired = f"{path}.retired-{n}"
+    os.replace(path, retired)
+    return retired
+
+
+def read_layout(root):
+    """Nombre de workers du dernier rééquilibrage terminé, ou None."""
+    path = os.path.join(root, LAYOUT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)["workers"]
+
+
+def rebalance(root, workers, open_shard, legacy_dir=".", batch_size=500):
+    """
+    Répartit les données utilisateurs entre `workers` répertoires `root/shard-<i>`,
+    avant le démarrage des workers (aucun processus ne doit avoir ces données ouvertes).
+
+    - open_shard(répertoire) -> (UserDataManager, ReminderScheduler) de ce répertoire
+    - legacy_dir : données du mode mono-processus, migrées au premier démarrage
+    - batch_size : utilisateurs déplacés par lot (une seule écriture par lot et par fichier)
+
+    ✔ Seuls les utilisateurs dont le worker change sont déplacés (voir shard_for)
+    ✔ Chaque lot est d'abord importé chez les nouveaux workers, puis effacé
+      de l'ancien : un rééquilibrage interrompu se relance sans perte ni doublon
+    ✔ Le nombre de workers n'est enregistré (layout.json) qu'une fois tout déplacé ;
+      les répertoires des workers supprimés sont renommés en `shard-<i>.retired`
+      (`.retired-2`, `.retired-3`... si le nom est déjà pris)
+    Retourne le nombre d'utilisateurs déplacés.
+    """
+    os.makedirs(root, exist_ok=True)
+    sources = []
+    for path in sorted(glob.glob(os.path.join(root, "shard-*"))):
+        suffix = os.path.basename(path)[len("shard-"):]
+        if suffix.isdigit():
+            sources.append((int(suffix), path))
+    previous = read_layout(root)
+    if previous is None and any(os.path.exists(os.path.join(legacy_dir, f)) for f in LEGACY_FILES):
+        sources.append((None, legacy_dir))
+    if previous == workers and all(shard is not None and shard < workers for shard, _ in sources):
+        return 0
+
+    targets = {}
+
+    def target(shard):
+        if shard not in targets:
+            path = shard_dir(root, shard)
+            os.makedirs(path, exist_ok=True)
+            targets[shard] = open_shard(path)
+        return targets[shard]
+
+    moved = 0
+    try:
+        for source, path in sources:
+            if source is not None and source < workers:
+                dm, reminders = target(source)
+            else:
+                dm, reminders = open_shard(path)
+            moving = [uid for uid in dm.user_ids() if shard_for(uid, workers) != source]
+            for i in range(0, len(moving), batch_size):
+                batch = moving[i:i + batch_size]
+                by_dest = {}
+                for uid in batch:
+                    by_dest.setdefault(shard_for(uid, workers), {})[uid] = dm.get_user(uid)
+                for dest, users in by_dest.items():
+                    target(dest)[0].import_users(users)
+                    target(dest)[0].flush()  # écrit sur disque avant l'effacement ci-dessous
+                dm.clear_users(batch)
+                moved += len(batch)
+
+            # Rappels en attente : écrits chez le nouveau worker avant d'être retirés ici
+            taken = reminders.take(lambda uid: shard_for(uid, workers) != source)
+            by_dest = {}
+            for entry in taken:
+                by_dest.setdefault(shard_for(entry[1], workers), []).append(entry)
+            for dest, entries in by_dest.items():
+                target(dest)[1].put(entries)
+                target(dest)[1].save()
+            if taken:
+                reminders.save()
+            if source is None or source >= workers:
+                dm.close()
+            if source is not None and source >= workers:
+                # Worker supprimé : répertoire vidé, mis de côté pour ne plus être parcouru
+                _retire(path)
+    finally:
+        for dm, _ in targets.values():
+            dm.close()
+
+    _atomic_write(os.path.join(root, LAYOUT_FILE), json.dumps({"workers": workers}).encode())
+    print(f"Rééquilibrage : {moved} utilisateurs déplacés vers {workers} workers")
+    return moved
@@ -0,0 +1,19 @@
+from agenda_index import AgendaIndex
+from userdata import parse_dated_text
+
+
+def test_upcoming_in_date_order_with_undated_apart():
+    index = AgendaIndex(parse_dated_text)
+    index.build("1", {"agenda": ["12-03-2026 : Oral", "rendez-vous", "01-03-2026 : Partiel"]})
+    index.add("1", "agenda", "05-03-2026 : TP")
+    assert index.upcoming("1", "agenda", "2026-03-02") == ([("2026-03-05", "TP"), ("2026-03-12", "Oral")], 2)
+    assert index.undated("1", "agenda") == ["rendez-vous"]
+
+
+def test_least_recently_consulted_user_is_forgotten():
+    index = AgendaIndex(parse_dated_text, max_users=2)
+    for uid in ("1", "2"):
+        index.build(uid, {})
+    index.upcoming("1", "agenda", "2026-01-01")
+    index.build("3", {})
+    assert (index.has("1"), index.has("2"), index.has("3")) == (True, False, True)
@@ -0,0 +1,65 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+
+from oura_client import OuraAPIError
+from oura_store import OuraTimeSeriesStore
+
+
+class _FakeOura:
+    """Répond aux afetch_range avec une nuit par jour demandé, ou échoue sur demande."""
+
+    def __init__(self):
+        self.calls = []
+        self.fail = False
+
+    async def afetch_range(self, endpoint, start, end):
+        self.calls.append((endpoint, start, end))
+        if self.fail:
+            raise OuraAPIError("503 indisponible")
+        if endpoint != "sleep":
+            return []
+        return [{"day": (start + timedelta(days=i)).isoformat(), "total_sleep_duration": 28800}
+                for i in range((end - start).days)]
+
+
+def test_failed_sync_is_retried_at_next_command():
+    async def scenario():
+        oura = _FakeOura()
+        store = OuraTimeSeriesStore(backfill_days=10)
+        oura.fail = True
+        with pytest.raises(OuraAPIError):
+            await store.sync(oura)
+        assert len(store) == 0
+
+        # L'échec n'est pas compté comme une synchronisation : la suivante redemande Oura
+        oura.fail = False
+        assert await store.sync(oura) == 1
+        assert store.summary("total_sleep_duration", 30)["days"] == 11
+        oura.calls.clear()
+        assert await store.sync(oura) == 0
+        assert oura.calls == []
+
+    asyncio.run(scenario())
+
+
+def test_longer_window_is_backfilled_once():
+    async def scenario():
+        oura = _FakeOura()
+        store = OuraTimeSeriesStore(backfill_days=10)
+        await store.sync(oura)
+        oura.calls.clear()
+
+        await store.sync(oura, days=365)
+        today = date.today()
+        assert {(start, end) for _, start, end in oura.calls} == {
+            (today - timedelta(days=364), today - timedelta(days=10))
+        }
+        assert store.summary("total_sleep_duration", 365)["days"] == 365
+
+        oura.calls.clear()
+        await store.sync(oura, days=365)
+        assert oura.calls == []
+
+    asyncio.run(scenario())
@@ -0,0 +1,45 @@
+import pytest
+
+from pagination import clamp_page, newest_first, page_count, page_keyboard
+from userdata import UserDataManager
+from userdata_sqlite import SQLiteUserDataManager
+
+
+def _open(tmp_path, backend):
+    key_file = str(tmp_path / "secret.key")
+    if backend == "sqlite":
+        return SQLiteUserDataManager(str(tmp_path / "userdata.db"), key_file, str(tmp_path / "userdata.enc"))
+    return UserDataManager(str(tmp_path / "userdata.enc"), key_file)
+
+
+@pytest.mark.parametrize("backend", ["file", "sqlite"])
+def test_journal_page_boundaries(tmp_path, backend):
+    dm = _open(tmp_path, backend)
+    assert dm.journal_page("1", 0, 10) == ([], 0)
+    for i in range(25):
+        dm.add_journal_entry("1", f"ressenti {i}", "2026-01-01")
+
+    def texts(offset, limit):
+        entries, total = dm.journal_page("1", offset, limit)
+        assert total == 25
+        return [e["text"] for e in entries]
+
+    assert texts(0, 10) == [f"ressenti {i}" for i in range(24, 14, -1)]
+    assert texts(20, 10) == [f"ressenti {i}" for i in range(4, -1, -1)]  # dernière page incomplète
+    assert texts(24, 10) == ["ressenti 0"]
+    assert texts(25, 10) == []
+    assert texts(40, 10) == []
+    dm.close()
+
+
+def test_page_helpers_at_the_edges():
+    assert page_count(0) == 1  # journal vide : une page vide
+    assert page_count(10) == 1
+    assert page_count(11) == 2
+    assert clamp_page(5, 11) == 1  # page demandée avant une suppression
+    assert clamp_page(-1, 11) == 0
+    assert newest_first(list(range(11)), 1) == [0]
+    assert newest_first([], 0) == []
+    assert page_keyboard("journal", 0, 10) is None
+    buttons = page_keyboard("journal", 1, 25).inline_keyboard[0]
+    assert [b.callback_data for b in buttons] == ["pg:journal:0", "pg:journal:2"]
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, UpstreamGuard
+
+
+async def _ok():
+    return "ok"
+
+
+def test_local_queueing_does_not_open_breaker():
+    async def scenario():
+        guard = UpstreamGuard("test", rate=1.0, burst=1, failure_threshold=3)
+
+        async def slow_ok():
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        results = await asyncio.gather(
+            *(guard.call(slow_ok, deadline=0.3) for _ in range(10)), return_exceptions=True
+        )
+        assert results.count("ok") == 1
+        assert all(isinstance(r, DeadlineExceeded) for r in results if r != "ok")
+        assert guard.breaker.state == CircuitBreaker.CLOSED
+        assert guard.limiter.in_flight == 0
+        # Le service est sain : l'appel suivant passe dès qu'un jeton est disponible
+        assert await guard.call(_ok, deadline=2.0) == "ok"
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_probe_keeps_breaker_open_for_next_probe():
+    async def scenario():
+        guard = UpstreamGuard("test", rate=100.0, burst=100, failure_threshold=1, reset_timeout=0.05)
+        guard.breaker.record_failure()
+        assert guard.breaker.state == CircuitBreaker.OPEN
+        await asyncio.sleep(0.06)
+
+        hang = asyncio.Event()
+        probe = asyncio.ensure_future(guard.call(hang.wait, deadline=5.0))
+        await asyncio.sleep(0.01)
+        assert guard.breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            await guard.call(_ok)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        # L'annulation ne dit rien du service : toujours demi-ouvert, un nouvel essai est permis
+        assert guard.breaker.state == CircuitBreaker.HALF_OPEN
+        assert guard.limiter.in_flight == 0
+        assert await guard.call(_ok) == "ok"
+        assert guard.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(scenario())
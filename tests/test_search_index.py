@@ -0,0 +1,48 @@
+import pytest
+
+from search_index import EmptyQueryError, parse_query
+from userdata import UserDataManager
+from userdata_sqlite import SQLiteUserDataManager
+
+
+def test_parse_query_terms_prefix_and_dates():
+    terms, date_min, date_max = parse_query(["Stressé", "l'exam*", "du:2026-01-01", "AU:2026-01-31"])
+    assert terms == [("stresse", False), ("l", False), ("exam", True)]
+    assert (date_min, date_max) == ("2026-01-01", "2026-01-31")
+
+
+def test_parse_query_dates_alone_are_a_query():
+    assert parse_query(["du:2026-02-01"]) == ([], "2026-02-01", None)
+
+
+@pytest.mark.parametrize("args", [[], ["!!!"], ["*", "--"]])
+def test_parse_query_rejects_queries_without_terms_or_dates(args):
+    with pytest.raises(EmptyQueryError):
+        parse_query(args)
+
+
+@pytest.mark.parametrize("arg", ["du:2026-02-30", "au:01-02-2026", "du:", "au:demain"])
+def test_parse_query_rejects_invalid_dates(arg):
+    with pytest.raises(ValueError):
+        parse_query(["stress", arg])
+
+
+@pytest.mark.parametrize("backend", ["file", "sqlite"])
+def test_search_journal_matches_only_selected_entries(tmp_path, backend):
+    key_file = str(tmp_path / "secret.key")
+    if backend == "sqlite":
+        dm = SQLiteUserDataManager(str(tmp_path / "userdata.db"), key_file, str(tmp_path / "userdata.enc"))
+    else:
+        dm = UserDataManager(str(tmp_path / "userdata.enc"), key_file)
+    dm.add_journal_entry("1", "Examen stressant", "2026-01-10")
+    dm.add_journal_entry("1", "journée calme", "2026-01-11")
+    dm.add_journal_entry("2", "stress aussi", "2026-01-10")
+    assert [e["text"] for e in dm.search_journal("1", ["stress*"])] == ["Examen stressant"]
+
+    # Entrée ajoutée après la première recherche : indexée sans reconstruire
+    dm.add_journal_entry("1", "encore du stress", "2026-01-12")
+    assert [e["text"] for e in dm.search_journal("1", ["stress*", "du:2026-01-11"])] == ["encore du stress"]
+    assert [e["date"] for e in dm.search_journal("1", ["au:2026-01-11"])] == ["2026-01-10", "2026-01-11"]
+    with pytest.raises(EmptyQueryError):
+        dm.search_journal("1", ["!!!"])
+    dm.close()
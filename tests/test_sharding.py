@@ -0,0 +1,71 @@
+import os
+
+from reminders import ReminderScheduler
+from sharding import read_layout, rebalance, shard_dir, shard_for
+from userdata import UserDataManager
+from userdata_lazy import LazyUserDataManager
+
+
+def _open_shard(key_file):
+    def open_shard(data_dir):
+        dm = UserDataManager(os.path.join(data_dir, "userdata.enc"), key_file)
+        return dm, ReminderScheduler(os.path.join(data_dir, "reminders.enc"), cipher=dm.cipher)
+    return open_shard
+
+
+def _open_lazy_shard(key_file):
+    def open_shard(data_dir):
+        dm = LazyUserDataManager(
+            os.path.join(data_dir, "userdata.enc"), key_file, os.path.join(data_dir, "userdata.d")
+        )
+        return dm, ReminderScheduler(os.path.join(data_dir, "reminders.enc"), cipher=dm.cipher)
+    return open_shard
+
+
+def _users(root, workers, open_shard):
+    found = {}
+    for shard in range(workers):
+        dm, _ = open_shard(shard_dir(root, shard))
+        for uid in dm.user_ids():
+            assert shard_for(uid, workers) == shard
+            found[uid] = dm.get_user(uid)["journal"][0]["text"]
+        dm.close()
+    return found
+
+
+def test_repeated_rebalances_keep_every_user(tmp_path):
+    root = str(tmp_path / "shards")
+    open_shard = _open_shard(str(tmp_path / "secret.key"))
+    os.makedirs(shard_dir(root, 0))
+    dm, _ = open_shard(shard_dir(root, 0))
+    for uid in range(40):
+        dm.add_journal_entry(str(uid), f"ressenti {uid}", "2026-01-01", "08:00")
+    dm.close()
+    expected = {str(uid): f"ressenti {uid}" for uid in range(40)}
+
+    # Le worker 2 est supprimé deux fois : son second répertoire retiré ne doit pas bloquer
+    for workers in (2, 3, 2, 3, 2):
+        rebalance(root, workers, open_shard, legacy_dir=str(tmp_path / "legacy"))
+        assert read_layout(root) == workers
+        assert _users(root, workers, open_shard) == expected
+
+    assert sorted(p for p in os.listdir(root) if "retired" in p) == ["shard-2.retired", "shard-2.retired-2"]
+
+
+def test_rebalance_lazy_backend_from_single_process_files(tmp_path):
+    legacy = str(tmp_path / "legacy")
+    root = str(tmp_path / "shards")
+    open_shard = _open_lazy_shard(str(tmp_path / "secret.key"))
+    dm, _ = open_shard(legacy)
+    for uid in range(30):
+        dm.add_journal_entry(str(uid), f"ressenti {uid}", "2026-01-01", "08:00")
+    dm.close()
+    expected = {str(uid): f"ressenti {uid}" for uid in range(30)}
+
+    # Premier lancement : seul `userdata.d` existe dans le répertoire du mode mono-processus
+    assert rebalance(root, 2, open_shard, legacy_dir=legacy) == 30
+    assert _users(root, 2, open_shard) == expected
+    assert os.listdir(os.path.join(legacy, "userdata.d")) == []
+
+    rebalance(root, 3, open_shard, legacy_dir=legacy)
+    assert _users(root, 3, open_shard) == expected
@@ -0,0 +1,44 @@
+import os
+
+from userdata_lazy import LazyUserDataManager
+
+
+def _open(tmp_path, **kwargs):
+    return LazyUserDataManager(
+        str(tmp_path / "userdata.enc"), str(tmp_path / "secret.key"), str(tmp_path / "userdata.d"), **kwargs
+    )
+
+
+def test_round_trip_and_clear_user(tmp_path):
+    dm = _open(tmp_path)
+    dm.add_journal_entry("1", "calme", "2026-01-01", "08:00")
+    dm.add_exam("1", "20-01-2026 : Partiel")
+    dm.add_journal_entry("2", "stressé", "2026-01-01")
+    dm.search_journal("2", ["stresse"])
+    dm.close()  # sauvegarde l'index de recherche de l'utilisateur 2
+    assert os.path.exists(dm._index_path("2"))
+
+    dm = _open(tmp_path)
+    dm.clear_user("2")
+    assert not os.path.exists(dm._blob_path("2"))
+    assert not os.path.exists(dm._index_path("2"))
+    dm.close()
+
+    dm = _open(tmp_path)
+    user = dm.get_user("1")
+    assert user["journal"] == [{"text": "calme", "date": "2026-01-01", "time": "08:00"}]
+    assert user["exams"] == ["20-01-2026 : Partiel"]
+    assert dm.get_user("2")["journal"] == []
+    assert dm.user_ids() == ["1"]
+    dm.close()
+
+
+def test_cache_stays_under_budget_and_reloads_evicted_users(tmp_path):
+    dm = _open(tmp_path, max_bytes=2000)
+    for uid in range(20):
+        dm.add_journal_entry(str(uid), "x" * 200, "2026-01-01")
+    assert dm.stats()["resident_bytes"] <= 2000
+    assert dm.evictions > 0
+    # Un utilisateur évincé est relu depuis son fichier
+    assert dm.get_user("0")["journal"][0]["text"] == "x" * 200
+    dm.close()
@@ -0,0 +1,104 @@
+import os
+import threading
+
+from userdata_log import LogUserDataManager
+
+
+def _open(tmp_path, **kwargs):
+    return LogUserDataManager(str(tmp_path / "userdata.enc"), str(tmp_path / "secret.key"), **kwargs)
+
+
+def _texts(dm, uid):
+    return [entry["text"] for entry in dm.get_user(uid)["journal"]]
+
+
+def test_round_trip_and_clear_user(tmp_path):
+    dm = _open(tmp_path)
+    dm.add_journal_entry("1", "calme", "2026-01-01", "08:00")
+    dm.add_agenda_event("1", "2026-01-05 Oral")
+    dm.add_journal_entry("2", "stressé", "2026-01-01", "09:00")
+    dm.clear_user("2")
+    dm.flush()
+    dm.close()
+
+    dm = _open(tmp_path)
+    assert _texts(dm, "1") == ["calme"]
+    assert dm.get_user("1")["agenda"] == ["2026-01-05 Oral"]
+    assert _texts(dm, "2") == []
+    dm.close()
+
+
+def test_replay_applies_log_after_snapshot(tmp_path):
+    dm = _open(tmp_path)
+    dm.add_journal_entry("1", "avant", "2026-01-01")
+    dm.compact(wait=True)
+    dm.add_journal_entry("1", "après", "2026-01-02")
+    dm.close()
+
+    dm = _open(tmp_path)
+    assert _texts(dm, "1") == ["avant", "après"]
+    dm.close()
+
+
+def test_torn_last_line_is_dropped_and_log_stays_usable(tmp_path):
+    dm = _open(tmp_path)
+    dm.add_journal_entry("1", "complet", "2026-01-01")
+    dm.close()
+    with open(dm.log_path, 'ab') as f:
+        f.write(b"gAAAAAB-tronque")  # crash au milieu d'une écriture
+
+    dm = _open(tmp_path)
+    assert _texts(dm, "1") == ["complet"]
+    dm.add_journal_entry("1", "suivant", "2026-01-02")
+    dm.close()
+
+    dm = _open(tmp_path)
+    assert _texts(dm, "1") == ["complet", "suivant"]
+    dm.close()
+
+
+def test_interrupted_compaction_is_finished_at_startup(tmp_path):
+    dm = _open(tmp_path)
+    dm.add_journal_entry("1", "ancien", "2026-01-01")
+    dm.close()
+    # Arrêt juste après la mise de côté du journal, avant l'écriture de l'instantané
+    os.replace(dm.log_path, dm.compacting_path)
+    dm = _open(tmp_path)
+    dm.add_journal_entry("1", "récent", "2026-01-02")
+    dm.close()
+    os.replace(dm.log_path, dm.compacting_path)
+    with open(dm.log_path, 'wb'):
+        pass
+
+    dm = _open(tmp_path)
+    assert _texts(dm, "1") == ["ancien", "récent"]
+    assert not os.path.exists(dm.compacting_path)
+    assert os.path.getsize(dm.log_path) == 0
+    dm.close()
+
+
+def test_clear_during_compaction_is_purged_from_disk(tmp_path):
+    dm = _open(tmp_path)
+    dm.add_journal_entry("1", "à effacer", "2026-01-01")
+    dm.add_journal_entry("2", "à garder", "2026-01-01")
+
+    release = threading.Event()
+    seal = dm._seal
+
+    def slow_seal(data):
+        if threading.current_thread().name == "userdata-compaction":
+            assert release.wait(5)
+        return seal(data)
+
+    dm._seal = slow_seal
+    dm.compact()  # figé avec l'utilisateur 1, bloqué avant l'écriture
+    dm.clear_user("1")
+    release.set()
+    dm.flush()
+
+    with open(dm.filepath, 'rb') as f:
+        snapshot = dm._decrypt(f.read())
+    assert "1" not in snapshot["users"]
+    assert snapshot["users"]["2"]["journal"][0]["text"] == "à garder"
+    assert not os.path.exists(dm.compacting_path)
+    dm.close()
@@ -0,0 +1,49 @@
+import os
+
+from userdata import UserDataManager
+from userdata_sqlite import SQLiteUserDataManager
+
+
+def _open(tmp_path):
+    return SQLiteUserDataManager(
+        str(tmp_path / "userdata.db"), str(tmp_path / "secret.key"), str(tmp_path / "userdata.enc")
+    )
+
+
+def test_round_trip_and_clear_user(tmp_path):
+    dm = _open(tmp_path)
+    dm.add_journal_entry("1", "calme", "2026-01-01", "08:00")
+    dm.add_agenda_event("1", "05-01-2026 : Oral")
+    dm.add_exam("1", "20-01-2026 : Partiel")
+    dm.set_setting("1", "cache", False)
+    dm.add_journal_entry("2", "stressé", "2026-01-01")
+    dm.search_journal("2", ["stresse"])  # crée l'index de recherche de l'utilisateur 2
+    dm.clear_user("2")
+    dm.close()
+
+    dm = _open(tmp_path)
+    assert dm.get_user("1") == {
+        "journal": [{"text": "calme", "date": "2026-01-01", "time": "08:00"}],
+        "agenda": ["05-01-2026 : Oral"],
+        "exams": ["20-01-2026 : Partiel"],
+        "settings": {"cache": False},
+    }
+    assert dm.get_user("2") == {"journal": [], "agenda": [], "exams": []}
+    assert dm._read_index("2") is None
+    assert dm.user_ids() == ["1"]
+    dm.close()
+
+
+def test_legacy_file_is_imported_once(tmp_path):
+    legacy = UserDataManager(str(tmp_path / "userdata.enc"), str(tmp_path / "secret.key"))
+    legacy.add_journal_entry("1", "avant SQLite", "2026-01-01")
+    legacy.close()
+
+    dm = _open(tmp_path)
+    dm.close()
+    assert not os.path.exists(tmp_path / "userdata.enc")
+    assert os.path.exists(tmp_path / "userdata.enc.migrated")
+
+    dm = _open(tmp_path)
+    assert [e["text"] for e in dm.get_user("1")["journal"]] == ["avant SQLite"]
+    dm.close()
@@ -0,0 +1,44 @@
+from userdata import UserDataManager
+from userdata_writebehind import WriteBehindUserDataManager
+
+
+def _open(tmp_path, **kwargs):
+    return WriteBehindUserDataManager(str(tmp_path / "userdata.enc"), str(tmp_path / "secret.key"), **kwargs)
+
+
+def test_round_trip_and_clear_user(tmp_path):
+    dm = _open(tmp_path, flush_interval=60)
+    dm.add_journal_entry("1", "calme", "2026-01-01", "08:00")
+    dm.add_agenda_event("1", "05-01-2026 : Oral")
+    dm.add_journal_entry("2", "stressé", "2026-01-01")
+    dm.clear_user("2")
+    dm.close()  # écrit le lot en attente
+
+    # Même format que le mode fichier unique
+    dm = UserDataManager(str(tmp_path / "userdata.enc"), str(tmp_path / "secret.key"))
+    assert dm.get_user("1")["journal"] == [{"text": "calme", "date": "2026-01-01", "time": "08:00"}]
+    assert dm.get_user("1")["agenda"] == ["05-01-2026 : Oral"]
+    assert dm.user_ids() == ["1"]
+    dm.close()
+
+
+def test_flush_groups_pending_mutations_into_one_write(tmp_path):
+    dm = _open(tmp_path, flush_interval=60)
+    writes = []
+    seal = dm._seal
+
+    def counting_seal(data):
+        writes.append(len(data))
+        return seal(data)
+
+    dm._seal = counting_seal
+    for i in range(10):
+        dm.add_journal_entry("1", f"ressenti {i}", "2026-01-01")
+    dm.flush()
+    dm.flush()  # rien en attente : pas de seconde écriture
+    assert len(writes) == 1
+    dm.close()
+
+    dm = _open(tmp_path)
+    assert len(dm.get_user("1")["journal"]) == 10
+    dm.close()
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Cache mémoire à durée de vie (TTL) et taille bornée (éviction LRU).
+
+    ✔ Chaque entrée expire après `ttl` secondes
+    ✔ Au-delà de `maxsize` entrées, la moins récemment utilisée est évincée
+    ✔ `aget_or_load` fusionne les chargements identiques en cours (single-flight) :
+      N appels simultanés pour la même clé ne déclenchent qu'un seul chargement
+    ✔ `get_stale` retrouve une valeur même expirée (repli quand la source est lente)
+    ✔ Compteurs hits / misses / coalesced / evictions consultables via `stats()`
+    """
+
+    def __init__(self, ttl=900, maxsize=256, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        # clé -> (date d'expiration, valeur), ordonné du moins au plus récemment utilisé
+        self._entries = OrderedDict()
+        # clé -> tâche de chargement en cours (mode asynchrone)
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _lookup(self, key):
+        """Retourne (trouvé, valeur) et met à jour les compteurs."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                # Entrée périmée : gardée pour get_stale jusqu'à remplacement ou éviction
+                self.expirations += 1
+            self.misses += 1
+            return False, None
+
+    def get(self, key, default=None):
+        found, value = self._lookup(key)
+        return value if found else default
+
+    def get_stale(self, key, default=None):
+        """
+        Retourne la dernière valeur connue pour `key`, même expirée (sans toucher aux compteurs).
+        """
+        with self._lock:
+            item = self._entries.get(key)
+        return item[1] if item is not None else default
+
+    def set(self, key, value, ttl=None):
+        """
+        Enregistre `value` sous `key`.
+        - ttl : durée de vie en secondes, ou fonction value -> secondes (défaut : self.ttl)
+        """
+        if callable(ttl):
+            ttl = ttl(value)
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_load(self, key, loader, ttl=None):
+        """
+        Version synchrone : retourne la valeur en cache ou appelle `loader()`.
+        Une exception levée par `loader` n'est pas mise en cache.
+        """
+        found, value = self._lookup(key)
+        if found:
+            return value
+        value = loader()
+        self.set(key, value, ttl)
+        return value
+
+    async def aget_or_load(self, key, loader, ttl=None):
+        """
+        Version asynchrone avec single-flight.
+        - loader : fonction sans argument retournant une coroutine
+        Le chargement tourne dans sa propre tâche : l'annulation d'un appelant
+        n'interrompt pas la requête partagée par les autres.
+        """
+        found, value = self._lookup(key)
+        if found:
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader, ttl))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._load_done(k, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader, ttl):
+        value = await loader()
+        self.set(key, value, ttl)
+        return value
+
+    def _load_done(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Marque l'exception comme consommée si plus personne n'attend la tâche
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        """Retourne les compteurs du cache (pour ajuster TTL et taille)."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
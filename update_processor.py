@@ -0,0 +1,65 @@
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Traite les mises à jour Telegram de plusieurs utilisateurs en parallèle,
+    tout en gardant celles d'un même utilisateur strictement dans l'ordre.
+
+    ✔ Un verrou asyncio par utilisateur (FIFO) : les états de conversation
+      (AGENDA, EXAM, RESSENTI) et les écritures UserDataManager d'un utilisateur
+      ne se chevauchent jamais
+    ✔ Au plus `max_workers` handlers s'exécutent en même temps, tous utilisateurs confondus
+    ✔ Une mise à jour qui attend son tour ne consomme pas de place de travail :
+      un utilisateur qui envoie beaucoup de messages ne bloque pas les autres
+    """
+
+    def __init__(self, max_workers=16, max_pending=1024):
+        """
+        - max_workers : nombre maximal de handlers exécutés simultanément
+        - max_pending : nombre maximal de mises à jour admises (en cours ou en attente)
+        """
+        super().__init__(max_pending)
+        self.max_workers = max_workers
+        self._workers = asyncio.BoundedSemaphore(max_workers)
+        # clé utilisateur -> [verrou, nombre de mises à jour en attente ou en cours]
+        self._user_locks = {}
+
+    @staticmethod
+    def _user_key(update):
+        """Identifiant de l'utilisateur (ou du chat) à l'origine de la mise à jour."""
+        user = getattr(update, "effective_user", None)
+        if user is not None:
+            return ("user", user.id)
+        chat = getattr(update, "effective_chat", None)
+        if chat is not None:
+            return ("chat", chat.id)
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._user_key(update)
+        if key is None:
+            async with self._workers:
+                await coroutine
+            return
+
+        entry = self._user_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            # Les tâches sont créées dans l'ordre d'arrivée et asyncio.Lock est FIFO :
+            # l'ordre des mises à jour d'un utilisateur est conservé
+            async with entry[0]:
+                async with self._workers:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._user_locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -7,6 +7,62 @@ import json
 # Import d'os pour la gestion des fichiers et chemins
 import os
 
+# Noms de fichiers dérivés de l'uid (HMAC) : l'identifiant Telegram n'apparaît pas sur disque
+import hashlib
+import hmac
+
+# Index de recherche gardés en mémoire, du moins au plus récemment utilisé
+from collections import OrderedDict
+
+# Verrou pour protéger self.data si plusieurs threads écrivent
+import threading
+
+# Lecture des dates saisies dans /agenda et /exam
+from datetime import datetime
+
+# Index inversé pour /recherche
+from search_index import JournalIndex, parse_query
+
+# Index par date de l'agenda et des examens pour /organisation
+from agenda_index import AgendaIndex
+
+# Durée et volume de la sérialisation / du chiffrement (exposés sur /metrics)
+from metrics import STORAGE_BYTES, STORAGE_SECONDS
+
+
+def parse_dated_text(text):
+    """
+    Découpe une saisie "DD-MM-YYYY : description".
+    Retourne (date ISO "YYYY-MM-DD", description), ou (None, texte) si la date est invalide.
+    """
+    head, sep, tail = text.partition(":")
+    try:
+        day = datetime.strptime(head.strip(), "%d-%m-%Y")
+    except ValueError:
+        return None, text.strip()
+    return day.strftime("%Y-%m-%d"), tail.strip() if sep else ""
+
+
+def _atomic_write(path, data):
+    """
+    Écrit `data` (bytes) dans `path` de façon atomique :
+    fichier temporaire → fsync → rename. Un crash laisse soit l'ancien fichier,
+    soit le nouveau, jamais un fichier à moitié écrit.
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    # fsync du répertoire pour rendre le rename durable (POSIX uniquement)
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
 
 class UserDataManager:
     """
@@ -19,6 +75,12 @@ class UserDataManager:
       dans la structure interne `self.data`
     """
 
+    # Nombre d'ajouts au journal avant sauvegarde automatique des index de recherche modifiés
+    index_save_every = 50
+    # Utilisateurs dont les index (recherche, agenda) sont gardés en mémoire
+    # (au-delà, le moins récemment utilisé est oublié)
+    index_max_users = 1024
+
     def __init__(self, filepath='userdata.enc', key_file='secret.key'):
         """
         Initialise le gestionnaire.
@@ -44,9 +106,20 @@ class UserDataManager:
         # Stocke le chemin du fichier de données chiffrées
         self.filepath = filepath
 
+        # Verrou ré-entrant : toutes les mutations passent par _record()
+        self._lock = threading.RLock()
+
         # ✅ Charge les données en mémoire depuis le fichier
         self._load()
 
+        # ✅ Index de recherche des ressentis : un fichier chiffré par utilisateur,
+        # lu à sa première recherche
+        self.index_dir = f"{filepath}.idx.d"
+        self._init_index()
+
+        # Index par date de l'agenda et des examens (mémoire seule, construit à la demande)
+        self.agenda_index = AgendaIndex(parse_dated_text, max_users=self.index_max_users)
+
     def _load(self):
         """
         Charge les données depuis le fichier chiffré dans self.data.
@@ -62,22 +135,51 @@ class UserDataManager:
             enc = f.read()
 
         try:
-            # ✅ Déchiffre les données
-            dec = self.cipher.decrypt(enc)
-            # Convertit le JSON décodé en dictionnaire Python
-            self.data = json.loads(dec)
+            # ✅ Déchiffre les données puis convertit le JSON en dictionnaire Python
+            self.data = self._decrypt(enc)
         except Exception:
             # En cas d'erreur de déchiffrement ou parsing JSON → on réinitialise
             self.data = {}
 
+    # Chaque étape est mesurée (durée et octets) : voir metrics.STORAGE_*
+    def _serialize(self, obj):
+        with STORAGE_SECONDS.timer(operation="serialize"):
+            data = json.dumps(obj).encode()
+        STORAGE_BYTES.inc(len(data), operation="serialize")
+        return data
+
+    def _deserialize(self, data):
+        STORAGE_BYTES.inc(len(data), operation="deserialize")
+        with STORAGE_SECONDS.timer(operation="deserialize"):
+            return json.loads(data)
+
+    def _seal(self, data):
+        """Chiffre des octets avec Fernet."""
+        with STORAGE_SECONDS.timer(operation="encrypt"):
+            token = self.cipher.encrypt(data)
+        STORAGE_BYTES.inc(len(token), operation="encrypt")
+        return token
+
+    def _unseal(self, token):
+        """Déchiffre un jeton Fernet (lève InvalidToken si la clé ne correspond pas)."""
+        STORAGE_BYTES.inc(len(token), operation="decrypt")
+        with STORAGE_SECONDS.timer(operation="decrypt"):
+            return self.cipher.decrypt(token)
+
+    def _encrypt(self, obj):
+        """Sérialise `obj` en JSON puis le chiffre avec Fernet."""
+        return self._seal(self._serialize(obj))
+
+    def _decrypt(self, token):
+        """Déchiffre un jeton Fernet et retourne l'objet JSON correspondant."""
+        return self._deserialize(self._unseal(token))
+
     def _save(self):
         """
         Chiffre le dictionnaire self.data et l'écrit dans le fichier.
         """
-        # Convertit self.data en JSON puis en bytes
-        json_bytes = json.dumps(self.data).encode()
-        # ✅ Chiffre les données avec Fernet
-        enc = self.cipher.encrypt(json_bytes)
+        # ✅ Convertit self.data en JSON puis chiffre les données avec Fernet
+        enc = self._encrypt(self.data)
 
         # Écrit le texte chiffré dans le fichier
         with open(self.filepath, 'wb') as f:
@@ -95,42 +197,292 @@ class UserDataManager:
             "exams": []
         }
         """
-        return self.data.setdefault(uid, {
-            "journal": [],
-            "agenda": [],
-            "exams": []
-        })
+        with self._lock:  # Évite de modifier self.data pendant une sérialisation
+            return self.data.setdefault(uid, {
+                "journal": [],
+                "agenda": [],
+                "exams": []
+            })
+
+    # ---------------------- Mutations ----------------------
+    # Chaque modification est décrite par un enregistrement (dict) :
+    #   {"op": "journal" | "agenda" | "exam" | "clear", "uid": ..., "entry": ...}
+    #   {"op": "setting", "uid": ..., "key": ..., "value": ...}
+    # _apply() l'applique en mémoire, _record() l'applique puis le persiste,
+    # _record_many() persiste un lot d'enregistrements en une fois.
+    # Les variantes de stockage (journal append-only, etc.) surchargent ces méthodes.
+
+    def _apply(self, rec):
+        """
+        Applique un enregistrement de mutation à self.data.
+        """
+        op, uid = rec["op"], rec["uid"]
+        if op == "clear":
+            self.data.pop(uid, None)
+        elif op == "journal":
+            self.get_user(uid)['journal'].append(rec["entry"])
+        elif op == "agenda":
+            self.get_user(uid)['agenda'].append(rec["entry"])
+        elif op == "exam":
+            self.get_user(uid)['exams'].append(rec["entry"])
+        elif op == "setting":
+            self.get_user(uid).setdefault('settings', {})[rec["key"]] = rec["value"]
+        else:
+            raise ValueError(f"Opération inconnue : {op}")
 
-    def add_journal_entry(self, uid, text, date):
+    def _record(self, rec):
+        """
+        Applique la mutation puis sauvegarde le fichier complet.
+        """
+        with self._lock:
+            self._apply(rec)
+            self._save()  # Sauvegarde après modification
+
+    def _record_many(self, recs):
+        """
+        Applique plusieurs mutations puis sauvegarde le fichier complet une seule fois.
+        """
+        with self._lock:
+            for rec in recs:
+                self._apply(rec)
+            self._save()
+
+    def add_journal_entry(self, uid, text, date, time=None):
         """
         Ajoute une entrée dans le journal de l'utilisateur.
         - uid : identifiant utilisateur
         - text : contenu du ressenti
         - date : date associée à l'entrée
+        - time : heure "HH:MM" de l'entrée (optionnelle)
         """
-        self.get_user(uid)['journal'].append({"text": text, "date": date})
-        self._save()  # Sauvegarde après modification
+        entry = {"text": text, "date": date}
+        if time is not None:
+            entry["time"] = time
+        self._record({"op": "journal", "uid": uid, "entry": entry})
+        with self._lock:
+            # Mise à jour incrémentale, seulement si l'index de cet utilisateur est vérifié
+            if uid in self._index_synced:
+                self.index.add(uid, entry)
+                self._index_dirty.add(uid)
+                self._index_pending += 1
+            save_index = self._index_pending >= self.index_save_every
+        if save_index:
+            self._save_index()
 
     def add_agenda_event(self, uid, text):
         """
         Ajoute un événement à l'agenda de l'utilisateur.
         - text : description de l'événement
         """
-        self.get_user(uid)['agenda'].append(text)
-        self._save()
+        self._record({"op": "agenda", "uid": uid, "entry": text})
+        with self._lock:
+            self.agenda_index.add(uid, "agenda", text)
 
     def add_exam(self, uid, text):
         """
         Ajoute un examen à la liste de l'utilisateur.
         - text : description (date + matière)
         """
-        self.get_user(uid)['exams'].append(text)
-        self._save()
+        self._record({"op": "exam", "uid": uid, "entry": text})
+        with self._lock:
+            self.agenda_index.add(uid, "exams", text)
+
+    def set_setting(self, uid, key, value):
+        """
+        Enregistre une préférence de l'utilisateur (valeur sérialisable en JSON).
+        """
+        self._record({"op": "setting", "uid": uid, "key": key, "value": value})
+
+    def get_setting(self, uid, key, default=None):
+        """
+        Retourne une préférence de l'utilisateur, ou `default` si elle n'est pas définie.
+        """
+        return self.get_user(uid).get('settings', {}).get(key, default)
 
     def clear_user(self, uid):
         """
         Supprime toutes les données enregistrées pour un utilisateur.
         """
-        if uid in self.data:
-            del self.data[uid]  # Efface le dictionnaire
-            self._save()
+        self.clear_users([uid])
+
+    def clear_users(self, uids):
+        """
+        Supprime les données de plusieurs utilisateurs en un seul lot.
+        """
+        recs = [{"op": "clear", "uid": uid} for uid in uids if self._has_user(uid)]
+        if recs:
+            self._record_many(recs)  # Efface les dictionnaires
+        self._drop_indexes(uids)
+
+    def _drop_indexes(self, uids):
+        with self._lock:
+            for uid in uids:
+                self._forget_index(uid)
+                self.agenda_index.drop(uid)
+            # Seuls les index de ces utilisateurs sont effacés sur disque
+            self._delete_indexes(uids)
+
+    def _has_user(self, uid):
+        """Indique si des données existent pour `uid` (évite une sauvegarde inutile)."""
+        return uid in self.data
+
+    # ---------------------- Déplacement d'utilisateurs ----------------------
+    def user_ids(self):
+        """
+        Identifiants des utilisateurs présents dans ce stockage
+        (utilisé pour répartir les utilisateurs entre workers, voir sharding.py).
+        """
+        with self._lock:
+            return list(self.data)
+
+    def import_users(self, users):
+        """
+        Remplace les données des utilisateurs de `users` ({uid: structure de get_user}),
+        en un seul lot. Les données existantes sont d'abord effacées : importer deux fois
+        le même utilisateur (ex : rééquilibrage interrompu puis relancé) ne crée pas de doublon.
+        """
+        recs = []
+        for uid, user in users.items():
+            recs.append({"op": "clear", "uid": uid})
+            recs += [{"op": op, "uid": uid, "entry": entry}
+                     for op, key in (("journal", "journal"), ("agenda", "agenda"), ("exam", "exams"))
+                     for entry in user.get(key, [])]
+            recs += [{"op": "setting", "uid": uid, "key": key, "value": value}
+                     for key, value in user.get("settings", {}).items()]
+        if recs:
+            self._record_many(recs)
+        self._drop_indexes(users)
+
+    # ---------------------- Recherche ----------------------
+    def _init_index(self):
+        """
+        Prépare l'index inversé, vide : le sous-index d'un utilisateur est lu
+        (ou reconstruit depuis son journal) à sa première recherche.
+        """
+        self.index = JournalIndex()
+        # uid dont l'index a été vérifié contre le journal depuis son chargement
+        self._index_synced = set()
+        # uid des index en mémoire, du moins au plus récemment utilisé
+        self._index_recent = OrderedDict()
+        # uid dont l'index a changé depuis sa dernière sauvegarde
+        self._index_dirty = set()
+        self._index_pending = 0
+
+    def _hashed_name(self, uid):
+        return hmac.new(self.key, uid.encode(), hashlib.sha256).hexdigest()
+
+    def _index_path(self, uid):
+        return os.path.join(self.index_dir, f"{self._hashed_name(uid)}.enc")
+
+    def _read_index(self, uid):
+        """Sous-index sauvegardé de `uid` (dict de JournalIndex.dump), ou None."""
+        path = self._index_path(uid)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return self._decrypt(f.read())
+        except Exception:
+            print("Index de recherche illisible : il sera reconstruit")
+            return None
+
+    def _write_indexes(self, tokens):
+        """Écrit les sous-index chiffrés `tokens` ({uid: jeton Fernet})."""
+        for uid, token in tokens.items():
+            path = self._index_path(uid)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _atomic_write(path, token)
+
+    def _delete_indexes(self, uids):
+        for uid in uids:
+            path = self._index_path(uid)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _forget_index(self, uid):
+        self.index.drop(uid)
+        self._index_synced.discard(uid)
+        self._index_recent.pop(uid, None)
+        self._index_dirty.discard(uid)
+
+    def _ready_index(self, uid, journal):
+        """Charge puis vérifie l'index de `uid` contre son journal (sous self._lock)."""
+        if uid not in self._index_synced:
+            if not self.index.has(uid):
+                saved = self._read_index(uid)
+                if saved is not None:
+                    self.index.load(uid, saved)
+            # Rattrape les entrées ajoutées depuis la dernière sauvegarde de l'index
+            if self.index.sync(uid, journal):
+                self._index_dirty.add(uid)
+            self._index_synced.add(uid)
+        self._index_recent[uid] = None
+        self._index_recent.move_to_end(uid)
+        while len(self._index_recent) > self.index_max_users:
+            evicted = next(iter(self._index_recent))
+            if evicted in self._index_dirty:
+                self._write_indexes({evicted: self._encrypt(self.index.dump(evicted))})
+            self._forget_index(evicted)
+
+    def _save_index(self):
+        """Chiffre et écrit les seuls index modifiés depuis la dernière sauvegarde."""
+        with self._lock:
+            tokens = {uid: self._encrypt(self.index.dump(uid)) for uid in self._index_dirty}
+            self._index_dirty.clear()
+            self._index_pending = 0
+            self._write_indexes(tokens)
+
+    def search_journal(self, uid, args):
+        """
+        Recherche dans le journal de `uid` (voir search_index.parse_query pour la syntaxe).
+        Retourne les entrées correspondantes, dans l'ordre du journal.
+        Lève ValueError si une date de filtre est invalide (EmptyQueryError sans mot ni date).
+        """
+        terms, date_min, date_max = parse_query(args)
+        journal = self.get_user(uid)['journal']
+        with self._lock:
+            self._ready_index(uid, journal)
+            ids = self.index.search(uid, terms, date_min, date_max)
+        return [journal[i] for i in ids]
+
+    def journal_page(self, uid, offset, limit):
+        """
+        Entrées du journal de `uid`, de la plus récente à la plus ancienne, en sautant
+        les `offset` plus récentes. Retourne (entrées, nombre total d'entrées).
+        """
+        journal = self.get_user(uid)['journal']
+        hi = len(journal) - offset
+        return (journal[max(0, hi - limit):hi][::-1] if hi > 0 else []), len(journal)
+
+    # ---------------------- Agenda / examens ----------------------
+    def upcoming(self, uid, start, limit=20):
+        """
+        Agenda et examens de `uid` à partir de la date ISO `start` (incluse), triés par date.
+        Retourne {"agenda" | "exams": (éléments (date, description), total à venir, sans date)}.
+        """
+        with self._lock:
+            if not self.agenda_index.has(uid):
+                self.agenda_index.build(uid, self.get_user(uid))
+            result = {}
+            for kind in AgendaIndex.KINDS:
+                items, total = self.agenda_index.upcoming(uid, kind, start, limit)
+                result[kind] = (items, total, self.agenda_index.undated(uid, kind))
+        return result
+
+    def stats(self):
+        """Compteurs du stockage (complétés par chaque variante), affichés à l'arrêt du bot."""
+        return {"resident_indexes": len(self._index_recent)}
+
+    def flush(self):
+        """
+        Force l'écriture sur disque des modifications en attente.
+        Ici chaque mutation est déjà sauvegardée : rien à faire.
+        """
+
+    def close(self):
+        """
+        Libère les ressources (fichiers, threads) à l'arrêt du bot.
+        """
+        self.flush()
+        if self._index_dirty:
+            self._save_index()
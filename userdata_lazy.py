@@ -0,0 +1,180 @@
+import os
+import time
+from collections import OrderedDict
+
+from userdata import UserDataManager, _atomic_write
+
+
+class LazyUserDataManager(UserDataManager):
+    """
+    Variante de UserDataManager à déchiffrement paresseux par utilisateur.
+
+    ✔ Chaque utilisateur a son propre fichier chiffré dans `userdata.d/`
+      (nom = HMAC de l'uid, l'identifiant Telegram n'apparaît pas sur disque ;
+      il est gardé, chiffré, dans le fichier lui-même pour user_ids)
+    ✔ Le démarrage ne déchiffre rien : un fichier n'est lu qu'à la première
+      commande de l'utilisateur concerné
+    ✔ Les données déchiffrées sont gardées dans un LRU borné en mémoire
+      (`max_bytes`, taille estimée par la longueur du JSON)
+    ✔ Index de recherche chiffré par utilisateur, dans le même répertoire
+    ✔ Migration automatique et unique depuis l'ancien fichier `userdata.enc`
+    """
+
+    def __init__(self, filepath='userdata.enc', key_file='secret.key',
+                 blob_dir='userdata.d', max_bytes=8 * 1024 * 1024):
+        """
+        - blob_dir : répertoire des fichiers chiffrés par utilisateur
+        - max_bytes : plafond mémoire (estimé) des données déchiffrées gardées en cache
+        """
+        started = time.perf_counter()
+        self.blob_dir = blob_dir
+        self.max_bytes = max_bytes
+        # uid -> (données utilisateur, taille estimée en octets), du moins au plus récent
+        self._cache = OrderedDict()
+        self._resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        super().__init__(filepath, key_file)
+        self.startup_seconds = time.perf_counter() - started
+        print(f"Stockage paresseux prêt en {self.startup_seconds * 1000:.1f} ms")
+
+    # ---------------------- Chargement ----------------------
+    def _load(self):
+        """
+        Prépare le répertoire et migre l'ancien fichier si présent.
+        Aucune donnée utilisateur n'est déchiffrée ici.
+        """
+        os.makedirs(self.blob_dir, exist_ok=True)
+        if os.path.exists(self.filepath):
+            self._migrate_legacy()
+
+    def _migrate_legacy(self):
+        with open(self.filepath, 'rb') as f:
+            legacy = self._decrypt(f.read())
+        for uid, user in legacy.items():
+            _atomic_write(self._blob_path(uid), self._encrypt_user(uid, user))
+        os.replace(self.filepath, f"{self.filepath}.migrated")
+        print(f"Migration : {len(legacy)} utilisateurs découpés dans {self.blob_dir}")
+
+    def _blob_path(self, uid):
+        return os.path.join(self.blob_dir, f"{self._hashed_name(uid)}.enc")
+
+    def _encrypt_user(self, uid, user):
+        """Contenu chiffré du fichier de `uid` : ses données et son identifiant (clé "uid")."""
+        return self._encrypt({**user, "uid": uid})
+
+    def _index_path(self, uid):
+        """Index de recherche de l'utilisateur à côté de son fichier de données."""
+        return os.path.join(self.blob_dir, f"{self._hashed_name(uid)}.idx.enc")
+
+    # ---------------------- Cache LRU ----------------------
+    def _cache_put(self, uid, user, size):
+        old = self._cache.pop(uid, None)
+        if old is not None:
+            self._resident_bytes -= old[1]
+        self._cache[uid] = (user, size)
+        self._resident_bytes += size
+        # Évince les moins récents, sans jamais retirer celui qu'on vient d'ajouter
+        while self._resident_bytes > self.max_bytes and len(self._cache) > 1:
+            _, (_, evicted_size) = self._cache.popitem(last=False)
+            self._resident_bytes -= evicted_size
+            self.evictions += 1
+
+    def _cache_drop(self, uid):
+        old = self._cache.pop(uid, None)
+        if old is not None:
+            self._resident_bytes -= old[1]
+
+    def get_user(self, uid):
+        """
+        Retourne les données de `uid`, en déchiffrant son fichier au premier accès.
+        """
+        with self._lock:
+            cached = self._cache.get(uid)
+            if cached is not None:
+                self._cache.move_to_end(uid)
+                self.hits += 1
+                return cached[0]
+
+            self.misses += 1
+            path = self._blob_path(uid)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    plain = self._unseal(f.read())
+                user = self._deserialize(plain)
+                user.pop("uid", None)
+                size = len(plain)
+            else:
+                user = {"journal": [], "agenda": [], "exams": []}
+                size = 0
+            self._cache_put(uid, user, size)
+            return user
+
+    # ---------------------- Écriture ----------------------
+    def _save(self):
+        """Chaque mutation réécrit le seul fichier de l'utilisateur : voir _record()."""
+
+    def _record(self, rec):
+        """
+        Applique la mutation puis réécrit uniquement le fichier de l'utilisateur.
+        """
+        uid = rec["uid"]
+        with self._lock:
+            if rec["op"] == "clear":
+                self._cache_drop(uid)
+                path = self._blob_path(uid)
+                if os.path.exists(path):
+                    os.remove(path)
+                return
+            self._apply(rec)
+            user = self._cache[uid][0]
+            token = self._encrypt_user(uid, user)
+            _atomic_write(self._blob_path(uid), token)
+            # Taille estimée : longueur du JSON (≈ 3/4 du jeton base64)
+            self._cache_put(uid, user, len(token) * 3 // 4)
+
+    def _record_many(self, recs):
+        """Un fichier par utilisateur : chaque mutation le réécrit, comme avec _record()."""
+        with self._lock:
+            for rec in recs:
+                self._record(rec)
+
+    def user_ids(self):
+        """
+        Les fichiers sont nommés par HMAC de l'uid : l'identifiant est relu dans
+        chaque fichier (déchiffré), sauf pour les utilisateurs déjà en cache.
+        Utilisé au rééquilibrage des workers, hors du service des commandes.
+        """
+        with self._lock:
+            cached = {f"{self._hashed_name(uid)}.enc": uid for uid in self._cache}
+            uids = []
+            for name in sorted(os.listdir(self.blob_dir)):
+                if not name.endswith(".enc") or name.endswith(".idx.enc"):
+                    continue
+                if name in cached:
+                    uids.append(cached[name])
+                    continue
+                with open(os.path.join(self.blob_dir, name), 'rb') as f:
+                    uid = self._decrypt(f.read()).get("uid")
+                if uid is None:
+                    raise ValueError(f"{name} : fichier sans identifiant utilisateur")
+                uids.append(uid)
+            return uids
+
+    def _has_user(self, uid):
+        """Vérifie le cache ou la présence du fichier, sans rien déchiffrer."""
+        return uid in self._cache or os.path.exists(self._blob_path(uid))
+
+    def stats(self):
+        """Temps de démarrage et occupation mémoire du cache des utilisateurs actifs."""
+        return {
+            **super().stats(),
+            "startup_seconds": self.startup_seconds,
+            "resident_users": len(self._cache),
+            "resident_bytes": self._resident_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,206 @@
+import os
+import threading
+
+from userdata import UserDataManager, _atomic_write
+
+
+class LogUserDataManager(UserDataManager):
+    """
+    Variante de UserDataManager à journal append-only.
+
+    ✔ Chaque mutation est chiffrée individuellement et ajoutée en fin de
+      `userdata.enc.log` (une ligne = un jeton Fernet) : une écriture coûte O(enregistrement)
+    ✔ Au démarrage : lecture de l'instantané `userdata.enc` puis rejeu du journal
+    ✔ Un compactage en arrière-plan replie le journal dans un nouvel instantané
+      (écrit de façon atomique) dès que le journal dépasse `compact_every` lignes
+    ✔ Un crash pendant une écriture ne fait perdre que la dernière ligne (tronquée
+      au redémarrage), au lieu de rendre tout le fichier illisible
+
+    Chaque enregistrement porte un numéro de séquence ; l'instantané mémorise
+    le dernier numéro inclus, ce qui rend le rejeu idempotent si un compactage
+    a été interrompu.
+    """
+
+    def __init__(self, filepath='userdata.enc', key_file='secret.key',
+                 compact_every=1000, fsync=True):
+        """
+        - compact_every : nombre de lignes du journal déclenchant un compactage
+        - fsync : force l'écriture physique de chaque enregistrement (durabilité)
+        """
+        self.log_path = f"{filepath}.log"
+        # Journal en cours de repli dans l'instantané (renommé pendant le compactage)
+        self.compacting_path = f"{filepath}.log.compacting"
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.seq = 0
+        self._log_records = 0
+        self._compactor = None
+        # Compactage demandé pendant qu'un autre tournait (ex : /delete) : à enchaîner
+        self._compact_again = False
+        super().__init__(filepath, key_file)
+        self._log = open(self.log_path, 'ab')
+
+    # ---------------------- Chargement ----------------------
+    def _load(self):
+        """
+        Charge l'instantané puis rejoue les journaux (interrompu puis courant).
+        Contrairement au mode fichier unique, un instantané illisible lève une
+        erreur au lieu d'effacer silencieusement les données.
+        """
+        self.data = {}
+        if os.path.exists(self.filepath):
+            with open(self.filepath, 'rb') as f:
+                snapshot = self._decrypt(f.read())
+            if isinstance(snapshot, dict) and set(snapshot) == {"seq", "users"}:
+                self.seq = snapshot["seq"]
+                self.data = snapshot["users"]
+            else:
+                # Ancien format (UserDataManager) : dict uid -> données
+                self.data = snapshot
+
+        interrupted = os.path.exists(self.compacting_path)
+        if interrupted:
+            self._replay(self.compacting_path)
+        self._log_records = self._replay(self.log_path)
+
+        if interrupted:
+            # Un compactage a été interrompu : on le termine avant de démarrer
+            _atomic_write(self.filepath, self._snapshot_token())
+            os.remove(self.compacting_path)
+            open(self.log_path, 'wb').close()
+            self._log_records = 0
+
+    def _replay(self, path):
+        """
+        Rejoue les enregistrements de `path` et retourne le nombre de lignes lues.
+        Une dernière ligne incomplète (crash pendant l'écriture) est tronquée.
+        """
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'rb') as f:
+            raw = f.read()
+
+        count = 0
+        offset = 0     # début de la ligne courante
+        valid_len = 0  # longueur du préfixe sain du fichier
+        for i, line in enumerate(raw.split(b"\n")):
+            end = offset + len(line) + 1
+            if end > len(raw):
+                # Pas de saut de ligne final : écriture interrompue
+                if line:
+                    print(f"Journal {path} : dernier enregistrement incomplet ignoré")
+                break
+            offset = valid_len = end
+            if not line:
+                continue
+            try:
+                rec = self._decrypt(line)
+            except Exception:
+                print(f"Journal {path} : enregistrement {i} illisible ignoré")
+                continue
+            count += 1
+            if rec["seq"] <= self.seq:
+                continue  # Déjà inclus dans l'instantané
+            self._apply(rec)
+            self.seq = rec["seq"]
+
+        if valid_len < len(raw):
+            with open(path, 'r+b') as f:
+                f.truncate(valid_len)
+        return count
+
+    # ---------------------- Écriture ----------------------
+    def _save(self):
+        """
+        Pas de réécriture complète en mode journal : voir compact().
+        """
+
+    def _record(self, rec):
+        """
+        Ajoute l'enregistrement chiffré au journal, puis l'applique en mémoire.
+        """
+        with self._lock:
+            rec = dict(rec, seq=self.seq + 1)
+            self._log.write(self._encrypt(rec) + b"\n")
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+            self.seq = rec["seq"]
+            self._apply(rec)
+            self._log_records += 1
+            needs_compaction = self._log_records >= self.compact_every
+
+        if needs_compaction or rec["op"] == "clear":
+            # Après /delete, on compacte pour purger les anciennes lignes du disque
+            self.compact()
+
+    def _record_many(self, recs):
+        """Chaque enregistrement est ajouté au journal, comme avec _record()."""
+        with self._lock:
+            for rec in recs:
+                self._record(rec)
+
+    # ---------------------- Compactage ----------------------
+    def _snapshot_token(self):
+        return self._encrypt({"seq": self.seq, "users": self.data})
+
+    def compact(self, wait=False):
+        """
+        Replie le journal dans un nouvel instantané.
+        La vue cohérente des données est figée sous verrou ; le chiffrement et
+        l'écriture se font dans un thread d'arrière-plan.
+
+        ✔ Un appel pendant un compactage en cours (figé avant lui, ex : /delete) en
+          enchaîne un second : les lignes effacées ne restent pas dans l'instantané
+        """
+        with self._lock:
+            thread = self._compactor
+            if thread is None:
+                payload = self._begin_compaction()
+                thread = threading.Thread(
+                    target=self._run_compactions, args=(payload,),
+                    name="userdata-compaction", daemon=True,
+                )
+                self._compactor = thread
+                thread.start()
+            else:
+                self._compact_again = True
+        if wait:
+            thread.join()
+
+    def _begin_compaction(self):
+        """Fige la vue des données et met de côté le journal courant (sous verrou)."""
+        payload = self._serialize({"seq": self.seq, "users": self.data})
+        self._log.close()
+        os.replace(self.log_path, self.compacting_path)
+        self._log = open(self.log_path, 'ab')
+        self._log_records = 0
+        return payload
+
+    def _run_compactions(self, payload):
+        try:
+            while payload is not None:
+                _atomic_write(self.filepath, self._seal(payload))
+                os.remove(self.compacting_path)
+                with self._lock:
+                    payload = None
+                    if self._compact_again:
+                        self._compact_again = False
+                        payload = self._begin_compaction()
+                    else:
+                        self._compactor = None
+        except BaseException:
+            with self._lock:
+                self._compactor = None
+            raise
+
+    def flush(self):
+        """Chaque enregistrement est déjà écrit à l'ajout ; attend les compactages en cours."""
+        thread = self._compactor
+        if thread is not None:
+            thread.join()
+
+    def close(self):
+        super().close()
+        with self._lock:
+            self._log.close()
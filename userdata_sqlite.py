@@ -0,0 +1,299 @@
+import os
+import sqlite3
+
+from search_index import parse_query
+from userdata import UserDataManager, parse_dated_text
+
+
+class _RowJournal:
+    """
+    Journal d'un utilisateur vu comme une liste (positions = ordre d'ajout), sans
+    rien déchiffrer d'avance : seules les entrées lues (dernière entrée, nouvelles
+    entrées à indexer, résultats) sont sélectionnées par id puis déchiffrées.
+    """
+
+    def __init__(self, manager, ids):
+        self.manager = manager
+        self.ids = ids  # position -> id de la ligne
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return self.fetch(range(len(self.ids))[item])
+        return self.fetch([item])[0]
+
+    def fetch(self, positions, chunk=500):
+        """Entrées aux `positions` données, dans cet ordre (requêtes par lots de `chunk` ids)."""
+        ids = [self.ids[i] for i in positions]
+        payloads = {}
+        for i in range(0, len(ids), chunk):
+            batch = ids[i:i + chunk]
+            rows = self.manager.conn.execute(
+                f"SELECT id, payload FROM journal WHERE id IN ({', '.join('?' * len(batch))})", batch
+            ).fetchall()
+            payloads.update(rows)
+        return [self.manager._decrypt(payloads[row_id]) for row_id in ids]
+
+
+class SQLiteUserDataManager(UserDataManager):
+    """
+    Variante de UserDataManager stockée dans SQLite.
+
+    ✔ Une ligne par entrée (journal, agenda, examen), dont le contenu est
+      chiffré individuellement avec Fernet
+    ✔ Seuls l'identifiant utilisateur et la date restent en clair, pour
+      l'index (uid, date) : /journal ou /delete ne touchent que les lignes
+      d'un seul utilisateur, rien n'est gardé en mémoire
+    ✔ L'index de recherche de chaque utilisateur va dans une table `search_index` ;
+      une recherche ne déchiffre que les entrées trouvées
+    ✔ Les préférences (set_setting) vont dans une table `settings` (uid, key)
+    ✔ Migration automatique et unique depuis l'ancien fichier `userdata.enc`
+      (renommé ensuite en `userdata.enc.migrated`)
+    """
+
+    # op d'un enregistrement de mutation -> (table, clé dans get_user())
+    TABLES = {
+        "journal": ("journal", "journal"),
+        "agenda": ("agenda", "agenda"),
+        "exam": ("exams", "exams"),
+    }
+
+    def __init__(self, db_path='userdata.db', key_file='secret.key', legacy_path='userdata.enc'):
+        """
+        - db_path : base SQLite
+        - legacy_path : ancien fichier chiffré à migrer s'il existe
+        """
+        self.db_path = db_path
+        super().__init__(legacy_path, key_file)
+
+    def _load(self):
+        """
+        Ouvre la base, crée le schéma et migre l'ancien fichier si présent.
+        Aucune donnée utilisateur n'est chargée en mémoire.
+        """
+        self.data = {}
+        # Connexion partagée entre threads, protégée par self._lock
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            for table, _ in self.TABLES.values():
+                self.conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                    "uid TEXT NOT NULL, "
+                    "date TEXT NOT NULL, "
+                    "payload BLOB NOT NULL)"
+                )
+                self.conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{table}_uid_date ON {table} (uid, date)"
+                )
+            # Index de recherche (/recherche) : un sous-index chiffré par utilisateur
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_index ("
+                "uid TEXT PRIMARY KEY, "
+                "payload BLOB NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS settings ("
+                "uid TEXT NOT NULL, "
+                "key TEXT NOT NULL, "
+                "payload BLOB NOT NULL, "
+                "PRIMARY KEY (uid, key))"
+            )
+            # État du stockage (ex : migration de l'ancien fichier déjà faite)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+        if os.path.exists(self.filepath):
+            self._migrate_legacy()
+
+    def _migrate_legacy(self):
+        """
+        Importe le fichier chiffré unique dans la base, en une transaction.
+        Un fichier illisible lève une erreur (pas de perte silencieuse).
+        La transaction enregistre aussi la migration (table meta) : un arrêt avant
+        le renommage du fichier ne le fait pas importer une seconde fois.
+        """
+        done = self.conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_migrated'").fetchone()
+        if done:
+            os.replace(self.filepath, f"{self.filepath}.migrated")
+            return
+        with open(self.filepath, 'rb') as f:
+            legacy = self._decrypt(f.read())
+        with self._lock, self.conn:
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_migrated', '1')")
+            for uid, user in legacy.items():
+                for entry in user.get("journal", []):
+                    self._insert({"op": "journal", "uid": uid, "entry": entry})
+                for entry in user.get("agenda", []):
+                    self._insert({"op": "agenda", "uid": uid, "entry": entry})
+                for entry in user.get("exams", []):
+                    self._insert({"op": "exam", "uid": uid, "entry": entry})
+                for key, value in user.get("settings", {}).items():
+                    self._insert({"op": "setting", "uid": uid, "key": key, "value": value})
+        os.replace(self.filepath, f"{self.filepath}.migrated")
+        print(f"Migration SQLite : {len(legacy)} utilisateurs importés depuis {self.filepath}")
+
+    def _row_date(self, rec):
+        """Date indexée : celle du ressenti, ou celle lue dans "DD-MM-YYYY : ..." sinon."""
+        if rec["op"] == "journal":
+            return rec["entry"].get("date", "")
+        date, _ = parse_dated_text(rec["entry"])
+        return date or ""
+
+    def _insert(self, rec):
+        if rec["op"] == "setting":
+            self.conn.execute(
+                "INSERT OR REPLACE INTO settings (uid, key, payload) VALUES (?, ?, ?)",
+                (rec["uid"], rec["key"], self._encrypt(rec["value"])),
+            )
+            return
+        table, _ = self.TABLES[rec["op"]]
+        self.conn.execute(
+            f"INSERT INTO {table} (uid, date, payload) VALUES (?, ?, ?)",
+            (rec["uid"], self._row_date(rec), self._encrypt(rec["entry"])),
+        )
+
+    def _save(self):
+        """Chaque mutation est écrite ligne par ligne : voir _record()."""
+
+    def _write(self, rec):
+        if rec["op"] == "clear":
+            for table in [t for t, _ in self.TABLES.values()] + ["settings"]:
+                self.conn.execute(f"DELETE FROM {table} WHERE uid = ?", (rec["uid"],))
+        else:
+            self._insert(rec)
+
+    def _record(self, rec):
+        """
+        Insère (ou supprime, pour "clear") les lignes concernées, dans une transaction.
+        """
+        with self._lock, self.conn:
+            self._write(rec)
+
+    def _record_many(self, recs):
+        """Toutes les lignes du lot dans une seule transaction."""
+        with self._lock, self.conn:
+            for rec in recs:
+                self._write(rec)
+
+    def get_user(self, uid):
+        """
+        Reconstruit les données d'un utilisateur depuis ses seules lignes.
+        Même structure que UserDataManager.get_user (liste dans l'ordre d'ajout).
+        """
+        user = {}
+        with self._lock:
+            for table, key in self.TABLES.values():
+                rows = self.conn.execute(
+                    f"SELECT payload FROM {table} WHERE uid = ? ORDER BY id", (uid,)
+                ).fetchall()
+                user[key] = [self._decrypt(payload) for (payload,) in rows]
+            rows = self.conn.execute(
+                "SELECT key, payload FROM settings WHERE uid = ?", (uid,)
+            ).fetchall()
+        if rows:
+            user["settings"] = {key: self._decrypt(payload) for key, payload in rows}
+        return user
+
+    def get_setting(self, uid, key, default=None):
+        """Lit la seule ligne (uid, key) de la table settings, sans reconstruire l'utilisateur."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT payload FROM settings WHERE uid = ? AND key = ?", (uid, key)
+            ).fetchone()
+        return self._decrypt(row[0]) if row else default
+
+    def journal_page(self, uid, offset, limit):
+        """Même résultat que UserDataManager.journal_page : seule la page est déchiffrée."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT payload FROM journal WHERE uid = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+                (uid, limit, offset),
+            ).fetchall()
+            (total,) = self.conn.execute(
+                "SELECT COUNT(*) FROM journal WHERE uid = ?", (uid,)
+            ).fetchone()
+        return [self._decrypt(payload) for (payload,) in rows], total
+
+    def search_journal(self, uid, args):
+        """
+        Même résultat que UserDataManager.search_journal, sans reconstruire l'utilisateur :
+        seuls les ids des lignes du journal sont lus, puis les entrées trouvées déchiffrées.
+        """
+        terms, date_min, date_max = parse_query(args)
+        with self._lock:
+            ids = [row_id for (row_id,) in self.conn.execute(
+                "SELECT id FROM journal WHERE uid = ? ORDER BY id", (uid,)
+            )]
+            journal = _RowJournal(self, ids)
+            self._ready_index(uid, journal)
+            return journal.fetch(self.index.search(uid, terms, date_min, date_max))
+
+    def _read_index(self, uid):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT payload FROM search_index WHERE uid = ?", (uid,)
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            return self._decrypt(row[0])
+        except Exception:
+            print("Index de recherche illisible : il sera reconstruit")
+            return None
+
+    def _write_indexes(self, tokens):
+        """Tous les index modifiés dans une seule transaction."""
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO search_index (uid, payload) VALUES (?, ?)", tokens.items()
+            )
+
+    def _delete_indexes(self, uids):
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM search_index WHERE uid = ?", [(uid,) for uid in uids])
+
+    def upcoming(self, uid, start, limit=20):
+        """
+        Même résultat que UserDataManager.upcoming, lu directement par l'index
+        (uid, date) : seules les lignes à venir sont lues et déchiffrées.
+        """
+        result = {}
+        with self._lock:
+            for op in ("agenda", "exam"):
+                table, key = self.TABLES[op]
+                rows = self.conn.execute(
+                    f"SELECT payload FROM {table} WHERE uid = ? AND date >= ? "
+                    "ORDER BY date, id LIMIT ?", (uid, start, limit),
+                ).fetchall()
+                (total,) = self.conn.execute(
+                    f"SELECT COUNT(*) FROM {table} WHERE uid = ? AND date >= ?", (uid, start)
+                ).fetchone()
+                undated = self.conn.execute(
+                    f"SELECT payload FROM {table} WHERE uid = ? AND date = '' ORDER BY id", (uid,)
+                ).fetchall()
+                result[key] = (
+                    [parse_dated_text(self._decrypt(payload)) for (payload,) in rows],
+                    total,
+                    [parse_dated_text(self._decrypt(payload))[1] for (payload,) in undated],
+                )
+        return result
+
+    def _has_user(self, uid):
+        """Un DELETE sans ligne ne coûte presque rien : inutile de vérifier avant."""
+        return True
+
+    def user_ids(self):
+        """Identifiants présents dans au moins une table."""
+        tables = [t for t, _ in self.TABLES.values()] + ["settings"]
+        with self._lock:
+            rows = self.conn.execute(" UNION ".join(f"SELECT uid FROM {t}" for t in tables)).fetchall()
+        return [uid for (uid,) in rows]
+
+    def close(self):
+        super().close()
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,93 @@
+import threading
+
+from userdata import UserDataManager, _atomic_write
+
+
+class WriteBehindUserDataManager(UserDataManager):
+    """
+    Variante de UserDataManager à écriture différée groupée (write-behind).
+
+    ✔ Les mutations sont appliquées en mémoire immédiatement, sans toucher au disque
+    ✔ Un thread dédié écrit un seul fichier chiffré pour tout un lot de
+      mutations, toutes les `flush_interval` secondes ou dès `max_pending` mutations
+    ✔ Chaque écriture est atomique et durable : fichier temporaire → fsync → rename
+    ✔ `flush()` force une écriture immédiate (utilisé par /delete)
+
+    Format de fichier identique à UserDataManager : on peut passer d'un mode à l'autre.
+    """
+
+    def __init__(self, filepath='userdata.enc', key_file='secret.key',
+                 flush_interval=2.0, max_pending=200):
+        """
+        - flush_interval : délai maximal (s) avant écriture d'une mutation
+        - max_pending : nombre de mutations déclenchant une écriture anticipée
+        """
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = 0
+        # Sérialise les écritures pour qu'un lot ancien n'écrase jamais un lot récent
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self.records = 0
+        self.flushes = 0
+        super().__init__(filepath, key_file)
+        self._flusher = threading.Thread(target=self._run, name="userdata-flusher", daemon=True)
+        self._flusher.start()
+
+    def _record(self, rec):
+        """
+        Applique la mutation en mémoire ; l'écriture est laissée au thread d'arrière-plan.
+        """
+        with self._lock:
+            self._apply(rec)
+            self._pending += 1
+            self.records += 1
+            if self._pending >= self.max_pending:
+                self._wakeup.set()
+
+    def _record_many(self, recs):
+        """Applique le lot en mémoire ; il part avec la prochaine écriture groupée."""
+        with self._lock:
+            for rec in recs:
+                self._record(rec)
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # Les mutations restent en attente : le prochain lot réessaiera
+                print("Erreur écriture userdata :", e)
+
+    def flush(self):
+        """
+        Écrit immédiatement toutes les mutations en attente (appel bloquant).
+        """
+        with self._write_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                pending = self._pending
+                payload = self._serialize(self.data)
+                self._pending = 0
+            try:
+                _atomic_write(self.filepath, self._seal(payload))
+            except Exception:
+                with self._lock:
+                    self._pending += pending
+                raise
+            self.flushes += 1
+
+    def close(self):
+        """Arrête le thread d'écriture après un dernier flush."""
+        self._stopping = True
+        self._wakeup.set()
+        self._flusher.join()
+        super().close()
+
+    def stats(self):
+        """Nombre de mutations reçues et d'écritures disque effectuées."""
+        return {**super().stats(), "records": self.records, "flushes": self.flushes, "pending": self._pending}